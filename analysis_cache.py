@@ -0,0 +1,45 @@
+"""
+分析結果快取
+
+以內容定址：快取鍵為 hash(正規化內容, 模型名稱, 提示詞版本)，
+內容相同就直接回傳先前的分析結果，不再呼叫 Claude API。
+提示詞範本變更時版本隨之改變，舊結果自然失效，最後由 TTL 或 LRU 淘汰。
+
+環境變數：
+- ANALYSIS_CACHE_TTL: 分析結果有效秒數（預設 7 天）
+- ANALYSIS_CACHE_MAX_MB: 容量上限（預設 100 MB）
+"""
+
+import hashlib
+import os
+import re
+import unicodedata
+
+from cache_store import get_cache
+
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_MB", "100")) * 1024 * 1024
+
+
+def normalize_content(content):
+    """正規化新聞內容：統一 Unicode 組合形式與換行，壓縮多餘空白"""
+    content = unicodedata.normalize("NFC", content).replace("\r\n", "\n")
+    lines = (re.sub(r"[ \t\u3000\u00a0]+", " ", line).strip()
+             for line in content.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def analysis_cache_key(content, model_name, prompt_version):
+    """計算分析結果的快取鍵"""
+    digest = hashlib.sha256()
+    for part in (normalize_content(content), model_name, prompt_version):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_analysis_cache():
+    """取得行程共用的分析結果快取"""
+    return get_cache(
+        "analysis", default_ttl=ANALYSIS_CACHE_TTL, max_bytes=ANALYSIS_CACHE_MAX_BYTES
+    )
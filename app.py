@@ -1,116 +1,23 @@
 import streamlit as st
-import requests
 from datetime import datetime
-import re
-import json
-from urllib.parse import urlparse, quote
 import asyncio
-from playwright.async_api import async_playwright
-import anthropic
-
-def get_openstreetmap_entity_link(location_name):
-    """
-    使用 OpenStreetMap Nominatim API 查詢地點，並返回條目連結
-    優先查找 relation 類型的條目（適合國家、城市等行政區劃）
-    
-    符合 Nominatim 使用政策：
-    - 設置合適的 User-Agent 識別應用程式
-    - 限制請求頻率（由用戶觸發，非批量處理）
-    - 適當的錯誤處理和備選方案
-    - 尊重 API 限制和超時設定
-    """
-    try:
-        # URL encode 地點名稱
-        encoded_name = quote(location_name)
-        
-        # 使用 Nominatim API 進行搜尋，嚴格遵循使用政策
-        search_url = f"https://nominatim.openstreetmap.org/search?q={encoded_name}&format=json&limit=3&addressdetails=1&accept-language=zh"
-        
-        # 設置符合 Nominatim 使用政策的 headers
-        # 政策要求：「Provide a valid HTTP Referer or User-Agent identifying the application」
-        headers = {
-            'User-Agent': 'NewsAnalyzer/2.1 (Educational news analysis tool; Contact: github.com/planetoid/news-analyzer)',
-            'Accept': 'application/json',
-            'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8',
-            'Referer': 'https://github.com/planetoid/news-analyzer'
-        }
-        
-        # 發送搜尋請求，遵循 API 使用限制
-        # 政策要求：「No heavy uses (an absolute maximum of 1 request per second)」
-        response = requests.get(search_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            results = response.json()
-            
-            if not results:
-                # 沒有搜尋結果，返回搜尋連結作為備選
-                return f"https://www.openstreetmap.org/search?query={encoded_name}"
-            
-            # 優先查找 relation 類型的結果（通常是行政區劃）
-            for result in results:
-                osm_type = result.get('osm_type')
-                osm_id = result.get('osm_id')
-                place_class = result.get('class', '')
-                place_type = result.get('type', '')
-                
-                # 優先選擇 relation 類型的行政邊界或地點
-                if (osm_type == 'relation' and 
-                    place_class in ['boundary', 'place', 'administrative'] and 
-                    osm_id):
-                    return f"https://www.openstreetmap.org/relation/{osm_id}"
-            
-            # 如果沒有找到 relation，查找其他高質量的結果
-            for result in results:
-                osm_type = result.get('osm_type')
-                osm_id = result.get('osm_id')
-                place_class = result.get('class', '')
-                
-                # 選擇地點類別的結果
-                if osm_type and osm_id and place_class in ['place', 'boundary']:
-                    if osm_type == 'relation':
-                        return f"https://www.openstreetmap.org/relation/{osm_id}"
-                    elif osm_type == 'way':
-                        return f"https://www.openstreetmap.org/way/{osm_id}"
-                    elif osm_type == 'node':
-                        return f"https://www.openstreetmap.org/node/{osm_id}"
-            
-            # 最後嘗試任何有效的結果
-            first_result = results[0]
-            osm_type = first_result.get('osm_type')
-            osm_id = first_result.get('osm_id')
-            
-            if osm_type and osm_id:
-                if osm_type == 'relation':
-                    return f"https://www.openstreetmap.org/relation/{osm_id}"
-                elif osm_type == 'way':
-                    return f"https://www.openstreetmap.org/way/{osm_id}"
-                elif osm_type == 'node':
-                    return f"https://www.openstreetmap.org/node/{osm_id}"
-        
-        elif response.status_code == 403:
-            # API 存取被拒絕，可能是請求頻率過高或違反使用政策
-            # 政策說明：「may be classified as faulty and blocked」
-            print(f"Nominatim API 403 錯誤：可能違反使用政策或請求過於頻繁")
-            pass
-        elif response.status_code == 429:
-            # 請求頻率限制
-            print(f"Nominatim API 429 錯誤：請求頻率超過限制")
-            pass
-        
-        # 如果 API 查詢失敗，返回搜尋連結作為備選方案
-        return f"https://www.openstreetmap.org/search?query={encoded_name}"
-        
-    except requests.exceptions.Timeout:
-        # 請求超時，返回搜尋連結作為備選
-        print(f"Nominatim API 請求超時")
-        pass
-    except Exception as e:
-        # 記錄錯誤但不顯示給用戶（避免影響界面）
-        print(f"OpenStreetMap 查詢錯誤: {str(e)}")
-    
-    # 所有錯誤情況都返回搜尋連結作為備選方案
-    encoded_name = quote(location_name)
-    return f"https://www.openstreetmap.org/search?query={encoded_name}"
+import time
+from concurrent.futures import as_completed, TimeoutError as FutureTimeoutError
+from llm_json import parse_stats
+from preprocess import ARTICLE_TOKEN_BUDGET
+from metrics import get_metrics
+from geocoder import (
+    LOOKUP_TIMEOUT, get_nominatim_scheduler, resolve_location_async, search_link
+)
+from http_fetcher import fetch_tier_stats
+from llm_client import get_client_pool
+from news_analyzer import TRIAGE_MODEL, NewsAnalyzer, cascade_stats
+from near_duplicates import get_duplicate_index
+from rumor_rules import rule_stats
+from history_store import RULES_MODEL, get_history_store
+from trend_analytics import (
+    CATEGORIES, co_occurrence, daily_trends, domain_summary, entity_summary, load_trend_data,
+)
 
 # 頁面配置
 st.set_page_config(
@@ -168,136 +75,99 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class NewsAnalyzer:
-    def __init__(self, api_key, model_name="claude-sonnet-4-20250514"):
-        self.client = anthropic.Anthropic(api_key=api_key)
-        self.model_name = model_name
+
+# 抓取階段的顯示名稱
+FETCH_STAGE_LABELS = {
+    "cache": "查詢快取",
+    "http": "HTTP 抓取",
+    "acquire": "取得頁面",
+    "goto": "載入頁面",
+    "selector_wait": "等待文章",
+    "extract": "擷取內容",
+    "total": "總計",
+}
+
+
+FETCH_TIER_LABELS = {"cache": "快取", "http": "HTTP", "browser": "瀏覽器"}
+
+
+def display_diagnostics():
+    """顯示診斷面板：各階段耗時分位數、token 用量與估算費用、各層命中率"""
+    snapshot = get_metrics().snapshot()
+    st.markdown("### 🩺 診斷資訊")
     
-    async def fetch_article_content(self, url):
-        """使用Playwright抓取網頁內容"""
-        try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch()
-                page = await browser.new_page()
-                await page.goto(url, wait_until='networkidle')
-                
-                # 嘗試多種選擇器抓取文章內容
-                selectors = [
-                    'article', '.article-content', '.content', '.post-content',
-                    '.entry-content', '#article', '.article-body', 'main'
-                ]
-                
-                content = ""
-                for selector in selectors:
-                    try:
-                        element = await page.query_selector(selector)
-                        if element:
-                            content = await element.inner_text()
-                            if len(content) > 200:  # 確保內容足夠長
-                                break
-                    except:
-                        continue
-                
-                await browser.close()
-                return content if content else "無法抓取文章內容"
-                
-        except Exception as e:
-            return f"抓取失敗: {str(e)}"
-    
-    def analyze_news(self, content):
-        """使用Claude API分析新聞"""
-        prompt = f"""
-        請分析以下新聞內容，並以JSON格式回應：
-
-        新聞內容：
-        {content}
-
-        【重要分析指南】
-        1. 真實度評估關鍵指標：
-           - 官方來源、具體數據、權威人士發言 → 高分 (80-95)
-           - 網路傳言、未經證實消息 → 低分 (20-40)
-           - 「網傳」、「據說」、「傳言」關鍵詞 → 極低分 (10-30)
-           - 已被官方澄清/闢謠內容 → 極低分 (10-25)
-
-        2. 重要性評估標準：
-           - 娛樂、地方小活動 → 10-40分
-           - 一般社會新聞 → 40-70分  
-           - 重大政策、經濟影響 → 70-100分
-
-        3. 影響力評估標準：
-           - 個人趣事、小範圍活動 → 5-30分
-           - 特定群體關注事件 → 30-60分
-           - 廣泛社會影響、政策變革 → 60-100分
-
-        請提供以下分析：
-        {{
-            "summary": "100-150字的重點摘要",
-            "target_audience": "預期讀者群體",
-            "truthfulness": 真實度分數(0-100),
-            "importance": 重要性分數(0-100),
-            "impact": 影響力分數(0-100),
-            "drink_recommendation": {{
-                "name": "推薦飲料名稱",
-                "reason": "推薦理由",
-                "category": "golden_lemon/honey_green/plain_water/expired_milk"
-            }},
-            "entities": {{
-                "people": ["{{"name": "姓名", "title": "職位", "wiki_link": "維基百科連結"}}"],
-                "numbers": ["{{"value": "數字", "context": "背景說明", "data_link": "相關資料連結"}}"],
-                "locations": ["{{"name": "地點名稱"}}"],
-                "organizations": ["{{"name": "機構名稱", "official_link": "官方連結"}}"],
-                "dates": ["{{"date": "日期時間", "event": "相關事件"}}],
-                "datasets": ["{{"name": "資料集關鍵字", "description": "說明", "search_link": "https://data.gov.tw/datasets/search?p=1&size=10&s=資料集關鍵字"}}]
-            }}
-        }}
-
-        特別注意：
-        - 對於locations，只需要提供地點名稱，系統會自動查詢 OpenStreetMap 條目連結
-        - 例如：{{"name": "台北市"}} 或 {{"name": "中正紀念堂"}}
-        - 對於datasets，請根據新聞主題提取相關的政府資料集關鍵字，並設定搜尋連結
-        - 例如：{{"name": "交通事故", "description": "道路交通事故統計", "search_link": "https://data.gov.tw/datasets/search?p=1&size=10&s=交通事故"}}
-
-        飲料分類標準：
-        - golden_lemon (金桔檸檬): 真實度>70且重要性>70
-        - honey_green (蜂蜜綠茶): 真實度>70但重要性≤70
-        - plain_water (無糖白開水): 真實度≤70且重要性≤70
-        - expired_milk (過期奶茶): 真實度≤70但重要性>70
-
-        【評分範例參考】
-        - 央行政策/重大投資: 真實度85-95, 重要性85-95, 影響力80-90 → 金桔檸檬
-        - 動物園活動/地方慶典: 真實度75-85, 重要性25-40, 影響力15-30 → 蜂蜜綠茶  
-        - 網路傳言/個人經驗: 真實度10-30, 重要性5-15, 影響力5-10 → 無糖白開水
-        - 已闢謠假訊息: 真實度10-25, 重要性70-90, 影響力70-90 → 過期奶茶
-        """
-        
-        try:
-            response = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            # 提取JSON內容
-            response_text = response.content[0].text
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return {"error": "無法解析分析結果"}
-                
-        except Exception as e:
-            return {"error": f"分析失敗: {str(e)}"}
+    if snapshot["stages"]:
+        st.table([{
+            "階段": entry["stage"],
+            "標籤": ", ".join(f"{k}={v}" for k, v in entry["labels"].items()),
+            "次數": entry["count"],
+            "錯誤": entry["errors"],
+            "p50 (ms)": round(entry["p50"] * 1000),
+            "p95 (ms)": round(entry["p95"] * 1000),
+            "p99 (ms)": round(entry["p99"] * 1000),
+        } for entry in snapshot["stages"]])
+    else:
+        st.caption("尚無耗時紀錄")
+    
+    for model_name, tokens in snapshot["tokens"].items():
+        cost = snapshot["cost_usd"].get(model_name)
+        parts = [f"{kind} {value}" for kind, value in tokens.items()]
+        if cost is not None:
+            parts.append(f"估算 ${cost:.4f}")
+        st.caption(f"**{model_name}**：" + "｜".join(parts))
+    
+    tier_stats = fetch_tier_stats()
+    parsing = parse_stats()
+    geocoding = get_nominatim_scheduler().stats()
+    clients = get_client_pool().stats()
+    st.caption(f"HTTP 抓取命中率 {tier_stats['http_hit_rate']:.0%}｜"
+               f"JSON 解析失敗率 {parsing['failure_rate']:.0%}｜"
+               f"Nominatim 請求 {geocoding['requests']} 次（合併 {geocoding['merged']} 次）｜"
+               f"Claude 客戶端 {clients['clients']} 個（重用 {clients['reused']} 次）")
+    
+    duplicates = get_duplicate_index().stats()
+    if duplicates.get("hits", 0) + duplicates.get("misses", 0):
+        st.caption(f"近似重複索引 {duplicates['documents']} 篇｜"
+                   f"重用率 {duplicates['hit_rate']:.0%}（{duplicates.get('hits', 0)} 次）")
+    
+    rules = rule_stats()
+    if rules["checked"]:
+        st.caption(f"規則預判 {rules['checked']} 次｜直接判定 {rules['match_rate']:.0%}｜"
+                   f"Claude 確認 {rules['confirmed']} 次（一致 {rules['agreement_rate']:.0%}）")
+    
+    cascade = cascade_stats()
+    if cascade["triaged"]:
+        st.caption(f"分級分析 {cascade['triaged']} 次｜升級率 {cascade['escalation_rate']:.0%}｜"
+                   f"估計節省 {cascade['saved_seconds']:.1f} 秒")
+
+
+def display_fetch_timings(timings, tier=None):
+    """顯示網頁抓取來源與各階段耗時"""
+    if not timings:
+        return
+    
+    parts = []
+    if tier:
+        tier_stats = fetch_tier_stats()
+        parts.append(f"來源 {FETCH_TIER_LABELS.get(tier, tier)}"
+                     f"（HTTP 命中率 {tier_stats['http_hit_rate']:.0%}）")
+    parts += [f"{label} {timings[stage]:.0f} ms"
+              for stage, label in FETCH_STAGE_LABELS.items() if stage in timings]
+    if "blocked_requests" in timings:
+        parts.append(f"攔截請求 {timings['blocked_requests']} 個")
+    st.caption("⏱️ " + "｜".join(parts))
+
+DRINK_STYLES = {
+    "golden_lemon": ("🟡 金桔檸檬", "golden-lemon"),
+    "honey_green": ("🟢 蜂蜜綠茶", "honey-green"), 
+    "plain_water": ("⚪ 無糖白開水", "plain-water"),
+    "expired_milk": ("🔴 過期奶茶", "expired-milk")
+}
+
 
 def display_drink_result(drink_info):
     """顯示飲料推薦結果"""
-    drink_styles = {
-        "golden_lemon": ("🟡 金桔檸檬", "golden-lemon"),
-        "honey_green": ("🟢 蜂蜜綠茶", "honey-green"), 
-        "plain_water": ("⚪ 無糖白開水", "plain-water"),
-        "expired_milk": ("🔴 過期奶茶", "expired-milk")
-    }
-    
-    drink_name, css_class = drink_styles.get(drink_info["category"], ("❓ 未知飲料", "plain-water"))
+    drink_name, css_class = DRINK_STYLES.get(drink_info["category"], ("❓ 未知飲料", "plain-water"))
     
     st.markdown(f"""
     <div class="drink-card {css_class}">
@@ -335,8 +205,32 @@ def display_scores(analysis):
         </div>
         """, unsafe_allow_html=True)
 
+def location_tag(location_name, map_link):
+    """地點標籤的 HTML"""
+    return f'<a href="{map_link}" class="entity-tag" target="_blank">{location_name}</a>'
+
+
+def fill_location_links(pending, timeout=LOOKUP_TIMEOUT):
+    """依查詢完成順序，把地點佔位標籤換成 OpenStreetMap 條目連結"""
+    try:
+        for future in as_completed(pending, timeout=timeout):
+            for placeholder, location_name in pending[future]:
+                placeholder.markdown(location_tag(location_name, future.result()),
+                                     unsafe_allow_html=True)
+    except FutureTimeoutError:
+        # 逾時的地點保留搜尋連結，查詢仍會在背景完成並寫入快取
+        pass
+
+
 def display_entities(entities):
-    """顯示實體提取結果"""
+    """
+    顯示實體提取結果
+
+    地點先以搜尋連結佔位，所有區塊都顯示後，
+    再把背景查詢完成的 OpenStreetMap 條目連結逐一填入。
+    """
+    pending = {}
+
     if entities.get("people"):
         st.subheader("👥 相關人物")
         for person in entities["people"]:
@@ -364,12 +258,12 @@ def display_entities(entities):
         for loc in entities["locations"]:
             location_name = loc["name"]
             
-            # 動態查詢 OpenStreetMap 條目連結
-            map_link = get_openstreetmap_entity_link(location_name)
-            
-            # 顯示帶有條目連結的地點標籤
-            st.markdown(f'<a href="{map_link}" class="entity-tag" target="_blank">{location_name}</a>', 
-                       unsafe_allow_html=True)
+            # 先顯示搜尋連結，OpenStreetMap 條目連結交由背景排程查詢
+            placeholder = st.empty()
+            placeholder.markdown(location_tag(location_name, search_link(location_name)),
+                                 unsafe_allow_html=True)
+            future = resolve_location_async(location_name)
+            pending.setdefault(future, []).append((placeholder, location_name))
     
     if entities.get("organizations"):
         st.subheader("🏢 相關機構")
@@ -397,6 +291,9 @@ def display_entities(entities):
                 # 沒有連結時只顯示純文字標籤
                 st.markdown(f'<span class="entity-tag">{dataset["name"]}</span>', 
                            unsafe_allow_html=True)
+    
+    if pending:
+        fill_location_links(pending)
 
 
 def main():
@@ -413,6 +310,42 @@ def main():
                                   value="claude-sonnet-4-20250514",
                                   help="請輸入要使用的Claude模型名稱\n常用選項:\n• claude-sonnet-4-20250514\n• claude-3-5-sonnet-20241022\n• claude-3-opus-20240229")
         
+        cascade = st.checkbox("🪜 分級分析（先用快速模型）", value=False,
+                              help=f"先以 {TRIAGE_MODEL} 評分，真實度或重要性接近 70 分"
+                                   "或結果無效時才改用上方的模型")
+        
+        fan_out = st.checkbox("🔀 平行分析（評分與實體分開呼叫）", value=False,
+                              help="評分摘要與關鍵資訊擷取同時送出，"
+                                   "評分一完成就顯示飲料推薦，不必等待較長的實體清單")
+        
+        dedupe = st.checkbox("♻️ 重用近似重複文章的分析", value=True,
+                             help="通訊社稿件常被多家媒體小幅改寫轉載，"
+                                  "與已分析文章高度相似時直接重用其結果")
+        
+        pre_classify = st.checkbox("🧭 規則預判（明確的闢謠與傳言直接判定）", value=False,
+                                   help="以本機關鍵字規則辨識事實查核、「網傳……是假的」等文章，"
+                                        "信心足夠時立即顯示暫定分數，不呼叫 Claude")
+        confirm_heuristic = st.checkbox("🤖 規則判定後以 Claude 確認", value=True,
+                                        disabled=not pre_classify,
+                                        help="暫定結果顯示後在背景呼叫 Claude，分類不同時顯示提示")
+        
+        fast_fetch = st.checkbox("⚡ 快速抓取模式", value=False,
+                                 help="攔截圖片、影音、字型與廣告追蹤請求，"
+                                      "文章元素出現即擷取，不等待網路閒置")
+        bypass_cache = st.checkbox("🔄 重新分析（略過快取）", value=False,
+                                   help="相同內容預設直接使用先前的分析結果，"
+                                        "勾選後會重新呼叫 Claude 並更新快取")
+        stream_analysis = st.checkbox("📡 串流顯示分析結果", value=True,
+                                      help="邊產生邊顯示：摘要逐字出現，"
+                                           "評分與飲料推薦一完成就顯示")
+        token_budget = st.number_input("📏 文章 token 上限", min_value=0,
+                                       value=ARTICLE_TOKEN_BUDGET, step=500,
+                                       help="移除樣板與重複段落後，超過上限的內容會被裁切"
+                                            "（優先保留導言與引述），0 表示不限制")
+        show_diagnostics = st.checkbox("🩺 顯示診斷資訊", value=False,
+                                       help="各階段耗時分位數、token 用量與估算費用")
+        diagnostics_slot = st.empty() if show_diagnostics else None
+        
         st.markdown("---")
         st.markdown("""
         ### 🥤 飲料分類系統
@@ -424,26 +357,36 @@ def main():
     
     if not api_key:
         st.warning("⚠️ 請在側邊欄輸入Claude API Key")
+        if diagnostics_slot is not None:
+            with diagnostics_slot.container():
+                display_diagnostics()
         return
     
     # 輸入區域
-    tab1, tab2 = st.tabs(["🔗 網址輸入", "✍️ 手動輸入"])
+    tab1, tab2, tab3, tab4 = st.tabs(["🔗 網址輸入", "✍️ 手動輸入", "📜 歷史記錄", "📈 趨勢分析"])
     
     with tab1:
         url = st.text_input("🌐 請輸入新聞網址:")
         if st.button("📥 抓取並分析", type="primary"):
             if url:
                 with st.spinner("正在抓取文章內容..."):
-                    analyzer = NewsAnalyzer(api_key, model_name)
+                    analyzer = NewsAnalyzer(api_key, model_name, fast_fetch=fast_fetch,
+                                            token_budget=token_budget, cascade=cascade,
+                                            fan_out=fan_out, pre_classify=pre_classify,
+                                            confirm_heuristic=confirm_heuristic,
+                                            dedupe=dedupe)
                     
                     # 執行異步抓取
                     try:
                         content = asyncio.run(analyzer.fetch_article_content(url))
+                        display_fetch_timings(analyzer.last_fetch_timings,
+                                              analyzer.last_fetch_tier)
                         if "無法抓取" in content or "抓取失敗" in content:
                             st.error(content)
                             st.info("💡 請嘗試使用「手動輸入」功能")
                         else:
-                            analyze_content(analyzer, content)
+                            analyze_content(analyzer, content, bypass_cache, stream_analysis,
+                                            source=url)
                     except Exception as e:
                         st.error(f"抓取失敗: {str(e)}")
             else:
@@ -453,42 +396,384 @@ def main():
         content = st.text_area("📝 請貼上新聞內容:", height=200)
         if st.button("🔍 開始分析", type="primary"):
             if content:
-                analyzer = NewsAnalyzer(api_key, model_name)
-                analyze_content(analyzer, content)
+                analyzer = NewsAnalyzer(api_key, model_name, token_budget=token_budget,
+                                        cascade=cascade, fan_out=fan_out,
+                                        pre_classify=pre_classify,
+                                        confirm_heuristic=confirm_heuristic, dedupe=dedupe)
+                analyze_content(analyzer, content, bypass_cache, stream_analysis)
             else:
                 st.warning("請輸入新聞內容")
+    
+    with tab3:
+        display_history()
+    
+    with tab4:
+        display_trends()
+    
+    # 診斷面板在本次分析完成後才填入，包含剛剛的耗時與用量
+    if diagnostics_slot is not None:
+        with diagnostics_slot.container():
+            display_diagnostics()
 
-def analyze_content(analyzer, content):
-    """執行內容分析並顯示結果"""
-    with st.spinner("🤖 Claude正在深度分析中..."):
-        analysis = analyzer.analyze_news(content)
-        
-        if "error" in analysis:
-            st.error(f"❌ {analysis['error']}")
-            return
-        
-        # 顯示飲料推薦
+SCORE_FIELDS = ("truthfulness", "importance", "impact")
+
+
+def display_preprocess_report(report):
+    """顯示文章前處理前後的 token 數"""
+    if not report:
+        return
+    
+    parts = [f"文章 token（估算）{report['tokens_before']} → {report['tokens_after']}"]
+    if report["removed_lines"]:
+        parts.append(f"移除樣板 {report['removed_lines']} 行")
+    if report["duplicate_paragraphs"]:
+        parts.append(f"重複段落 {report['duplicate_paragraphs']} 段")
+    if report["truncated"]:
+        parts.append("已依上限裁切")
+    st.caption("✂️ " + "｜".join(parts))
+
+
+def layout_analysis_slots():
+    """配置分析結果版面，返回各區塊的佔位元件"""
+    board = st.empty()
+    with board.container():
+        notice = st.empty()
         st.markdown("## 🥤 您的新聞是...")
-        display_drink_result(analysis["drink_recommendation"])
+        drink = st.empty()
         
-        # 顯示詳細分析
         col1, col2 = st.columns([2, 1])
-        
         with col1:
             st.markdown("## 📋 分析摘要")
-            st.write(analysis["summary"])
-            
+            summary = st.empty()
             st.markdown("## 👥 目標讀者")
-            st.write(analysis["target_audience"])
-        
+            target_audience = st.empty()
         with col2:
             st.markdown("## 📊 評分結果")
-            display_scores(analysis)
-        
-        # 顯示實體信息
-        if analysis.get("entities"):
-            st.markdown("## 🔍 關鍵資訊擷取")
-            display_entities(analysis["entities"])
+            scores = st.empty()
+    
+    return {"board": board, "notice": notice, "drink": drink, "summary": summary,
+            "target_audience": target_audience, "scores": scores}
+
+
+def render_analysis_fields(slots, fields, partial=None, rendered=None):
+    """
+    把已完成的分析欄位填入版面，每個區塊只顯示一次
+    
+    partial 為串流中尚未結束的字串欄位 (欄位名稱, 目前內容)，以游標符號逐字顯示。
+    """
+    rendered = set() if rendered is None else rendered
+    
+    if "drink_recommendation" in fields and "drink" not in rendered:
+        with slots["drink"].container():
+            display_drink_result(fields["drink_recommendation"])
+        rendered.add("drink")
+    
+    for key in ("summary", "target_audience"):
+        if key in fields and key not in rendered:
+            slots[key].write(fields[key])
+            rendered.add(key)
+    
+    if partial and partial[0] in ("summary", "target_audience") and partial[0] not in rendered:
+        slots[partial[0]].markdown(partial[1] + "▌")
+    
+    if all(key in fields for key in SCORE_FIELDS) and "scores" not in rendered:
+        with slots["scores"].container():
+            display_scores(fields)
+        rendered.add("scores")
+    return rendered
+
+
+def reset_analysis_fields(slots, rendered):
+    """清除已顯示的分析欄位（串流重試時前一次回應的內容作廢）"""
+    for key in ("drink", "summary", "target_audience", "scores"):
+        slots[key].empty()
+    rendered.clear()
+
+
+def analyze_content(analyzer, content, bypass_cache=False, stream=False, source=None):
+    """
+    執行內容分析並顯示結果
+    
+    stream=True 時先配置版面，飲料推薦與評分一完成就顯示，摘要逐字顯示；
+    平行分析模式下評分呼叫一完成就顯示，不必等待實體擷取。
+    """
+    slots = layout_analysis_slots()
+    rendered = set()
+    
+    def on_progress(fields, partial):
+        if not fields and partial is None:
+            # 新的一次串流嘗試開始，重試前顯示的欄位可能來自不同的回應
+            reset_analysis_fields(slots, rendered)
+        else:
+            render_analysis_fields(slots, fields, partial, rendered)
+    
+    # 平行分析模式一律回報進度，評分呼叫完成即可先顯示飲料推薦
+    progress = on_progress if stream or analyzer.fan_out else None
+    started = time.perf_counter()
+    with st.spinner("🤖 Claude正在深度分析中..."):
+        analysis = analyzer.analyze_news(content, bypass_cache=bypass_cache,
+                                         on_progress=progress, source=source)
+    
+    if "error" in analysis:
+        slots["board"].empty()
+        st.error(f"❌ {analysis['error']}")
+        return
+    
+    record_history(analyzer, content, analysis, source, time.perf_counter() - started)
+    
+    if analyzer.last_analysis_cached:
+        slots["notice"].caption("⚡ 相同內容已分析過，直接使用快取的分析結果")
+    elif analyzer.last_duplicate:
+        duplicate = analyzer.last_duplicate
+        original = duplicate["source"] or "先前分析的文章"
+        if original.startswith("http"):
+            original = f"[原文]({original})"
+        slots["notice"].caption(f"♻️ 與{original}相似度 {duplicate['similarity']:.0%}，"
+                                "直接重用其分析結果")
+    elif analyzer.last_heuristic:
+        slots["notice"].caption(f"🧭 本機規則判定（信心 {analyzer.last_heuristic['confidence']:.0%}），"
+                                "分數為暫定值，未呼叫 Claude")
+    elif analyzer.last_cascade:
+        if analyzer.last_cascade["escalated"]:
+            slots["notice"].caption(f"🪜 快速模型結果不夠明確，已改用 {analyzer.model_name} 分析")
+        else:
+            slots["notice"].caption(f"🪜 分數明確，採用快速模型 {analyzer.triage_model} 的結果")
+    elif analyzer.last_usage and analyzer.last_usage["cache_read_input_tokens"]:
+        slots["notice"].caption(
+            f"🧩 分析指示命中提示詞快取（{analyzer.last_usage['cache_read_input_tokens']} tokens）")
+    
+    render_analysis_fields(slots, analysis, rendered=rendered)
+    display_preprocess_report(analyzer.last_preprocess)
+    
+    # 顯示實體信息
+    if analysis.get("entities"):
+        st.markdown("## 🔍 關鍵資訊擷取")
+        display_entities(analysis["entities"])
+    
+    if analyzer.pending_confirmation is not None:
+        display_confirmation(analyzer, analysis)
+
+
+def display_confirmation(analyzer, provisional):
+    """等待背景的 Claude 確認，分類與規則判定不同時顯示 Claude 的結果"""
+    with st.spinner("🤖 Claude 正在確認規則判定..."):
+        try:
+            confirmed = analyzer.pending_confirmation.result(timeout=analyzer.deadline)
+        except Exception as e:
+            st.caption(f"Claude 確認失敗: {str(e)}")
+            return
+    
+    if "error" in confirmed:
+        st.caption(f"Claude 確認失敗: {confirmed['error']}")
+    elif (confirmed["drink_recommendation"]["category"]
+          == provisional["drink_recommendation"]["category"]):
+        st.caption("✅ Claude 確認與規則判定的分類一致")
+    else:
+        st.warning("⚠️ Claude 的判定與規則不同，以下為 Claude 的分析結果")
+        display_drink_result(confirmed["drink_recommendation"])
+        st.write(confirmed["summary"])
+
+
+# 歷史記錄的時間範圍：(顯示名稱, 秒數)，None 表示不限
+HISTORY_PERIODS = {
+    "all": ("全部", None),
+    "day": ("最近 24 小時", 24 * 3600),
+    "week": ("最近 7 天", 7 * 24 * 3600),
+    "month": ("最近 30 天", 30 * 24 * 3600),
+}
+
+HISTORY_PAGE_SIZE = 20
+
+# 時間範圍的起點每分鐘更新一次，其間的 rerun 沿用已載入的記錄
+HISTORY_REFRESH_SECONDS = 60
+
+SCORE_LABELS = {"truthfulness": "真實度", "importance": "重要性", "impact": "影響力"}
+
+
+def analysis_model(analyzer):
+    """實際產生分析結果的模型，規則判定時為 RULES_MODEL"""
+    if analyzer.last_heuristic:
+        return RULES_MODEL
+    if analyzer.last_cascade:
+        return analyzer.last_cascade["model"]
+    return analyzer.model_name
+
+
+def period_since(period):
+    """時間範圍的起始時間戳（取整到 HISTORY_REFRESH_SECONDS），不限時為 None"""
+    seconds = HISTORY_PERIODS[period][1]
+    if seconds is None:
+        return None
+    return time.time() // HISTORY_REFRESH_SECONDS * HISTORY_REFRESH_SECONDS - seconds
+
+
+def open_history_store():
+    """開啟歷史記錄並取得最新記錄 id，失敗時（例如 SQLite 不支援 FTS5）顯示提示並返回 None"""
+    try:
+        store = get_history_store()
+        return store, store.latest_id()
+    except Exception as e:
+        print(f"開啟歷史記錄失敗: {str(e)}")
+        st.warning("⚠️ 無法開啟歷史記錄（SQLite 可能不支援 FTS5 trigram），分析功能不受影響")
+        return None
+
+
+def record_history(analyzer, content, analysis, source, elapsed):
+    """
+    把分析結果寫入歷史記錄，寫入失敗不影響結果顯示
+
+    重用快取或近似重複文章的結果不寫入：原本的分析已有記錄，重複寫入會灌水篇數與趨勢統計。
+    """
+    if analyzer.last_analysis_cached or analyzer.last_duplicate:
+        return
+    timings = {"analysis_ms": round(elapsed * 1000)}
+    if source and analyzer.last_fetch_timings:
+        timings["fetch"] = analyzer.last_fetch_timings
+    try:
+        get_history_store().record(content, analysis, url=source,
+                                   model=analysis_model(analyzer), timings=timings)
+    except Exception as e:
+        print(f"寫入歷史記錄失敗: {str(e)}")
+
+
+def display_history():
+    """瀏覽分析歷史：依分類、時間、分數篩選並搜尋摘要，「載入更多」以 keyset 分頁接續"""
+    opened = open_history_store()
+    if opened is None:
+        return
+    store, latest = opened
+    
+    search = st.text_input("🔎 搜尋摘要", help="以空白分隔多個關鍵字，所有關鍵字都須出現")
+    col1, col2 = st.columns(2)
+    with col1:
+        category = st.selectbox("飲料分類", [None, *DRINK_STYLES],
+                                format_func=lambda c: "全部" if c is None else DRINK_STYLES[c][0])
+    with col2:
+        period = st.selectbox("時間", list(HISTORY_PERIODS),
+                              format_func=lambda p: HISTORY_PERIODS[p][0])
+    scores = {}
+    for column, (field, label) in zip(st.columns(len(SCORE_LABELS)), SCORE_LABELS.items()):
+        with column:
+            low, high = st.slider(label, 0, 100, (0, 100), key=f"history_{field}")
+        if (low, high) != (0, 100):
+            scores[field] = (low, high)
+    
+    filters = {"category": category, "scores": scores, "search": search,
+               "since": period_since(period)}
+    
+    # 篩選條件、時間範圍起點或最新記錄改變時重新查詢第一頁，否則沿用已載入的記錄
+    key = (search, category, period, tuple(sorted(scores.items())), filters["since"], latest)
+    state = st.session_state.get("history")
+    if state is None or state["key"] != key:
+        records, cursor = store.query(limit=HISTORY_PAGE_SIZE, **filters)
+        state = {"key": key, "filters": filters, "records": records, "cursor": cursor}
+        st.session_state["history"] = state
+    
+    def load_more():
+        # 沿用第一頁的篩選條件，分頁期間時間範圍不會移動
+        records, cursor = store.query(after=state["cursor"], limit=HISTORY_PAGE_SIZE,
+                                      **state["filters"])
+        state["records"] += records
+        state["cursor"] = cursor
+    
+    if not state["records"]:
+        st.info("尚無符合條件的分析記錄")
+        return
+    
+    for record in state["records"]:
+        drink = DRINK_STYLES.get(record["category"], ("❓ 未知飲料",))[0]
+        title = record["summary"] if len(record["summary"]) <= 40 else record["summary"][:40] + "…"
+        analyzed_at = datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M")
+        with st.expander(f"{drink}｜{analyzed_at}｜{title}"):
+            st.write(record["summary"])
+            st.caption("｜".join(f"{label} {record[field]}"
+                                for field, label in SCORE_LABELS.items()) +
+                       f"｜模型 {record['model']}｜分析 {record['timings'].get('analysis_ms', 0)} ms")
+            if record["url"]:
+                st.markdown(f"🔗 [{record['url']}]({record['url']})")
+            names = [item["name"] for items in record["entities"].values() for item in items
+                     if isinstance(item, dict) and item.get("name")]
+            if names:
+                st.caption("🔍 " + "、".join(names[:20]))
+    
+    if state["cursor"] is not None:
+        st.button("⬇️ 載入更多", on_click=load_more)
+
+
+ENTITY_KIND_LABELS = {"people": "人物", "organizations": "機構"}
+
+
+def score_cell(value):
+    return "—" if value is None else round(value)
+
+
+def summary_table(rows, name_label):
+    """把分組彙總轉成表格：篇數、平均分數與各飲料分類比例"""
+    return [{
+        name_label: row["name"],
+        **({"類別": ENTITY_KIND_LABELS.get(row["kind"], row["kind"])} if "kind" in row else {}),
+        "篇數": row["count"],
+        **{label: score_cell(row[field]) for field, label in SCORE_LABELS.items()},
+        **{DRINK_STYLES[category][0]: f"{row['mix'][category] / row['count']:.0%}"
+           for category in CATEGORIES},
+    } for row in rows]
+
+
+def display_trends():
+    """顯示趨勢分析：每日分數滑動平均與飲料分類分佈、各網站與實體的彙總、實體共同出現次數"""
+    opened = open_history_store()
+    if opened is None:
+        return
+    store, latest = opened
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        period = st.selectbox("期間", ["month", "all", "week", "day"],
+                              format_func=lambda p: HISTORY_PERIODS[p][0], key="trend_period")
+    with col2:
+        window = st.slider("滑動平均天數", 1, 30, 7, key="trend_window")
+    with col3:
+        kind = st.selectbox("實體類別", [None, *ENTITY_KIND_LABELS], key="trend_entity_kind",
+                            format_func=lambda k: "全部" if k is None else ENTITY_KIND_LABELS[k])
+    
+    # 分頁籤每次 rerun 都會執行：期間、時間範圍起點與最新記錄都沒變時沿用已讀出的資料
+    since = period_since(period)
+    key = (period, since, latest)
+    state = st.session_state.get("trends")
+    if state is None or state["key"] != key:
+        state = {"key": key, "data": load_trend_data(since=since, store=store)}
+        st.session_state["trends"] = state
+    data = state["data"]
+    if not len(data):
+        st.info("尚無分析記錄，分析幾篇新聞後即可查看趨勢")
+        return
+    
+    daily = daily_trends(data, window=window)
+    dates = [day.isoformat() for day in daily["dates"]]
+    st.markdown(f"### 📈 分數趨勢（{window} 日滑動平均）")
+    st.line_chart({"日期": dates, **{label: daily["rolling_mean"][:, index].tolist()
+                                     for index, label in enumerate(SCORE_LABELS.values())}},
+                  x="日期")
+    st.markdown("### 🥤 每日飲料分類")
+    st.bar_chart({"日期": dates, **{DRINK_STYLES[category][0]: daily["mix"][:, index].tolist()
+                                    for index, category in enumerate(CATEGORIES)}},
+                 x="日期")
+    
+    st.markdown("### 🌐 各網站")
+    st.table(summary_table(domain_summary(data), "網域"))
+    
+    entities = entity_summary(data, kind=kind)
+    if entities:
+        st.markdown("### 🔍 各實體")
+        st.table(summary_table(entities, "實體"))
+        names, matrix = co_occurrence(data, kind=kind)
+        pairs = [(matrix[i, j], names[i], names[j])
+                 for i in range(len(names)) for j in range(i + 1, len(names)) if matrix[i, j]]
+        if pairs:
+            st.markdown("### 🔗 經常一起出現的實體")
+            st.table([{"實體": f"{first}、{second}", "共同出現篇數": int(count)}
+                      for count, first, second in sorted(pairs, reverse=True)[:20]])
+
 
 # 頁面底部歸屬聲明
 st.markdown("---")
@@ -505,4 +790,4 @@ st.markdown(
 )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
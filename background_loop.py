@@ -0,0 +1,78 @@
+"""
+背景事件迴圈
+
+Streamlit 每次按下按鈕都會以 asyncio.run 建立一個新的事件迴圈，
+綁定在迴圈上的資源（瀏覽器連線、非同步 HTTP 連線池）因此無法跨次重用。
+本模組提供一個常駐於背景執行緒的事件迴圈，讓這類資源能在整個行程中共用，
+不受 Streamlit session 與 rerun 影響。
+"""
+
+import asyncio
+import functools
+import threading
+
+
+class BackgroundLoop:
+    """在背景 daemon 執行緒中執行的事件迴圈，延遲到第一次使用時才啟動"""
+
+    def __init__(self, name="news-analyzer-loop"):
+        self._name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """取得背景事件迴圈，必要時啟動執行緒"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run_forever,
+                    args=(self._loop, ready),
+                    name=self._name,
+                    daemon=True,
+                )
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _run_forever(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """在背景迴圈上排程協程，回傳 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro):
+        """從任意事件迴圈等待背景迴圈上的協程結果"""
+        loop = self.loop
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def run_sync(self, coro, timeout=None):
+        """從同步程式碼執行協程並等待結果"""
+        return self.submit(coro).result(timeout)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    在預設的執行緒池中執行阻塞函式並等待結果，不阻塞目前的事件迴圈
+
+    等同 asyncio.to_thread，但該函式要到 Python 3.9 才有，這裡以 run_in_executor 維持 3.8 相容。
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(func, *args, **kwargs))
+
+
+_default_loop = BackgroundLoop()
+
+
+def get_background_loop():
+    """取得行程共用的背景事件迴圈"""
+    return _default_loop
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+批次分析命令列工具
+
+不經過 Streamlit，一次分析多篇新聞，結果在每篇完成時立即寫入 JSONL 或 CSV。
+輸入檔每行一筆（可混用）：
+- 新聞網址（http / https）
+- 文字檔路徑（相對路徑以輸入檔所在目錄為準）
+- JSON 物件：{"id": ..., "url": ...}、{"id": ..., "path": ...} 或 {"id": ..., "text": ...}
+空行與 # 開頭的行會略過。
+
+處理流程為有界佇列串接的三個階段，各階段以固定數量的 worker 並行：
+抓取（共用瀏覽器池）→ Claude 分析 → 地點查詢（共用 Nominatim 排程器）。
+佇列有上限，輸入檔不會一次全部讀入記憶體。
+
+輸出檔已存在時會續跑：略過狀態為 ok 的紀錄，失敗的紀錄重新處理並附加在檔尾。
+
+--bulk 改以 Message Batches API 分析（見 bulk_analysis.py）：費用減半但需等待批次完成，
+適合大量重新評分；可搭配 fake_batch_server.py 離線測試。
+
+用法：
+    python batch_cli.py urls.txt --output results.jsonl
+    python batch_cli.py urls.txt articles.jsonl --output results.csv --fetch-workers 4
+    python batch_cli.py archive.jsonl --output rescored.jsonl --bulk
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from background_loop import get_background_loop, run_blocking
+from bulk_analysis import BATCH_POLL_INTERVAL, BulkAnalyzer
+from geocoder import resolve_location_async, search_link
+from news_analyzer import NewsAnalyzer
+from preprocess import ARTICLE_TOKEN_BUDGET
+
+DEFAULT_FETCH_WORKERS = 2
+DEFAULT_ANALYSIS_WORKERS = 4
+DEFAULT_GEOCODE_WORKERS = 2
+
+# 批次不需即時顯示，地點查詢可等待較久（逾時仍以搜尋連結輸出）
+GEOCODE_TIMEOUT = 30.0
+
+CSV_FIELDS = (
+    "id", "source", "status", "error", "fetch_tier", "summary", "target_audience",
+    "truthfulness", "importance", "impact", "drink_name", "drink_category",
+    "drink_reason", "locations", "entities", "elapsed",
+)
+
+
+def parse_input_line(line, base_dir="."):
+    """
+    解析輸入檔的一行，返回紀錄 dict（id、url 或 text、source），空行與註解返回 None
+
+    無 id 時以網址、檔案路徑或內文雜湊作為 id，續跑時以 id 判斷是否已完成。
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        item = json.loads(line)
+    elif line.startswith(("http://", "https://")):
+        item = {"url": line}
+    else:
+        item = {"path": line}
+
+    if item.get("url"):
+        record = {"url": item["url"], "source": item["url"]}
+    elif item.get("path"):
+        path = os.path.join(base_dir, os.path.expanduser(item["path"]))
+        with open(path, encoding="utf-8") as f:
+            record = {"text": f.read(), "source": item["path"]}
+    elif item.get("text"):
+        digest = hashlib.sha256(item["text"].encode("utf-8")).hexdigest()[:16]
+        record = {"text": item["text"], "source": f"text:{digest}"}
+    else:
+        raise ValueError("需要 url、path 或 text 欄位")
+    record["id"] = str(item.get("id") or record["source"])
+    return record
+
+
+def read_inputs(paths):
+    """依序讀出所有輸入檔的紀錄；無法解析的行以錯誤紀錄輸出，不中斷批次"""
+    for path in paths:
+        if path == "-":
+            lines, base_dir = sys.stdin, "."
+        else:
+            lines = open(path, encoding="utf-8")
+            base_dir = os.path.dirname(os.path.abspath(path))
+        with lines:
+            for number, line in enumerate(lines, 1):
+                try:
+                    record = parse_input_line(line, base_dir)
+                except (OSError, ValueError) as e:
+                    source = f"{path}:{number}"
+                    yield {"id": source, "source": source, "error": f"輸入無法解析: {str(e)}"}
+                    continue
+                if record is not None:
+                    yield record
+
+
+def output_format(path, fmt=None):
+    """依參數或副檔名決定輸出格式（jsonl / csv）"""
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def ends_with_newline(path):
+    """檔案是否以換行結尾（空檔案視為是），否則最後一行是中斷時寫到一半的"""
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def completed_ids(path, fmt):
+    """
+    讀取既有輸出中狀態為 ok 的紀錄 id，中斷時寫到一半的行會被忽略
+
+    CSV 的殘缺列可能已寫過 status 欄，因此另外要求每個欄位都存在，
+    且檔案不以換行結尾時捨棄最後一列。
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows = list(csv.DictReader(f))
+            if rows and not ends_with_newline(path):
+                rows.pop()
+            rows = [row for row in rows
+                    if all(row.get(field) is not None for field in CSV_FIELDS)]
+        else:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue
+        for row in rows:
+            if isinstance(row, dict) and row.get("status") == "ok" and row.get("id"):
+                done.add(row["id"])
+    return done
+
+
+def result_row(record):
+    """把處理完成的紀錄整理成輸出用的 dict"""
+    analysis = record.get("analysis") or {}
+    error = record.get("error") or analysis.get("error")
+    row = {
+        "id": record["id"],
+        "source": record["source"],
+        "status": "error" if error else "ok",
+        "error": error,
+        "fetch_tier": record.get("fetch_tier"),
+        "elapsed": round(time.perf_counter() - record["started"], 3)
+        if "started" in record else None,
+    }
+    if not error:
+        row["analysis"] = analysis
+    return row
+
+
+def csv_row(row):
+    """把輸出 dict 攤平為 CSV 欄位，巢狀內容以 JSON 字串保存"""
+    analysis = row.get("analysis") or {}
+    drink = analysis.get("drink_recommendation") or {}
+    entities = analysis.get("entities") or {}
+    flat = {field: row.get(field) for field in ("id", "source", "status", "error",
+                                                "fetch_tier", "elapsed")}
+    for field in ("summary", "target_audience", "truthfulness", "importance", "impact"):
+        flat[field] = analysis.get(field)
+    flat["drink_name"] = drink.get("name")
+    flat["drink_category"] = drink.get("category")
+    flat["drink_reason"] = drink.get("reason")
+    flat["locations"] = json.dumps(entities.get("locations", []), ensure_ascii=False)
+    flat["entities"] = json.dumps(entities, ensure_ascii=False)
+    return flat
+
+
+class ResultWriter:
+    """逐筆附加寫入結果並立即 flush，讓中斷後可從輸出檔續跑"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.written = 0
+        self.failed = 0
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        needs_newline = exists and not ends_with_newline(path)
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        if needs_newline:
+            # 上次中斷在一行的中間，補上換行讓殘缺的行獨立成一行
+            self._file.write("\n")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, row):
+        if self._csv is not None:
+            self._csv.writerow(csv_row(row))
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.written += 1
+        if row["status"] != "ok":
+            self.failed += 1
+
+    def close(self):
+        self._file.close()
+
+
+async def run_stage(inbox, outbox, workers, handle):
+    """
+    以 workers 個協程處理 inbox 的紀錄並放入 outbox
+
+    收到 None 表示上游結束；所有 worker 結束後往下游送出同樣數量的結束訊號由呼叫端處理。
+    已帶有錯誤的紀錄直接往下傳，不再處理。
+    """
+    async def worker():
+        while True:
+            record = await inbox.get()
+            if record is None:
+                return
+            if not record.get("error"):
+                try:
+                    await handle(record)
+                except Exception as e:
+                    record["error"] = f"處理失敗: {str(e)}"
+            await outbox.put(record)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def run_batch(records, writer, analyzer_factory, fetch_workers=DEFAULT_FETCH_WORKERS,
+                    analysis_workers=DEFAULT_ANALYSIS_WORKERS,
+                    geocode_workers=DEFAULT_GEOCODE_WORKERS, geocode=True,
+                    geocode_timeout=GEOCODE_TIMEOUT, bypass_cache=False, skip_ids=(),
+                    bulk=None):
+    """
+    執行批次管線，返回 dict：written、failed、skipped
+
+    analyzer_factory() 為每個抓取與分析 worker 建立各自的 NewsAnalyzer
+    （抓取與用量資訊記錄在實例上），瀏覽器池、內容與分析快取則為行程共用。
+    提供 bulk（BulkAnalyzer）時，分析階段改為收齊所有抓取結果後以一個 Message Batches
+    批次送出，取回結果後再進入地點查詢。
+    """
+    fetch_queue = asyncio.Queue(maxsize=fetch_workers * 2)
+    analysis_queue = asyncio.Queue(maxsize=analysis_workers * 2)
+    geocode_queue = asyncio.Queue(maxsize=geocode_workers * 2)
+    output_queue = asyncio.Queue(maxsize=geocode_workers * 2)
+    skipped = 0
+
+    async def produce():
+        nonlocal skipped
+        for record in records:
+            if record["id"] in skip_ids:
+                skipped += 1
+                continue
+            record["started"] = time.perf_counter()
+            await fetch_queue.put(record)
+        for _ in range(fetch_workers):
+            await fetch_queue.put(None)
+
+    fetchers = [analyzer_factory() for _ in range(fetch_workers)]
+    analyzers = [analyzer_factory() for _ in range(analysis_workers if bulk is None else 0)]
+
+    async def fetch(record):
+        if "text" in record:
+            return
+        analyzer = fetchers.pop()
+        try:
+            content = await analyzer.fetch_article_content(record["url"])
+            record["fetch_tier"] = analyzer.last_fetch_tier
+        finally:
+            fetchers.append(analyzer)
+        if "無法抓取" in content or "抓取失敗" in content:
+            record["error"] = content
+        else:
+            record["text"] = content
+
+    async def analyze(record):
+        analyzer = analyzers.pop()
+        try:
+            # 共用的 Claude 客戶端綁定在背景事件迴圈上
+            record["analysis"] = await get_background_loop().run(
+                analyzer.analyze_news_async(record.pop("text"), bypass_cache,
+                                            source=record.get("url") or record["id"]))
+        finally:
+            analyzers.append(analyzer)
+
+    async def resolve(record):
+        if not geocode:
+            return
+        entities = (record.get("analysis") or {}).get("entities") or {}
+        locations = [location for location in entities.get("locations") or []
+                     if location.get("name")]
+        if not locations:
+            return
+        futures = [asyncio.wrap_future(resolve_location_async(location["name"]))
+                   for location in locations]
+        await asyncio.wait(futures, timeout=geocode_timeout)
+        for location, future in zip(locations, futures):
+            location["osm_link"] = (future.result() if future.done()
+                                    else search_link(location["name"]))
+
+    async def stage(inbox, outbox, workers, handle, downstream_workers):
+        await run_stage(inbox, outbox, workers, handle)
+        for _ in range(downstream_workers):
+            await outbox.put(None)
+
+    async def write_results():
+        while True:
+            record = await output_queue.get()
+            if record is None:
+                return
+            row = result_row(record)
+            writer.write(row)
+            mark = "✓" if row["status"] == "ok" else "✗"
+            print(f"{mark} {row['id']}" + (f"  {row['error']}" if row["error"] else ""),
+                  file=sys.stderr)
+
+    async def analyze_bulk():
+        # 批次模式需要整批內文，抓取失敗的紀錄直接往下傳
+        pending = []
+        while True:
+            record = await analysis_queue.get()
+            if record is None:
+                break
+            if record.get("error"):
+                await geocode_queue.put(record)
+            else:
+                pending.append(record)
+        if pending:
+            try:
+                results = await run_blocking(
+                    bulk.run, [(record["id"], record.pop("text")) for record in pending],
+                    bypass_cache)
+            except Exception as e:
+                results = {record["id"]: {"error": f"批次分析失敗: {str(e)}"}
+                           for record in pending}
+            for record in pending:
+                record["analysis"] = results.get(
+                    record["id"], {"error": "批次分析失敗: 批次結果中沒有此紀錄"})
+                await geocode_queue.put(record)
+        for _ in range(geocode_workers):
+            await geocode_queue.put(None)
+
+    if bulk is None:
+        analysis_stage = stage(analysis_queue, geocode_queue, analysis_workers, analyze,
+                               geocode_workers)
+    else:
+        analysis_stage = analyze_bulk()
+
+    await asyncio.gather(
+        produce(),
+        stage(fetch_queue, analysis_queue, fetch_workers, fetch,
+              analysis_workers if bulk is None else 1),
+        analysis_stage,
+        stage(geocode_queue, output_queue, geocode_workers, resolve, 1),
+        write_results(),
+    )
+    return {"written": writer.written, "failed": writer.failed, "skipped": skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批次分析新聞並輸出 JSONL / CSV")
+    parser.add_argument("inputs", nargs="+",
+                        help="輸入檔（每行一個網址、文字檔路徑或 JSON 物件），- 表示標準輸入")
+    parser.add_argument("--output", "-o", required=True, help="輸出檔路徑（.jsonl 或 .csv）")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="輸出格式（預設依副檔名）")
+    parser.add_argument("--api-key", default=os.getenv("ANTHROPIC_API_KEY"),
+                        help="Claude API Key（預設讀取 ANTHROPIC_API_KEY）")
+    parser.add_argument("--model", default="claude-sonnet-4-20250514", help="模型名稱")
+    parser.add_argument("--fetch-workers", type=int, default=DEFAULT_FETCH_WORKERS)
+    parser.add_argument("--analysis-workers", type=int, default=DEFAULT_ANALYSIS_WORKERS)
+    parser.add_argument("--geocode-workers", type=int, default=DEFAULT_GEOCODE_WORKERS)
+    parser.add_argument("--no-geocode", action="store_true", help="不查詢地點連結")
+    parser.add_argument("--fast-fetch", action="store_true", help="快速抓取模式")
+    parser.add_argument("--token-budget", type=int, default=ARTICLE_TOKEN_BUDGET,
+                        help="文章 token 上限（0 表示不限制）")
+    parser.add_argument("--bypass-cache", action="store_true", help="略過分析快取重新分析")
+    parser.add_argument("--bulk", action="store_true",
+                        help="以 Message Batches API 批次分析（較慢但費用減半，適合大量重新評分）")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="近似重複的文章（例如通訊社稿件的轉載）重用已分析的結果")
+    parser.add_argument("--cascade", action="store_true",
+                        help="先以快速模型分析，分數接近分類門檻時才改用 --model")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL,
+                        help="批次模式輪詢間隔秒數")
+    parser.add_argument("--restart", action="store_true",
+                        help="清空既有輸出重新開始（預設為續跑）")
+    args = parser.parse_args(argv)
+    if args.cascade and args.bulk:
+        parser.error("--cascade 無法與 --bulk 同時使用")
+
+    if not args.api_key:
+        parser.error("需要 --api-key 或環境變數 ANTHROPIC_API_KEY")
+    for name in ("fetch_workers", "analysis_workers", "geocode_workers"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} 至少為 1")
+
+    fmt = output_format(args.output, args.format)
+    state_path = f"{args.output}.batches.json"
+    if args.restart:
+        for path in (args.output, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+    done = completed_ids(args.output, fmt)
+    if done:
+        print(f"續跑：略過 {len(done)} 筆已完成的紀錄", file=sys.stderr)
+
+    def analyzer_factory():
+        return NewsAnalyzer(args.api_key, args.model, fast_fetch=args.fast_fetch,
+                            token_budget=args.token_budget, cascade=args.cascade,
+                            dedupe=args.dedupe)
+
+    bulk = None
+    if args.bulk:
+        # 已送出的批次記錄在輸出檔旁的狀態檔，中斷後重跑會繼續取回而不重複送出
+        bulk = BulkAnalyzer(analyzer_factory(), poll_interval=args.poll_interval,
+                            state_path=state_path)
+
+    writer = ResultWriter(args.output, fmt)
+    try:
+        summary = asyncio.run(run_batch(
+            read_inputs(args.inputs), writer, analyzer_factory,
+            fetch_workers=args.fetch_workers,
+            analysis_workers=args.analysis_workers,
+            geocode_workers=args.geocode_workers,
+            geocode=not args.no_geocode,
+            bypass_cache=args.bypass_cache,
+            skip_ids=done,
+            bulk=bulk,
+        ))
+    finally:
+        writer.close()
+
+    print(f"完成 {summary['written']} 筆（失敗 {summary['failed']} 筆），"
+          f"略過 {summary['skipped']} 筆，結果寫入 {args.output}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+共用 Chromium 瀏覽器池
+
+每次抓取都重新 launch Chromium 的冷啟動成本往往比載入頁面還高。
+瀏覽器池在整個行程中保留固定數量的已啟動瀏覽器（跨 Streamlit session 與 rerun），
+每次借出時建立全新的 browser context 以隔離 cookie 與儲存空間，
+瀏覽器服務滿指定頁數後自動回收，崩潰的瀏覽器會在下次借出時重新啟動。
+
+環境變數：
+- BROWSER_POOL_SIZE: 瀏覽器數量（預設 2）
+- BROWSER_MAX_PAGES: 單一瀏覽器服務多少頁後回收（預設 50）
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+
+from playwright.async_api import async_playwright, Error as PlaywrightError
+
+from background_loop import get_background_loop
+
+DEFAULT_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+DEFAULT_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "50"))
+
+
+class _BrowserSlot:
+    """瀏覽器池中的單一位置，瀏覽器在需要時才啟動"""
+
+    def __init__(self, index):
+        self.index = index
+        self.browser = None
+        self.pages_served = 0
+
+
+class BrowserPool:
+    """固定大小的 Chromium 瀏覽器池，所有 Playwright 物件都只在背景事件迴圈上操作"""
+
+    def __init__(
+        self,
+        size=DEFAULT_POOL_SIZE,
+        max_pages_per_browser=DEFAULT_MAX_PAGES,
+        launch_options=None,
+        runtime=None,
+        playwright_factory=async_playwright,
+    ):
+        if size < 1:
+            raise ValueError("瀏覽器池大小至少為 1")
+        if max_pages_per_browser < 1:
+            raise ValueError("max_pages_per_browser 至少為 1")
+
+        self.size = size
+        self.max_pages_per_browser = max_pages_per_browser
+        self.launch_options = launch_options or {}
+        self._runtime = runtime or get_background_loop()
+        self._playwright_factory = playwright_factory
+        self._playwright = None
+        self._slots = None
+        self._all_slots = []
+        self._start_lock = None
+        self._stats = {"launches": 0, "recycled": 0, "crashed": 0, "pages": 0}
+
+    async def _ensure_started(self):
+        if self._slots is not None:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._slots is not None:
+                return
+            self._playwright = await self._playwright_factory().start()
+            self._all_slots = [_BrowserSlot(i) for i in range(self.size)]
+            slots = asyncio.Queue()
+            for slot in self._all_slots:
+                slots.put_nowait(slot)
+            self._slots = slots
+
+    async def _close_browser(self, slot):
+        browser, slot.browser = slot.browser, None
+        slot.pages_served = 0
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except PlaywrightError:
+            # 瀏覽器可能已經崩潰，關閉失敗不影響後續重新啟動
+            pass
+
+    async def _checkout(self):
+        await self._ensure_started()
+        slot = await self._slots.get()
+        try:
+            if slot.browser is not None and not slot.browser.is_connected():
+                self._stats["crashed"] += 1
+                await self._close_browser(slot)
+            if slot.browser is None:
+                slot.browser = await self._playwright.chromium.launch(
+                    **self.launch_options
+                )
+                slot.pages_served = 0
+                self._stats["launches"] += 1
+        except BaseException:
+            self._slots.put_nowait(slot)
+            raise
+        return slot
+
+    async def _checkin(self, slot):
+        slot.pages_served += 1
+        self._stats["pages"] += 1
+        try:
+            if slot.pages_served >= self.max_pages_per_browser:
+                self._stats["recycled"] += 1
+                await self._close_browser(slot)
+        finally:
+            self._slots.put_nowait(slot)
+
+    async def _with_page(self, page_fn, context_options):
+        slot = await self._checkout()
+        try:
+            context = await slot.browser.new_context(**(context_options or {}))
+            try:
+                page = await context.new_page()
+                return await page_fn(page)
+            finally:
+                try:
+                    await context.close()
+                except PlaywrightError:
+                    pass
+        finally:
+            await self._checkin(slot)
+
+    async def run(self, page_fn, context_options=None):
+        """
+        在全新的隔離 context 中執行 page_fn(page) 並回傳其結果
+
+        page_fn 必須是協程函式，會在瀏覽器池的背景事件迴圈上執行，
+        因此不可使用呼叫端事件迴圈上的物件。
+        """
+        return await self._runtime.run(self._with_page(page_fn, context_options))
+
+    def stats(self):
+        """回傳瀏覽器池的使用統計"""
+        stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["alive"] = sum(1 for slot in self._all_slots if slot.browser)
+        return stats
+
+    async def _shutdown(self):
+        for slot in self._all_slots:
+            await self._close_browser(slot)
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._playwright = None
+        self._slots = None
+        self._all_slots = []
+
+    def shutdown(self, timeout=10):
+        """關閉所有瀏覽器與 Playwright 驅動程式"""
+        if self._slots is None:
+            return
+        try:
+            self._runtime.run_sync(self._shutdown(), timeout=timeout)
+        except Exception as e:
+            print(f"瀏覽器池關閉失敗: {str(e)}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """取得行程共用的瀏覽器池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+建立離線地名索引
+
+從 OSM 資料產生 gazetteer.py 使用的 gzip TSV 索引檔，支援三種來源（可混用）：
+- OSM XML 匯出檔（.osm，可為 .gz / .bz2 壓縮），例如 Geofabrik 的台灣區域匯出轉檔
+- Nominatim 查詢結果傾印（JSON lines，每行一個結果或結果陣列，建議含 namedetails）
+- 本專案的地點查詢快取（.cache/geocode.sqlite3 中狀態為 found 的結果）
+
+只收錄行政區、聚落與常見地標；同名時依 行政邊界 relation > 聚落 > 其他地標 的順序取捨。
+
+用法：
+    python build_gazetteer.py --osm taiwan.osm.bz2 --output data/gazetteer_tw.tsv.gz
+    python build_gazetteer.py --nominatim dump.jsonl --geocode-cache .cache/geocode.sqlite3
+"""
+
+import argparse
+import bz2
+import gzip
+import json
+import re
+import sqlite3
+import xml.etree.ElementTree as ET
+
+from gazetteer import GAZETTEER_PATH, OSM_TYPES, Gazetteer
+from geocoder import normalize_location_name
+
+# 收錄的名稱標籤；別名類標籤可能以分號分隔多個名稱
+NAME_TAGS = ("name", "name:zh", "name:zh-Hant", "name:zh-TW", "official_name",
+             "short_name", "alt_name", "old_name", "name:en")
+
+# 地標類標籤與接受的值（None 表示任何值）
+LANDMARK_TAGS = {
+    "tourism": None,
+    "historic": None,
+    "aeroway": {"aerodrome"},
+    "railway": {"station"},
+    "office": {"government"},
+    "amenity": {"townhall", "university", "college", "hospital", "courthouse"},
+}
+
+RANK_BOUNDARY, RANK_PLACE, RANK_LANDMARK, RANK_OTHER = range(4)
+
+OSM_LINK = re.compile(r"openstreetmap\.org/(node|way|relation)/(\d+)")
+
+
+def feature_rank(osm_type, tags):
+    """依標籤判斷條目類別，不收錄時返回 None"""
+    if tags.get("boundary") == "administrative":
+        return RANK_BOUNDARY if osm_type == "relation" else RANK_PLACE
+    if "place" in tags:
+        return RANK_PLACE
+    for key, values in LANDMARK_TAGS.items():
+        if key in tags and (values is None or tags[key] in values):
+            return RANK_LANDMARK
+    return None
+
+
+def names_from_tags(tags):
+    """從標籤取出所有名稱與別名"""
+    for tag in NAME_TAGS:
+        for name in (tags.get(tag) or "").split(";"):
+            if name.strip():
+                yield name.strip()
+
+
+def open_maybe_compressed(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_osm_xml(path):
+    """讀取 OSM XML，產生 (名稱, OSM 類型, OSM ID, 類別)"""
+    with open_maybe_compressed(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or element.tag not in OSM_TYPES:
+                continue
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            rank = feature_rank(element.tag, tags)
+            if rank is not None:
+                for name in names_from_tags(tags):
+                    yield name, element.tag, int(element.get("id")), rank
+            # 只清 element 時根元素仍持有每個已處理的節點，整個檔案會留在記憶體
+            root.clear()
+
+
+def read_nominatim_dump(path):
+    """讀取 Nominatim 結果傾印（JSON lines），產生 (名稱, OSM 類型, OSM ID, 類別)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            for result in record if isinstance(record, list) else [record]:
+                osm_type, osm_id = result.get("osm_type"), result.get("osm_id")
+                if osm_type not in OSM_TYPES or not osm_id:
+                    continue
+                tags = {result.get("class", ""): result.get("type", "")}
+                rank = feature_rank(osm_type, tags)
+                if rank is None:
+                    rank = RANK_OTHER
+
+                names = list(names_from_tags(result.get("namedetails") or {}))
+                if result.get("name"):
+                    names.append(result["name"])
+                if result.get("display_name"):
+                    names.append(result["display_name"].split(",")[0])
+                if result.get("query"):
+                    names.append(result["query"])
+                for name in names:
+                    yield name, osm_type, int(osm_id), rank
+
+
+def read_geocode_cache(path):
+    """讀取地點查詢快取中已找到條目的結果，產生 (名稱, OSM 類型, OSM ID, 類別)"""
+    conn = sqlite3.connect(path)
+    try:
+        for key, value in conn.execute("SELECT key, value FROM entries"):
+            cached = json.loads(value)
+            match = OSM_LINK.search(cached.get("link", ""))
+            if cached.get("status") == "found" and match:
+                yield key, match.group(1), int(match.group(2)), RANK_OTHER
+    finally:
+        conn.close()
+
+
+def build_gazetteer(records):
+    """依類別挑選每個正規化地名的最佳條目，建立 Gazetteer"""
+    best = {}
+    for name, osm_type, osm_id, rank in records:
+        key = normalize_location_name(name)
+        if key and (key not in best or rank < best[key][0]):
+            best[key] = (rank, osm_type, osm_id)
+    return Gazetteer((key, osm_type, osm_id) for key, (_, osm_type, osm_id) in best.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建立離線地名索引")
+    parser.add_argument("--osm", action="append", default=[], help="OSM XML 匯出檔")
+    parser.add_argument("--nominatim", action="append", default=[],
+                        help="Nominatim 結果傾印（JSON lines）")
+    parser.add_argument("--geocode-cache", action="append", default=[],
+                        help="地點查詢快取資料庫（geocode.sqlite3）")
+    parser.add_argument("--output", default=GAZETTEER_PATH, help="輸出的索引檔路徑")
+    args = parser.parse_args(argv)
+
+    if not (args.osm or args.nominatim or args.geocode_cache):
+        parser.error("至少需要一個資料來源")
+
+    def records():
+        for path in args.osm:
+            yield from read_osm_xml(path)
+        for path in args.nominatim:
+            yield from read_nominatim_dump(path)
+        for path in args.geocode_cache:
+            yield from read_geocode_cache(path)
+
+    gazetteer = build_gazetteer(records())
+    gazetteer.save(args.output)
+    print(f"已寫入 {len(gazetteer)} 個地名到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
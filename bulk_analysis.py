@@ -0,0 +1,169 @@
+"""
+Message Batches 批次分析
+
+大量重新評分（例如每晚重跑歷史文章）時，逐篇同步呼叫 messages.create 既慢又以全價計費。
+本模組把整批文章轉成 Message Batches API 的請求（與 NewsAnalyzer 相同的前處理與提示詞），
+送出後輪詢直到處理完成，再依 custom_id 對應回文章 id，結果寫入分析快取。
+
+已送出但尚未取回的批次記錄在狀態檔中，中斷後重跑會繼續輪詢原批次而不重複送出。
+
+環境變數：
+- BATCH_POLL_INTERVAL: 輪詢批次狀態的間隔秒數（預設 60）
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from analysis_cache import get_analysis_cache
+from metrics import get_metrics
+from news_analyzer import parse_analysis, usage_summary
+
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "60"))
+
+# 單一批次的請求數上限（API 上限為 100,000 筆與 256 MB，保守切分）
+BATCH_MAX_REQUESTS = 10000
+
+
+def batch_custom_id(article_id):
+    """文章 id 轉為 API 接受的 custom_id（英數字、底線與連字號，最長 64 字元）"""
+    return "a" + hashlib.sha256(str(article_id).encode("utf-8")).hexdigest()[:40]
+
+
+class BulkAnalyzer:
+    """以 Message Batches API 分析大量文章，共用 NewsAnalyzer 的設定、客戶端與分析快取"""
+
+    def __init__(self, analyzer, poll_interval=BATCH_POLL_INTERVAL,
+                 max_requests=BATCH_MAX_REQUESTS, state_path=None, sleep=time.sleep):
+        self.analyzer = analyzer
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.state_path = state_path
+        self._sleep = sleep
+        self.stats = Counter()
+        self.usage = Counter()
+
+    def prepare(self, articles, bypass_cache=False):
+        """
+        前處理文章並組出批次請求
+
+        返回 (快取命中的結果, 待送出的請求, custom_id → {"id", "cache_key"})；
+        相同 id 的文章只送出一次。
+        """
+        results, requests, pending = {}, [], {}
+        for article_id, text in articles:
+            custom_id = batch_custom_id(article_id)
+            if article_id in results or custom_id in pending:
+                continue
+            content = self.analyzer.prepare_content(text)
+            cache, cache_key = self.analyzer.analysis_cache_entry(content)
+            if cache is not None and not bypass_cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    results[article_id] = cached
+                    self.stats["cached"] += 1
+                    continue
+            requests.append({"custom_id": custom_id,
+                             "params": self.analyzer.analysis_request(content)})
+            pending[custom_id] = {"id": article_id, "cache_key": cache_key}
+        return results, requests, pending
+
+    def submit(self, requests):
+        """依 max_requests 分批送出請求，逐批返回 (批次 id, 該批請求)"""
+        for start in range(0, len(requests), self.max_requests):
+            chunk = requests[start:start + self.max_requests]
+            batch = self.analyzer.client.messages.batches.create(requests=chunk)
+            self.stats["submitted"] += len(chunk)
+            print(f"已送出批次 {batch.id}（{len(chunk)} 筆）")
+            yield batch.id, chunk
+
+    def wait(self, batch_id):
+        """輪詢直到批次處理結束，返回批次物件"""
+        while True:
+            batch = self.analyzer.client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return batch
+            counts = batch.request_counts
+            print(f"批次 {batch_id} 處理中：完成 {counts.succeeded + counts.errored} 筆，"
+                  f"剩餘 {counts.processing} 筆")
+            self._sleep(self.poll_interval)
+
+    def collect(self, batch_id, pending):
+        """取回批次結果，逐筆返回 (文章 id, 分析結果)，成功的結果寫入分析快取"""
+        if self.analyzer.cache_analysis and self.analyzer.analysis_cache is None:
+            self.analyzer.analysis_cache = get_analysis_cache()
+        cache = self.analyzer.analysis_cache
+        for entry in self.analyzer.client.messages.batches.results(batch_id):
+            info = pending.get(entry.custom_id)
+            if info is None:
+                continue
+            result = entry.result
+            if result.type == "succeeded":
+                usage = usage_summary(getattr(result.message, "usage", None))
+                self.usage.update(usage)
+                get_metrics().record_usage(self.analyzer.model_name, usage, batch=True)
+                analysis = parse_analysis(result.message.content[0].text)
+                if cache is not None and info["cache_key"] and "error" not in analysis:
+                    cache.set(info["cache_key"], analysis)
+            elif result.type == "errored":
+                analysis = {"error": f"分析失敗: {result.error.error.message}"}
+            else:
+                # canceled / expired：可重新送出
+                analysis = {"error": f"分析失敗: 批次請求{result.type}"}
+            self.stats["error" if "error" in analysis else "succeeded"] += 1
+            yield info["id"], analysis
+
+    def run(self, articles, bypass_cache=False):
+        """
+        分析整批文章，返回 文章 id → 分析結果
+
+        articles 為 (文章 id, 內文) 的可迭代物件。狀態檔中尚未取回的批次會先繼續處理，
+        其中的文章不再重複送出。
+        """
+        state = self._load_state()
+        resumed = {info["id"] for batch in state for info in batch["requests"].values()}
+        results, requests, pending = self.prepare(
+            ((article_id, text) for article_id, text in articles if article_id not in resumed),
+            bypass_cache)
+
+        for batch_id, chunk in self.submit(requests):
+            state.append({"id": batch_id, "requests": {
+                request["custom_id"]: pending[request["custom_id"]] for request in chunk}})
+            # 每送出一批就記錄，送出途中中斷也不會重複送出已建立的批次
+            self._save_state(state)
+
+        while state:
+            batch = state[0]
+            with get_metrics().span("batch", model=self.analyzer.model_name):
+                self.wait(batch["id"])
+                results.update(self.collect(batch["id"], batch["requests"]))
+            state.pop(0)
+            self._save_state(state)
+
+        if self.usage:
+            print("Claude API 批次用量: " + ", ".join(
+                f"{field}={value}" for field, value in sorted(self.usage.items())))
+        return results
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return []
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        print(f"繼續處理 {len(state['batches'])} 個未取回的批次")
+        return state["batches"]
+
+    def _save_state(self, batches):
+        if not self.state_path:
+            return
+        if not batches:
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.analyzer.model_name, "batches": batches}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
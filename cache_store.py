@@ -0,0 +1,191 @@
+"""
+持久化快取
+
+以 SQLite 儲存的鍵值快取，值以 JSON 序列化。每筆資料有各自的到期時間，
+總容量超過上限時依最近存取時間淘汰（LRU）。各命名空間使用獨立的資料庫檔案，
+並在行程內共用同一個連線，因此可跨 Streamlit session 與 rerun 重用。
+
+環境變數：
+- NEWS_ANALYZER_CACHE_DIR: 快取目錄（預設為專案目錄下的 .cache）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "NEWS_ANALYZER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+
+class SQLiteCache:
+    """具 TTL 與容量上限（LRU 淘汰）的 SQLite 快取"""
+
+    def __init__(self, path, default_ttl=None, max_bytes=100 * 1024 * 1024):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)"
+        )
+        self._conn.commit()
+
+    def get_entry(self, key):
+        """
+        取得快取項目（包含已過期者），找不到時回傳 None
+
+        回傳 dict：value、created_at、expires_at、expired。
+        過期項目仍會回傳，讓呼叫端可以做條件式重新驗證。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, expires_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            value, created_at, expires_at = row
+            expired = expires_at is not None and expires_at <= now
+            self._counters["expired" if expired else "hits"] += 1
+
+        return {
+            "value": json.loads(value),
+            "created_at": created_at,
+            "expires_at": expires_at,
+            "expired": expired,
+        }
+
+    def get(self, key, default=None):
+        """取得未過期的快取值"""
+        entry = self.get_entry(key)
+        if entry is None or entry["expired"]:
+            return default
+        return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        """寫入快取值，ttl 為秒數（None 表示使用預設 TTL）"""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8")) + len(key.encode("utf-8"))
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, value, size, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload, size, now, expires_at, now),
+            )
+            self._counters["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def refresh(self, key, ttl=None):
+        """延長既有項目的有效期限（例如條件式請求回傳 304 後）"""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET expires_at = ?, last_access = ? WHERE key = ?",
+                (expires_at, now, key),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        """刪除快取項目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def _evict(self):
+        # 呼叫端需持有 self._lock
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries")
+        excess = total.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        )
+        for key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._counters["evictions"] += len(victims)
+
+    def count(self, name, amount=1):
+        """累加自訂計數器（例如 revalidated）"""
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        """回傳命中／未命中計數與目前容量"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            stats = dict(self._counters)
+        lookups = stats.get("hits", 0) + stats.get("misses", 0) + stats.get("expired", 0)
+        stats["entries"] = entries
+        stats["bytes"] = size
+        stats["hit_rate"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace, default_ttl=None, max_bytes=100 * 1024 * 1024, cache_dir=None):
+    """取得行程共用的命名空間快取，第一次呼叫時的設定生效"""
+    with _caches_lock:
+        if namespace not in _caches:
+            path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"{namespace}.sqlite3")
+            _caches[namespace] = SQLiteCache(
+                path, default_ttl=default_ttl, max_bytes=max_bytes
+            )
+        return _caches[namespace]
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+本機 Message Batches 替身伺服器
+
+實作 Anthropic API 中批次分析會用到的端點，讓 bulk_analysis 與批次命令列工具
+可以在離線環境下端對端測試（anthropic 客戶端以 base_url 指向本伺服器即可）：
+- POST /v1/messages/batches                 建立批次
+- GET  /v1/messages/batches/{id}            查詢狀態（輪詢指定次數後結束）
+- GET  /v1/messages/batches/{id}/results    以 JSONL 取回結果
+- POST /v1/messages                         單筆分析
+
+回應內容由 responder(params) 產生：返回模型輸出文字，返回 None 表示該筆請求失敗。
+預設的 responder 依新聞內容產生固定格式的分析結果。
+
+用法：
+    python fake_batch_server.py --port 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python batch_cli.py urls.txt -o out.jsonl --bulk
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from preprocess import estimate_tokens
+
+CUSTOM_ID = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _request_text(params):
+    """取出請求中的使用者訊息文字"""
+    parts = []
+    for message in params.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts += [block.get("text", "") for block in content or []]
+    return "\n".join(parts)
+
+
+def default_responder(params):
+    """依新聞內容產生固定格式的分析結果（摘要取內文開頭）"""
+    text = _request_text(params).replace("新聞內容：", "").strip()
+    return json.dumps({
+        "summary": text.split("\n")[0][:100],
+        "target_audience": "一般讀者",
+        "truthfulness": 60,
+        "importance": 50,
+        "impact": 50,
+        "drink_recommendation": {"name": "無糖白開水", "reason": "本機替身伺服器的固定結果",
+                                 "category": "plain_water"},
+        "entities": {"locations": [], "organizations": [], "people": [], "dates": []},
+    }, ensure_ascii=False)
+
+
+class FakeBatchServer:
+    """在背景執行緒執行的批次 API 替身，可作為 context manager 使用"""
+
+    def __init__(self, responder=default_responder, polls_until_ended=1,
+                 host="127.0.0.1", port=0):
+        self.responder = responder
+        self.polls_until_ended = polls_until_ended
+        self.batches = {}
+        self.created = []  # 每次建立批次收到的請求，供測試檢查
+        self.connections = 0  # 接受的 TCP 連線數，供測試檢查 keep-alive 重用
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        # 縮短輪詢間隔，讓 stop() 能很快返回
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                                        name="fake-batch-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在目前執行緒執行，直到 KeyboardInterrupt"""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def message(self, params):
+        """以 responder 產生 Message 物件，失敗時返回 None"""
+        text = self.responder(params)
+        if text is None:
+            return None
+        return {
+            "id": f"msg_fake_{next(self._ids):06d}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model", ""),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": estimate_tokens(_request_text(params)),
+                "output_tokens": estimate_tokens(text),
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+            },
+        }
+
+    def create_batch(self, requests):
+        """建立批次，custom_id 格式錯誤或重複時引發 ValueError"""
+        seen = set()
+        for request in requests:
+            custom_id = request.get("custom_id", "")
+            if not CUSTOM_ID.match(custom_id) or custom_id in seen:
+                raise ValueError(f"custom_id 無效或重複: {custom_id!r}")
+            seen.add(custom_id)
+        with self._lock:
+            batch_id = f"msgbatch_fake_{next(self._ids):06d}"
+            self.batches[batch_id] = {"requests": requests, "polls": 0,
+                                      "created_at": datetime.now(timezone.utc),
+                                      "results": None}
+            self.created.append(requests)
+        return self.batch_object(batch_id)
+
+    def poll_batch(self, batch_id):
+        """查詢批次；輪詢達指定次數後處理所有請求並標記為結束"""
+        with self._lock:
+            batch = self.batches[batch_id]
+            batch["polls"] += 1
+            if batch["results"] is None and batch["polls"] > self.polls_until_ended:
+                batch["results"] = []
+                for request in batch["requests"]:
+                    message = self.message(request["params"])
+                    if message is None:
+                        result = {"type": "errored", "error": {
+                            "type": "error",
+                            "error": {"type": "api_error", "message": "替身伺服器模擬失敗"}}}
+                    else:
+                        result = {"type": "succeeded", "message": message}
+                    batch["results"].append({"custom_id": request["custom_id"],
+                                             "result": result})
+                batch["ended_at"] = datetime.now(timezone.utc)
+        return self.batch_object(batch_id)
+
+    def batch_object(self, batch_id):
+        batch = self.batches[batch_id]
+        ended = batch["results"] is not None
+        results = batch["results"] or []
+        errored = sum(1 for entry in results if entry["result"]["type"] == "errored")
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch["requests"]),
+                "succeeded": len(results) - errored,
+                "errored": errored,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _timestamp(batch["created_at"]),
+            "expires_at": _timestamp(batch["created_at"] + timedelta(hours=24)),
+            "ended_at": _timestamp(batch["ended_at"]) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": (f"{self.base_url}/v1/messages/batches/{batch_id}/results"
+                            if ended else None),
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 支援 keep-alive，同一條連線可處理多個請求
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(
+                    body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status, error_type, message):
+                self._send(status, {"type": "error",
+                                    "error": {"type": error_type, "message": message}})
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                try:
+                    if path == "/v1/messages/batches":
+                        self._send(200, server.create_batch(self._body().get("requests", [])))
+                    elif path == "/v1/messages":
+                        message = server.message(self._body())
+                        if message is None:
+                            self._error(500, "api_error", "替身伺服器模擬失敗")
+                        else:
+                            self._send(200, message)
+                    else:
+                        self._error(404, "not_found_error", path)
+                except ValueError as e:
+                    self._error(400, "invalid_request_error", str(e))
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if parts[:3] != ["v1", "messages", "batches"] or len(parts) not in (4, 5) \
+                        or parts[3] not in server.batches:
+                    self._error(404, "not_found_error", self.path)
+                elif len(parts) == 4:
+                    self._send(200, server.poll_batch(parts[3]))
+                elif parts[4] == "results" and server.batches[parts[3]]["results"] is not None:
+                    lines = [json.dumps(entry, ensure_ascii=False)
+                             for entry in server.batches[parts[3]]["results"]]
+                    self._send(200, ("\n".join(lines) + "\n").encode("utf-8"),
+                               "application/binary")
+                else:
+                    self._error(404, "not_found_error", self.path)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機 Message Batches 替身伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--polls", type=int, default=1, help="批次在第幾次輪詢後結束")
+    args = parser.parse_args(argv)
+
+    server = FakeBatchServer(polls_until_ended=args.polls, host=args.host, port=args.port)
+    print(f"替身伺服器執行於 {server.base_url}（Ctrl+C 結束）")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
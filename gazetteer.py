@@ -0,0 +1,127 @@
+"""
+離線地名索引（gazetteer）
+
+新聞中的地點多半是行政區與地標，對應的 OSM 條目幾乎不會變動。
+預先建好的索引把正規化後的地名與別名對應到 OSM relation/way/node ID，
+查詢時先比對索引，只有未收錄的地名才需要呼叫 Nominatim。
+
+索引檔為 gzip 壓縮的 TSV（每行：正規化地名、OSM 類型、OSM ID，依地名排序），
+由 build_gazetteer.py 離線產生。載入後所有地名串成單一字串並以 array 儲存位移與 ID，
+以二分搜尋查詢，避免為數萬個地名各自建立 Python 物件。
+
+環境變數：
+- GAZETTEER_PATH: 索引檔路徑（預設為 data/gazetteer_tw.tsv.gz，檔案不存在時視為空索引）
+"""
+
+import gzip
+import os
+import threading
+from array import array
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer_tw.tsv.gz"),
+)
+
+OSM_TYPES = ("node", "way", "relation")
+HEADER = "# news-analyzer gazetteer v1"
+
+
+class Gazetteer:
+    """以排序地名與二分搜尋實作的唯讀地名索引"""
+
+    def __init__(self, entries=()):
+        """entries 為 (正規化地名, OSM 類型, OSM ID)，同名時保留第一筆"""
+        merged = {}
+        for name, osm_type, osm_id in entries:
+            if name and name not in merged:
+                merged[name] = (OSM_TYPES.index(osm_type), int(osm_id))
+
+        names = sorted(merged)
+        self._names = "".join(names)
+        self._offsets = array("I", [0])
+        self._types = array("B")
+        self._ids = array("q")
+        for name in names:
+            self._offsets.append(self._offsets[-1] + len(name))
+            type_index, osm_id = merged[name]
+            self._types.append(type_index)
+            self._ids.append(osm_id)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _name_at(self, index):
+        return self._names[self._offsets[index]:self._offsets[index + 1]]
+
+    def _find(self, key):
+        low, high = 0, len(self._ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._ids) and self._name_at(low) == key:
+            return low
+        return None
+
+    def lookup(self, key):
+        """以正規化地名查詢，返回 (OSM 類型, OSM ID)，未收錄時返回 None"""
+        index = self._find(key)
+        if index is None:
+            return None
+        return OSM_TYPES[self._types[index]], self._ids[index]
+
+    def lookup_link(self, key):
+        """以正規化地名查詢，返回 OSM 條目連結，未收錄時返回 None"""
+        found = self.lookup(key)
+        if found is None:
+            return None
+        osm_type, osm_id = found
+        return f"https://www.openstreetmap.org/{osm_type}/{osm_id}"
+
+    def entries(self):
+        """依地名順序列出所有 (地名, OSM 類型, OSM ID)"""
+        for index in range(len(self._ids)):
+            yield self._name_at(index), OSM_TYPES[self._types[index]], self._ids[index]
+
+    @classmethod
+    def load(cls, path):
+        """從 gzip TSV 索引檔載入"""
+        def rows():
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if not line or line.startswith("#"):
+                        continue
+                    name, osm_type, osm_id = line.split("\t")
+                    yield name, osm_type, osm_id
+        return cls(rows())
+
+    def save(self, path):
+        """寫出 gzip TSV 索引檔"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(HEADER + "\n")
+            for name, osm_type, osm_id in self.entries():
+                f.write(f"{name}\t{osm_type}\t{osm_id}\n")
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """取得行程共用的地名索引，第一次呼叫時才載入；索引檔不存在時返回空索引"""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            try:
+                _gazetteer = Gazetteer.load(GAZETTEER_PATH)
+            except FileNotFoundError:
+                _gazetteer = Gazetteer()
+            except (OSError, ValueError) as e:
+                print(f"地名索引載入失敗: {str(e)}")
+                _gazetteer = Gazetteer()
+        return _gazetteer
@@ -0,0 +1,403 @@
+"""
+地點查詢（OpenStreetMap Nominatim）
+
+將新聞中擷取的地點名稱轉為 OpenStreetMap 條目連結。
+台灣新聞反覆出現的地名有限（台北市、新北市、立法院…），
+查詢結果以正規化後的地名為鍵存入持久化快取：
+找到條目的結果保留較久，查無結果與 API 失敗的備選搜尋連結則使用較短的 TTL。
+
+查詢順序為：離線地名索引（gazetteer.py）→ 持久化快取 → Nominatim。
+快取未命中的查詢交給行程共用的 NominatimScheduler：
+由單一派送執行緒依序發出請求（前一個完成後才開始下一個），並以 token bucket
+強制全行程每秒最多 1 個請求（Nominatim 使用政策上限）；收到 HTTP 429 時依
+Retry-After（沒有時以指數退避）暫停派送。同名地點的進行中查詢會合併，
+結果以 Future / callback 非同步交回。
+
+環境變數：
+- GEOCODE_CACHE_TTL: 找到條目的結果有效秒數（預設 30 天）
+- GEOCODE_NEGATIVE_TTL: 查無結果的有效秒數（預設 1 天）
+- GEOCODE_FALLBACK_TTL: API 失敗時備選連結的有效秒數（預設 10 分鐘）
+- NOMINATIM_RATE: 每秒最多請求數（預設 1）
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from urllib.parse import quote
+
+import requests
+
+from cache_store import get_cache
+from gazetteer import get_gazetteer
+from metrics import get_metrics
+
+GEOCODE_TTL_BY_STATUS = {
+    "found": int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600))),
+    "not_found": int(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600))),
+    "fallback": int(os.getenv("GEOCODE_FALLBACK_TTL", "600")),
+}
+
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", "1"))
+
+# HTTP 429 沒有 Retry-After 時的退避秒數：連續第 n 次為 BASE × 2^(n-1)，最多 MAX
+NOMINATIM_BACKOFF_BASE = 2
+NOMINATIM_BACKOFF_MAX = 300
+
+# 同步查詢等待排程結果的上限秒數，逾時先返回搜尋連結
+LOOKUP_TIMEOUT = 30
+
+# 異體字對照：統一為常用寫法，讓「臺北市」與「台北市」共用同一筆快取
+VARIANT_CHARACTERS = str.maketrans({"臺": "台"})
+
+
+def normalize_location_name(location_name):
+    """
+    正規化地點名稱作為快取鍵
+
+    全形英數與空白轉半形（NFKC）、臺→台、壓縮空白，
+    中文字之間的空白直接移除，英文字母一律小寫。
+    """
+    name = unicodedata.normalize("NFKC", location_name).translate(VARIANT_CHARACTERS)
+    name = re.sub(r"\s+", " ", name).strip()
+    name = re.sub(r"(?<=[^\x00-\x7f]) (?=[^\x00-\x7f])", "", name)
+    return name.lower()
+
+
+def get_geocode_cache():
+    """取得行程共用的地點查詢快取"""
+    return get_cache("geocode", default_ttl=GEOCODE_TTL_BY_STATUS["found"])
+
+
+class NominatimRateLimited(Exception):
+    """Nominatim 回應 HTTP 429（請求頻率超過限制），retry_after 為建議等待秒數"""
+    
+    def __init__(self, retry_after=None):
+        super().__init__("Nominatim API 429 錯誤：請求頻率超過限制")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """解析秒數形式的 Retry-After 標頭，無法解析時返回 None"""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds >= 0 else None
+
+
+def search_nominatim(location_name):
+    """
+    使用 OpenStreetMap Nominatim API 查詢地點，並返回 (條目連結, 查詢狀態)
+    優先查找 relation 類型的條目（適合國家、城市等行政區劃）
+    
+    查詢狀態：
+    - found: 找到 OSM 條目
+    - not_found: 查詢成功但沒有可用的條目，返回搜尋連結
+    - fallback: API 錯誤或逾時，返回搜尋連結作為備選
+    
+    HTTP 429 會拋出 NominatimRateLimited，由排程器暫停後續請求。
+    
+    符合 Nominatim 使用政策：
+    - 設置合適的 User-Agent 識別應用程式
+    - 限制請求頻率（由 NominatimScheduler 統一控制，每秒最多 1 個請求）
+    - 適當的錯誤處理和備選方案
+    - 尊重 API 限制和超時設定
+    """
+    try:
+        # URL encode 地點名稱
+        encoded_name = quote(location_name)
+        
+        # 使用 Nominatim API 進行搜尋，嚴格遵循使用政策
+        search_url = f"https://nominatim.openstreetmap.org/search?q={encoded_name}&format=json&limit=3&addressdetails=1&accept-language=zh"
+        
+        # 設置符合 Nominatim 使用政策的 headers
+        # 政策要求：「Provide a valid HTTP Referer or User-Agent identifying the application」
+        headers = {
+            'User-Agent': 'NewsAnalyzer/2.1 (Educational news analysis tool; Contact: github.com/planetoid/news-analyzer)',
+            'Accept': 'application/json',
+            'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8',
+            'Referer': 'https://github.com/planetoid/news-analyzer'
+        }
+        
+        # 發送搜尋請求，遵循 API 使用限制
+        # 政策要求：「No heavy uses (an absolute maximum of 1 request per second)」
+        response = requests.get(search_url, headers=headers, timeout=10)
+        
+        if response.status_code == 200:
+            results = response.json()
+            
+            if not results:
+                # 沒有搜尋結果，返回搜尋連結作為備選
+                return f"https://www.openstreetmap.org/search?query={encoded_name}", "not_found"
+            
+            # 優先查找 relation 類型的結果（通常是行政區劃）
+            for result in results:
+                osm_type = result.get('osm_type')
+                osm_id = result.get('osm_id')
+                place_class = result.get('class', '')
+                
+                # 優先選擇 relation 類型的行政邊界或地點
+                if (osm_type == 'relation' and 
+                    place_class in ['boundary', 'place', 'administrative'] and 
+                    osm_id):
+                    return f"https://www.openstreetmap.org/relation/{osm_id}", "found"
+            
+            # 如果沒有找到 relation，查找其他高質量的結果
+            for result in results:
+                osm_type = result.get('osm_type')
+                osm_id = result.get('osm_id')
+                place_class = result.get('class', '')
+                
+                # 選擇地點類別的結果
+                if osm_type and osm_id and place_class in ['place', 'boundary']:
+                    if osm_type == 'relation':
+                        return f"https://www.openstreetmap.org/relation/{osm_id}", "found"
+                    elif osm_type == 'way':
+                        return f"https://www.openstreetmap.org/way/{osm_id}", "found"
+                    elif osm_type == 'node':
+                        return f"https://www.openstreetmap.org/node/{osm_id}", "found"
+            
+            # 最後嘗試任何有效的結果
+            first_result = results[0]
+            osm_type = first_result.get('osm_type')
+            osm_id = first_result.get('osm_id')
+            
+            if osm_type and osm_id:
+                if osm_type == 'relation':
+                    return f"https://www.openstreetmap.org/relation/{osm_id}", "found"
+                elif osm_type == 'way':
+                    return f"https://www.openstreetmap.org/way/{osm_id}", "found"
+                elif osm_type == 'node':
+                    return f"https://www.openstreetmap.org/node/{osm_id}", "found"
+            
+            # 有結果但沒有可用的 OSM 條目
+            return f"https://www.openstreetmap.org/search?query={encoded_name}", "not_found"
+        
+        elif response.status_code == 403:
+            # API 存取被拒絕，可能是請求頻率過高或違反使用政策
+            # 政策說明：「may be classified as faulty and blocked」
+            print("Nominatim API 403 錯誤：可能違反使用政策或請求過於頻繁")
+        elif response.status_code == 429:
+            # 請求頻率限制，交由排程器退避
+            raise NominatimRateLimited(parse_retry_after(response.headers.get('Retry-After')))
+        
+        # 如果 API 查詢失敗，返回搜尋連結作為備選方案
+        return f"https://www.openstreetmap.org/search?query={encoded_name}", "fallback"
+        
+    except requests.exceptions.Timeout:
+        # 請求超時，返回搜尋連結作為備選
+        print("Nominatim API 請求超時")
+    except NominatimRateLimited:
+        raise
+    except Exception as e:
+        # 記錄錯誤但不顯示給用戶（避免影響界面）
+        print(f"OpenStreetMap 查詢錯誤: {str(e)}")
+    
+    # 所有錯誤情況都返回搜尋連結作為備選方案
+    encoded_name = quote(location_name)
+    return f"https://www.openstreetmap.org/search?query={encoded_name}", "fallback"
+
+
+def search_link(location_name):
+    """返回 OpenStreetMap 搜尋連結（查詢完成前的預設連結）"""
+    return f"https://www.openstreetmap.org/search?query={quote(location_name)}"
+
+
+def lookup_gazetteer_link(location_name):
+    """只查詢離線地名索引，收錄時返回連結，否則返回 None"""
+    return get_gazetteer().lookup_link(normalize_location_name(location_name))
+
+
+def lookup_cached_link(location_name):
+    """只查詢快取，命中時返回連結，否則返回 None"""
+    cache = get_geocode_cache()
+    cached = cache.get(normalize_location_name(location_name))
+    if cached is None:
+        return None
+    cache.count(f"hits_{cached['status']}")
+    return cached["link"]
+
+
+class TokenBucket:
+    """執行緒安全的 token bucket，acquire 會阻塞到取得 token 為止"""
+    
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate 必須大於 0")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                elapsed = now - self._updated
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class NominatimScheduler:
+    """
+    行程共用的 Nominatim 查詢排程器
+    
+    所有 session 與執行緒的查詢都進入同一個佇列，由單一派送執行緒依序發出請求：
+    前一個請求完成後才開始下一個，請求開始時間另受 token bucket 節流，請求不會重疊。
+    收到 HTTP 429 時，該筆返回備選搜尋連結，並在下一個請求前暫停 Retry-After 秒
+    （沒有時以指數退避）。同一正規化地名在查詢中時，後續請求共用同一個 Future。
+    """
+    
+    def __init__(self, rate=NOMINATIM_RATE, lookup=None):
+        self._bucket = TokenBucket(rate)
+        self._lookup = lookup
+        self._queue = queue.Queue()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._consecutive_limited = 0
+        self._stats = {"submitted": 0, "gazetteer_hits": 0, "cache_hits": 0,
+                       "merged": 0, "requests": 0, "rate_limited": 0}
+    
+    def _ensure_dispatcher(self):
+        # 呼叫端需持有 self._lock
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_forever,
+                                                name="nominatim-dispatcher", daemon=True)
+            self._dispatcher.start()
+    
+    def submit(self, location_name, callback=None):
+        """
+        排程查詢地點，返回完成時結果為連結的 Future
+        
+        callback(location_name, link) 會在結果可用時於派送執行緒中呼叫。
+        """
+        started = time.perf_counter()
+        link = lookup_gazetteer_link(location_name)
+        source = "gazetteer"
+        if link is None:
+            link = lookup_cached_link(location_name)
+            source = "cache"
+        if link is not None:
+            future = Future()
+            future.set_result(link)
+            with self._lock:
+                self._stats["submitted"] += 1
+                self._stats[f"{source}_hits"] += 1
+        else:
+            key = normalize_location_name(location_name)
+            with self._lock:
+                self._stats["submitted"] += 1
+                future = self._inflight.get(key)
+                if future is not None:
+                    self._stats["merged"] += 1
+                else:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._queue.put((key, location_name, future))
+                    self._ensure_dispatcher()
+                source = "nominatim"
+        
+        # 每次查詢從提交到取得連結的時間（含排隊等待），依結果來源分開統計
+        future.add_done_callback(lambda f: get_metrics().observe(
+            "geocode", time.perf_counter() - started, source=source))
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: callback(location_name, f.result() if not f.exception()
+                                   else search_link(location_name)))
+        return future
+    
+    def _dispatch_forever(self):
+        while True:
+            key, location_name, future = self._queue.get()
+            self._bucket.acquire()
+            with self._lock:
+                self._stats["requests"] += 1
+            backoff = self._resolve(key, location_name, future)
+            if backoff:
+                time.sleep(backoff)
+    
+    def _resolve(self, key, location_name, future):
+        """發出一個請求並交回結果，返回下一個請求前需要暫停的秒數"""
+        backoff = 0
+        try:
+            try:
+                with get_metrics().span("nominatim"):
+                    link, status = (self._lookup or search_nominatim)(location_name)
+                self._consecutive_limited = 0
+            except NominatimRateLimited as e:
+                self._consecutive_limited += 1
+                backoff = e.retry_after
+                if backoff is None:
+                    backoff = min(NOMINATIM_BACKOFF_MAX, NOMINATIM_BACKOFF_BASE
+                                  * 2 ** (self._consecutive_limited - 1))
+                with self._lock:
+                    self._stats["rate_limited"] += 1
+                print(f"{e}，暫停 {backoff:g} 秒後再發出請求")
+                link, status = search_link(location_name), "fallback"
+            get_geocode_cache().set(key, {"link": link, "status": status},
+                                    ttl=GEOCODE_TTL_BY_STATUS[status])
+        except Exception as e:
+            print(f"OpenStreetMap 查詢錯誤: {str(e)}")
+            link = search_link(location_name)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        future.set_result(link)
+        return backoff
+    
+    def stats(self):
+        """回傳排程統計：提交數、索引與快取命中、合併數、實際請求數、429 次數與佇列長度"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._inflight)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_nominatim_scheduler():
+    """取得行程共用的 Nominatim 排程器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = NominatimScheduler()
+        return _scheduler
+
+
+def resolve_location_async(location_name, callback=None):
+    """非同步查詢地點連結，返回 concurrent.futures.Future"""
+    return get_nominatim_scheduler().submit(location_name, callback)
+
+
+def get_openstreetmap_entity_link(location_name, timeout=LOOKUP_TIMEOUT):
+    """
+    查詢地點的 OpenStreetMap 條目連結，優先使用離線地名索引與快取
+    
+    索引收錄或快取命中時不會發出任何 Nominatim 請求；未命中時經由排程器查詢，
+    並依結果狀態設定 TTL。等待超過 timeout 秒時先返回搜尋連結（查詢仍會完成並寫入快取）。
+    """
+    try:
+        return resolve_location_async(location_name).result(timeout)
+    except FutureTimeoutError:
+        return search_link(location_name)
+
+
+def geocode_cache_stats():
+    """回傳地點查詢快取的命中統計（含各狀態的命中次數）"""
+    return get_geocode_cache().stats()
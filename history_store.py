@@ -0,0 +1,387 @@
+"""
+分析歷史記錄
+
+每次分析結果存入 SQLite：網址與網域、內容雜湊、模型、三項分數、飲料分類、實體與耗時。
+日期、分類與分數欄位建有索引；摘要另建 FTS5 全文索引，使用 trigram 分詞，中文不需斷詞。
+記錄只會依時間附加，id 順序即時間順序：日期範圍先換算成 id 範圍，
+瀏覽採 keyset 分頁，以上一頁最後一筆的 id 為游標繼續往前查，不使用 OFFSET，
+翻到第幾頁都只讀取一頁的資料；全文搜尋也由 FTS5 依 id 由大到小逐筆產生，湊滿一頁即停止，
+數百萬筆仍維持固定的查詢時間。
+
+人物與機構另存為正規化的實體表與提及表（皆為整數 id），趨勢分析可直接讀出數值欄位轉成 NumPy 陣列，
+不必逐筆解析 JSON。
+
+環境變數：
+- HISTORY_DB_PATH: 歷史資料庫路徑（預設為快取目錄下的 history.sqlite3）
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from analysis_cache import normalize_content
+from cache_store import DEFAULT_CACHE_DIR
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH",
+                            os.path.join(DEFAULT_CACHE_DIR, "history.sqlite3"))
+
+# trigram 分詞只能以 3 個字以上的字串查詢索引，較短的詞（多數中文詞為兩個字）改以 LIKE 比對：
+# 與長詞或其他條件併用時只過濾候選；單獨使用時依 id 由新到舊掃描，常見詞很快湊滿一頁，
+# 但完全沒有符合的記錄時需掃描整個表
+MIN_MATCH_LENGTH = 3
+
+SCORE_FIELDS = ("truthfulness", "importance", "impact")
+
+# 本機規則判定（未呼叫 Claude）的記錄以此標記模型，分數為暫定值，趨勢分析預設排除
+RULES_MODEL = "rules"
+
+# 建立實體索引的類別（趨勢分析依人物與機構分組）
+MENTION_KINDS = ("people", "organizations")
+
+_COLUMNS = ("id", "created_at", "url", "domain", "content_hash", "model", "truthfulness",
+            "importance", "impact", "category", "summary", "entities", "timings")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS analyses (
+        id INTEGER PRIMARY KEY,
+        created_at REAL NOT NULL,
+        url TEXT,
+        domain TEXT,
+        content_hash TEXT NOT NULL,
+        model TEXT,
+        truthfulness INTEGER,
+        importance INTEGER,
+        impact INTEGER,
+        category TEXT,
+        summary TEXT NOT NULL DEFAULT '',
+        entities TEXT,
+        timings TEXT,
+        analysis BLOB NOT NULL
+    )
+    """,
+    # 明確列出 id，同一分類或分數內依 id 排序，分頁不需另外排序
+    "CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS analyses_category ON analyses (category, id)",
+    "CREATE INDEX IF NOT EXISTS analyses_truthfulness ON analyses (truthfulness, id)",
+    "CREATE INDEX IF NOT EXISTS analyses_importance ON analyses (importance, id)",
+    "CREATE INDEX IF NOT EXISTS analyses_impact ON analyses (impact, id)",
+    "CREATE INDEX IF NOT EXISTS analyses_content_hash ON analyses (content_hash)",
+    "CREATE INDEX IF NOT EXISTS analyses_url ON analyses (url)",
+    "CREATE INDEX IF NOT EXISTS analyses_domain ON analyses (domain, id)",
+    # 外部內容的 FTS5 表，只存索引不重複存摘要；以觸發器與主表同步
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+        summary, content='analyses', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS analyses_fts_insert AFTER INSERT ON analyses BEGIN
+        INSERT INTO analyses_fts (rowid, summary) VALUES (new.id, new.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS analyses_fts_delete AFTER DELETE ON analyses BEGIN
+        INSERT INTO analyses_fts (analyses_fts, rowid, summary)
+        VALUES ('delete', old.id, old.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS analyses_mentions_delete AFTER DELETE ON analyses BEGIN
+        DELETE FROM entity_mentions WHERE analysis_id = old.id;
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entities (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (kind, name)
+    )
+    """,
+)
+
+# 提及表另外建立，才能判斷舊資料庫是否需要補建實體索引
+_MENTIONS_SCHEMA = """
+    CREATE TABLE entity_mentions (
+        analysis_id INTEGER NOT NULL,
+        entity_id INTEGER NOT NULL,
+        PRIMARY KEY (analysis_id, entity_id)
+    ) WITHOUT ROWID
+"""
+
+
+def content_hash(content):
+    """正規化內容的 SHA-256，同一篇文章重複分析時雜湊相同"""
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def url_domain(url):
+    """網址的網域（去除 www.），沒有網址時為 None"""
+    if not url:
+        return None
+    host = urlsplit(url).hostname or url
+    return host[4:] if host.startswith("www.") else host
+
+
+def mention_names(entities):
+    """從分析結果的實體取出 (類別, 名稱)，只取 MENTION_KINDS 且去除重複"""
+    names = []
+    for kind in MENTION_KINDS:
+        for item in (entities or {}).get(kind) or []:
+            name = item.get("name") if isinstance(item, dict) else item
+            if isinstance(name, str) and name.strip() and (kind, name.strip()) not in names:
+                names.append((kind, name.strip()))
+    return names
+
+
+def _match_expression(terms):
+    """FTS5 查詢：每個詞加上引號視為片語，所有詞都須出現"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class HistoryStore:
+    """以 SQLite 儲存的分析歷史，支援條件篩選、全文搜尋與 keyset 分頁"""
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA[:1]:
+            self._conn.execute(statement)
+        self._migrate()
+        for statement in _SCHEMA[1:]:
+            self._conn.execute(statement)
+        has_mentions = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'entity_mentions'").fetchone()
+        if not has_mentions:
+            self._conn.execute(_MENTIONS_SCHEMA)
+            for analysis_id, entities in self._conn.execute(
+                    "SELECT id, entities FROM analyses").fetchall():
+                self._index_entities(analysis_id, json.loads(entities or "{}"))
+        self._conn.commit()
+
+    def _migrate(self):
+        """補上較早建立的資料庫缺少的網域欄位"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(analyses)")]
+        if "domain" in columns:
+            return
+        self._conn.execute("ALTER TABLE analyses ADD COLUMN domain TEXT")
+        self._conn.executemany(
+            "UPDATE analyses SET domain = ? WHERE id = ?",
+            [(url_domain(url), analysis_id) for analysis_id, url in self._conn.execute(
+                "SELECT id, url FROM analyses WHERE url IS NOT NULL").fetchall()],
+        )
+
+    def record(self, content, analysis, url=None, model=None, timings=None):
+        """記錄一次分析結果，返回記錄 id"""
+        drink = analysis.get("drink_recommendation") or {}
+        payload = zlib.compress(json.dumps(analysis, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            # 在鎖內取時間，id 與 created_at 的順序一致
+            cursor = self._conn.execute(
+                "INSERT INTO analyses (created_at, url, domain, content_hash, model, truthfulness, "
+                "importance, impact, category, summary, entities, timings, analysis) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), url, url_domain(url), content_hash(content), model,
+                 *(analysis.get(field) for field in SCORE_FIELDS),
+                 drink.get("category"), analysis.get("summary") or "",
+                 json.dumps(analysis.get("entities") or {}, ensure_ascii=False),
+                 json.dumps(timings or {}, ensure_ascii=False), payload),
+            )
+            self._index_entities(cursor.lastrowid, analysis.get("entities"))
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def _index_entities(self, analysis_id, entities):
+        names = mention_names(entities)
+        self._conn.executemany("INSERT OR IGNORE INTO entities (kind, name) VALUES (?, ?)", names)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO entity_mentions (analysis_id, entity_id) "
+            "SELECT ?, id FROM entities WHERE kind = ? AND name = ?",
+            [(analysis_id, kind, name) for kind, name in names],
+        )
+
+    def query(self, category=None, since=None, until=None, scores=None, search=None,
+              after=None, limit=20):
+        """
+        依條件查詢歷史記錄，由新到舊排序
+
+        since / until 為時間戳記（含 since、不含 until）；scores 為 {欄位: (下限, 上限)}，
+        上下限可為 None；search 以空白分隔多個詞，所有詞都須出現在摘要中；
+        after 為上一頁返回的游標。返回 (記錄列表, 下一頁游標)，沒有下一頁時游標為 None。
+        """
+        clauses, params = [], []
+        if category:
+            clauses.append("a.category = ?")
+            params.append(category)
+        for field, (low, high) in (scores or {}).items():
+            if field not in SCORE_FIELDS:
+                raise ValueError(f"未知的評分欄位: {field}")
+            if low is not None:
+                clauses.append(f"a.{field} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"a.{field} <= ?")
+                params.append(high)
+        terms = (search or "").split()
+        long_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+        for term in terms:
+            if len(term) < MIN_MATCH_LENGTH:
+                clauses.append("a.summary LIKE ? ESCAPE '\\'")
+                params.append(f"%{_escape_like(term)}%")
+
+        with self._lock:
+            low_id, high_id = self._id_range(since, until)
+            if after is not None:
+                high_id = after if high_id is None else min(high_id, after)
+            if low_id is not None:
+                clauses.append("a.id >= ?")
+                params.append(low_id)
+            if high_id is not None:
+                clauses.append("a.id < ?")
+                params.append(high_id)
+
+            columns = ", ".join(f"a.{column}" for column in _COLUMNS)
+            if long_terms:
+                # 由 FTS5 依 rowid 由大到小產生候選，其餘條件逐筆過濾
+                sql = (f"SELECT {columns} FROM analyses_fts JOIN analyses a "
+                       "ON a.id = analyses_fts.rowid WHERE analyses_fts MATCH ?")
+                params.insert(0, _match_expression(long_terms))
+                clauses = [clause.replace("a.id", "analyses_fts.rowid") for clause in clauses]
+                order = "analyses_fts.rowid"
+            else:
+                sql = f"SELECT {columns} FROM analyses a WHERE 1"
+                order = "a.id"
+            sql += "".join(f" AND {clause}" for clause in clauses)
+            rows = self._conn.execute(f"{sql} ORDER BY {order} DESC LIMIT ?",
+                                      params + [limit + 1]).fetchall()
+
+        records = [self._to_record(row) for row in rows[:limit]]
+        cursor = records[-1]["id"] if len(rows) > limit else None
+        return records, cursor
+
+    def _id_range(self, since, until):
+        """
+        把時間範圍換算成 id 範圍 [low, high)，沒有限制的一側為 None
+
+        記錄依時間附加，created_at 隨 id 遞增，只需在時間索引上找到邊界的第一筆。
+        """
+        def first_id_from(timestamp):
+            row = self._conn.execute(
+                "SELECT id FROM analyses WHERE created_at >= ? ORDER BY created_at, id LIMIT 1",
+                (timestamp,),
+            ).fetchone()
+            return row[0] if row else None
+
+        low = high = None
+        if since is not None:
+            # 沒有任何記錄晚於 since 時以不存在的 id 作為下限
+            low = first_id_from(since)
+            low = float("inf") if low is None else low
+        if until is not None:
+            high = first_id_from(until)
+        return low, high
+
+    def get(self, record_id):
+        """取得單筆記錄與完整的分析結果，不存在時返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)}, analysis FROM analyses WHERE id = ?",
+                (record_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        record = self._to_record(row[:-1])
+        record["analysis"] = json.loads(zlib.decompress(row[-1]))
+        return record
+
+    def scan(self, since=None, until=None, include_rules=False):
+        """
+        依 id 順序讀出時間範圍內的數值欄位，供趨勢分析轉成列式陣列
+
+        返回 dict：rows 為 (id, created_at, domain, category, 三項分數) 列表，
+        mentions 為 (analysis_id, entity_id) 列表，entities 為 {entity_id: (類別, 名稱)}。
+        include_rules=False 時排除本機規則判定的記錄（分數為暫定值）。
+        """
+        with self._lock:
+            low, high = self._id_range(since, until)
+            bounds, params = "", []
+            if low is not None:
+                bounds += " AND {column} >= ?"
+                params.append(low)
+            if high is not None:
+                bounds += " AND {column} < ?"
+                params.append(high)
+            row_filter, mention_filter = "", ""
+            row_params, mention_params = list(params), list(params)
+            if not include_rules:
+                row_filter = " AND model IS NOT ?"
+                row_params.append(RULES_MODEL)
+                mention_filter = (" AND analysis_id NOT IN (SELECT id FROM analyses "
+                                  f"WHERE model = ?{bounds.format(column='id')})")
+                mention_params += [RULES_MODEL, *params]
+            rows = self._conn.execute(
+                f"SELECT id, created_at, domain, category, {', '.join(SCORE_FIELDS)} "
+                f"FROM analyses WHERE 1{bounds.format(column='id')}{row_filter} ORDER BY id",
+                row_params,
+            ).fetchall()
+            mentions = self._conn.execute(
+                "SELECT analysis_id, entity_id FROM entity_mentions "
+                f"WHERE 1{bounds.format(column='analysis_id')}{mention_filter}",
+                mention_params,
+            ).fetchall()
+            entities = self._conn.execute(
+                "SELECT id, kind, name FROM entities WHERE id IN ("
+                "SELECT DISTINCT entity_id FROM entity_mentions "
+                f"WHERE 1{bounds.format(column='analysis_id')}{mention_filter})",
+                mention_params,
+            ).fetchall()
+        return {"rows": rows, "mentions": mentions,
+                "entities": {entity_id: (kind, name) for entity_id, kind, name in entities}}
+
+    @staticmethod
+    def _to_record(row):
+        record = dict(zip(_COLUMNS, row))
+        record["entities"] = json.loads(record["entities"] or "{}")
+        record["timings"] = json.loads(record["timings"] or "{}")
+        return record
+
+    def latest_id(self):
+        """最新一筆記錄的 id（沒有記錄時為 0），有新記錄寫入即改變，可作為快取鍵"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM analyses").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """取得行程共用的歷史記錄"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
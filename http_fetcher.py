@@ -0,0 +1,325 @@
+"""
+純 HTTP 文章抓取
+
+大多數新聞網站由伺服器端渲染，不需要無頭瀏覽器即可取得內文。
+本模組以共用連線池的 requests.Session 取得靜態 HTML，
+並以與 Playwright 路徑相同的選擇器擷取文章文字，
+同時偵測需要前端渲染的頁面，讓呼叫端決定是否升級到瀏覽器抓取。
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache_store import get_cache
+
+# 抓取內容快取：TTL 內直接使用，過期後以 ETag / Last-Modified 做條件式重新驗證
+CONTENT_CACHE_TTL = int(os.getenv("CONTENT_CACHE_TTL", "1800"))
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36 NewsAnalyzer/2.1"
+)
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+SKIP_ELEMENTS = {"script", "style", "noscript", "template", "svg", "iframe", "title"}
+BLOCK_ELEMENTS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5",
+    "h6", "header", "li", "main", "nav", "ol", "p", "pre", "section",
+    "table", "tr", "ul",
+}
+
+# 不影響頁面內容的追蹤用查詢參數，正規化網址時移除
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga"}
+
+# 前端框架常見的掛載點，若在靜態 HTML 中是空的代表內容由 JavaScript 產生
+SPA_ROOT_IDS = {"root", "app", "__next", "__nuxt", "___gatsby"}
+NOSCRIPT_HINT = re.compile(r"javascript|啟用|開啟|enable", re.IGNORECASE)
+
+_session = None
+_session_lock = threading.Lock()
+
+_tier_counts = Counter()
+_tier_lock = threading.Lock()
+
+
+def get_http_session():
+    """取得行程共用、具連線池的 HTTP session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
+            })
+            _session = session
+        return _session
+
+
+def canonical_url(url):
+    """
+    正規化網址作為快取鍵
+
+    小寫 scheme 與主機、移除預設連接埠、片段與追蹤參數（utm_* 等），
+    查詢參數依名稱排序，路徑結尾的斜線一併移除。
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def get_content_cache():
+    """取得行程共用的抓取內容快取"""
+    return get_cache(
+        "content", default_ttl=CONTENT_CACHE_TTL, max_bytes=CONTENT_CACHE_MAX_BYTES
+    )
+
+
+def conditional_headers(cached):
+    """依快取的驗證資訊組出條件式請求標頭"""
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _parse_selector(selector):
+    """解析簡單選擇器（tag、.class、#id），不支援的語法回傳 None"""
+    selector = selector.strip()
+    if re.fullmatch(r"[a-zA-Z][a-zA-Z0-9-]*", selector):
+        return ("tag", selector.lower())
+    if re.fullmatch(r"\.[a-zA-Z_][\w-]*", selector):
+        return ("class", selector[1:])
+    if re.fullmatch(r"#[a-zA-Z_][\w-]*", selector):
+        return ("id", selector[1:])
+    return None
+
+
+def _normalize_text(parts):
+    lines = []
+    for line in "".join(parts).split("\n"):
+        line = re.sub(r"[ \t\r\f\v\u00a0]+", " ", line).strip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class SelectorTextParser(HTMLParser):
+    """
+    單次掃描 HTML，收集每個選擇器第一個符合元素的可見文字
+
+    行為近似 Playwright 的 query_selector + inner_text：
+    區塊元素之間換行，略過 script/style 等不可見內容。
+    """
+
+    def __init__(self, selectors):
+        super().__init__(convert_charrefs=True)
+        self.matchers = [(s, _parse_selector(s)) for s in selectors]
+        self.stack = []
+        self.active = {}
+        self.texts = {}
+        self.skip_depth = 0
+        self.visible_chars = 0
+        self.script_count = 0
+        self.empty_spa_root = False
+        self.noscript_hint = False
+        self._spa_roots = []
+        self._in_noscript = 0
+
+    def _matches(self, matcher, tag, attrs):
+        kind, value = matcher
+        if kind == "tag":
+            return tag == value
+        if kind == "id":
+            return attrs.get("id") == value
+        return value in (attrs.get("class") or "").split()
+
+    def _newline(self):
+        for parts in self.active.values():
+            parts.append("\n")
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script":
+            self.script_count += 1
+        if tag == "br":
+            self._newline()
+        if tag in VOID_ELEMENTS:
+            return
+
+        started = []
+        if not self.skip_depth:
+            for selector, matcher in self.matchers:
+                if (matcher and selector not in self.texts
+                        and selector not in self.active
+                        and self._matches(matcher, tag, attrs)):
+                    self.active[selector] = []
+                    started.append(selector)
+
+        spa_root = attrs.get("id") in SPA_ROOT_IDS
+        if spa_root:
+            self._spa_roots.append(self.visible_chars)
+        if tag == "noscript":
+            self._in_noscript += 1
+        if tag in SKIP_ELEMENTS:
+            self.skip_depth += 1
+        if tag in BLOCK_ELEMENTS:
+            self._newline()
+        self.stack.append((tag, started, spa_root))
+
+    def handle_endtag(self, tag):
+        if not any(entry[0] == tag for entry in self.stack):
+            return
+        while self.stack:
+            open_tag, started, spa_root = self.stack.pop()
+            self._close(open_tag, started, spa_root)
+            if open_tag == tag:
+                break
+
+    def _close(self, tag, started, spa_root):
+        if tag in SKIP_ELEMENTS:
+            self.skip_depth -= 1
+        if tag == "noscript":
+            self._in_noscript -= 1
+        if tag in BLOCK_ELEMENTS:
+            self._newline()
+        if spa_root:
+            chars_before = self._spa_roots.pop()
+            if self.visible_chars == chars_before:
+                self.empty_spa_root = True
+        for selector in started:
+            self.texts[selector] = _normalize_text(self.active.pop(selector))
+
+    def handle_data(self, data):
+        if self._in_noscript and NOSCRIPT_HINT.search(data):
+            self.noscript_hint = True
+        if self.skip_depth:
+            return
+        self.visible_chars += len(data.strip())
+        for parts in self.active.values():
+            parts.append(data)
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self._close(*self.stack.pop())
+
+
+def pick_article_text(texts, selectors, min_length):
+    """
+    挑選文章內容：依選擇器順序取第一個超過最低長度者，否則取最長的文字區塊
+
+    與瀏覽器端的單次 page.evaluate 評分規則相同。
+    """
+    found = [(s, texts[s]) for s in selectors if texts.get(s)]
+    for selector, text in found:
+        if len(text) > min_length:
+            return selector, text
+    if found:
+        return max(found, key=lambda item: len(item[1]))
+    return None, ""
+
+
+def extract_article(html, selectors, min_length):
+    """從靜態 HTML 擷取文章內容並判斷是否為前端渲染頁面"""
+    parser = SelectorTextParser(selectors)
+    parser.feed(html)
+    parser.close()
+
+    selector, text = pick_article_text(parser.texts, selectors, min_length)
+    client_rendered = parser.empty_spa_root or parser.noscript_hint or (
+        parser.visible_chars < min_length and parser.script_count > 0
+    )
+    return {"selector": selector, "text": text, "client_rendered": client_rendered}
+
+
+def fetch_static_article(url, selectors, min_length, timeout=10, headers=None):
+    """
+    以純 HTTP GET 抓取文章
+
+    回傳 dict：status、text、selector、client_rendered、etag、last_modified、
+    elapsed_ms；失敗時包含 error 欄位且 text 為空字串。
+    """
+    started = time.perf_counter()
+    result = {
+        "status": None,
+        "text": "",
+        "selector": None,
+        "client_rendered": False,
+        "etag": None,
+        "last_modified": None,
+    }
+    try:
+        response = get_http_session().get(url, headers=headers, timeout=timeout)
+        result["status"] = response.status_code
+        result["etag"] = response.headers.get("ETag")
+        result["last_modified"] = response.headers.get("Last-Modified")
+
+        if response.status_code == 304:
+            return result
+        if response.status_code != 200:
+            result["error"] = f"HTTP {response.status_code}"
+            return result
+
+        content_type = response.headers.get("Content-Type", "")
+        if "html" not in content_type:
+            result["error"] = f"非 HTML 內容: {content_type}"
+            return result
+
+        # 未宣告編碼時 requests 預設為 ISO-8859-1，中文網站需改用偵測結果
+        if response.encoding is None or response.encoding.lower() == "iso-8859-1":
+            response.encoding = response.apparent_encoding
+        result.update(extract_article(response.text, selectors, min_length))
+
+    except requests.exceptions.RequestException as e:
+        result["error"] = str(e)
+    finally:
+        result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def record_fetch_tier(tier):
+    """記錄一次抓取由哪一層提供（cache、http、browser、failed）"""
+    with _tier_lock:
+        _tier_counts[tier] += 1
+
+
+def fetch_tier_stats():
+    """回傳各抓取層的次數與 HTTP 層命中率"""
+    with _tier_lock:
+        stats = dict(_tier_counts)
+    served = stats.get("http", 0) + stats.get("browser", 0)
+    stats["http_hit_rate"] = stats.get("http", 0) / served if served else 0.0
+    return stats
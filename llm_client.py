@@ -0,0 +1,102 @@
+"""
+共用的 Anthropic 非同步客戶端
+
+Streamlit 每次按下按鈕都會建立新的 NewsAnalyzer，若每次都建立新的客戶端，
+每次分析都要重新建立 HTTP 連線池與 TLS 交握。本模組在行程層級依 API Key（與 base_url）
+快取 AsyncAnthropic 客戶端，請求一律在背景事件迴圈上發出，連線可跨 session 與 rerun
+保持 keep-alive 重用。SDK 內建的重試已停用，改由 llm_retry 依分析期限重試。
+
+環境變數：
+- ANTHROPIC_MAX_CONNECTIONS: 每個客戶端的最大連線數（預設 20）
+- ANTHROPIC_KEEPALIVE_CONNECTIONS: 保留的閒置連線數（預設 10）
+- ANTHROPIC_KEEPALIVE_EXPIRY: 閒置連線保留秒數（預設 60）
+"""
+
+import atexit
+import hashlib
+import os
+import threading
+
+import anthropic
+
+from background_loop import get_background_loop
+
+MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", "60"))
+
+# 與 SDK 使用同一個 HTTP 套件的連線上限型別
+Limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+
+
+class AsyncClientPool:
+    """依 (API Key, base_url) 快取的 AsyncAnthropic 客戶端，只在背景事件迴圈上使用"""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS,
+                 keepalive_connections=KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY, runtime=None):
+        self.limits = Limits(max_connections=max_connections,
+                             max_keepalive_connections=min(keepalive_connections,
+                                                           max_connections),
+                             keepalive_expiry=keepalive_expiry)
+        self._runtime = runtime or get_background_loop()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0}
+
+    @staticmethod
+    def _key(api_key, base_url):
+        # 以雜湊作為鍵，統計與除錯輸出不會帶出 API Key
+        base_url = base_url or os.getenv("ANTHROPIC_BASE_URL") or ""
+        return hashlib.sha256(f"{api_key}\0{base_url}".encode("utf-8")).hexdigest()
+
+    def get(self, api_key, base_url=None):
+        """取得共用客戶端，不存在時建立"""
+        key = self._key(api_key, base_url)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._stats["reused"] += 1
+                return client
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key, base_url=base_url, max_retries=0,
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=self.limits))
+            self._clients[key] = client
+            self._stats["created"] += 1
+            return client
+
+    def stats(self):
+        """回傳客戶端數量與建立、重用次數"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["clients"] = len(self._clients)
+        return stats
+
+    def close(self):
+        """關閉所有客戶端的連線池"""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                self._runtime.run_sync(client.close(), timeout=5)
+            except Exception as e:
+                print(f"關閉 Claude 客戶端失敗: {str(e)}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    """取得行程共用的客戶端池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AsyncClientPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def get_async_client(api_key, base_url=None):
+    """取得 API Key 對應的共用 AsyncAnthropic 客戶端"""
+    return get_client_pool().get(api_key, base_url)
@@ -0,0 +1,281 @@
+"""
+模型輸出的 JSON 解析
+
+模型回應可能在 JSON 前後夾帶說明文字，也可能因 max_tokens 在中途截斷。
+extract_json_object 單次掃描、以括號配對取出第一個完整的最外層物件，
+截斷時退回最後一個完整的值並補上結尾括號；parse_llm_json 再依 schema 驗證必要欄位，
+並記錄解析結果的統計，讓無法使用的付費回應有跡可循。
+
+串流模式下，模型輸出是一段一段送達的 JSON 文字。
+IncrementalJSONParser 逐字掃描（每個字元只看一次），
+在最外層物件的欄位值結束時立即解析該欄位，
+並可取出正在輸出中的字串欄位（例如摘要）目前已收到的部分，讓介面逐步顯示。
+"""
+
+import json
+import re
+import threading
+from collections import Counter, deque
+
+# 保留最近幾筆解析失敗的細節供診斷
+RECENT_FAILURES = 20
+
+_parse_counts = Counter()
+_recent_failures = deque(maxlen=RECENT_FAILURES)
+_parse_lock = threading.Lock()
+
+# 尚未收完的跳脫序列：結尾落單的反斜線，或不完整的 \uXXXX
+INCOMPLETE_ESCAPE = re.compile(r"(?<!\\)((?:\\\\)*)\\(u[0-9a-fA-F]{0,3})?$")
+
+
+def decode_partial_string(raw):
+    """解碼尚未結束的 JSON 字串內容（不含開頭引號），略過結尾不完整的跳脫序列"""
+    match = INCOMPLETE_ESCAPE.search(raw)
+    if match:
+        raw = raw[:match.start() + len(match.group(1))]
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+
+def extract_json_object(text):
+    """
+    單次掃描取出第一個可解析的最外層 JSON 物件
+
+    字串內的括號不計入配對，物件之後的文字（即使含有括號）不影響結果。
+    輸出在物件中途截斷時，退回最後一個完整的值並補上未閉合的括號。
+    返回 (物件, 是否經過截斷修復)，找不到時返回 (None, False)。
+    """
+    start = None
+    stack = []
+    in_string = escape = key_string = expect_key = False
+    boundary = None
+
+    for i, c in enumerate(text):
+        if start is None:
+            if c == "{":
+                start, stack, expect_key, boundary = i, ["}"], True, None
+            continue
+
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+                if not key_string:
+                    boundary = (i + 1, tuple(stack))
+            continue
+
+        if c == '"':
+            in_string = True
+            key_string = expect_key and stack[-1] == "}"
+        elif c == ":":
+            expect_key = False
+        elif c == ",":
+            # 逗號之前的值必定完整，截斷時可以從這裡切斷
+            boundary = (i, tuple(stack))
+            expect_key = stack[-1] == "}"
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+            expect_key = c == "{"
+        elif c in "}]":
+            stack.pop()
+            expect_key = False
+            if not stack:
+                try:
+                    return json.loads(text[start:i + 1]), False
+                except ValueError:
+                    # 不是合法 JSON（例如說明文字中的大括號），繼續找下一個物件
+                    start = None
+                    continue
+            boundary = (i + 1, tuple(stack))
+
+    if start is not None and boundary is not None:
+        end, open_brackets = boundary
+        try:
+            return json.loads(text[start:end] + "".join(reversed(open_brackets))), True
+        except ValueError:
+            pass
+    return None, False
+
+
+def validate_fields(value, schema, prefix=""):
+    """
+    依 schema 檢查必要欄位，返回問題描述列表（空列表代表通過）
+
+    schema 為 欄位名稱 → 型別（或型別 tuple），值為 dict 時表示巢狀物件。
+    """
+    if not isinstance(value, dict):
+        return [f"{prefix or '結果'} 不是物件"]
+    problems = []
+    for key, expected in schema.items():
+        name = f"{prefix}{key}"
+        if key not in value:
+            problems.append(f"缺少 {name}")
+        elif isinstance(expected, dict):
+            problems += validate_fields(value[key], expected, prefix=f"{name}.")
+        elif isinstance(value[key], bool) or not isinstance(value[key], expected):
+            problems.append(f"{name} 型別錯誤")
+    return problems
+
+
+def parse_llm_json(text, schema=None):
+    """
+    從模型回應解析 JSON 物件並驗證必要欄位
+
+    返回 dict：value（解析結果，失敗時為 None）、repaired（是否修復截斷）、
+    error（失敗原因，成功時為 None）、problems（schema 驗證問題）。
+    """
+    value, repaired = extract_json_object(text)
+    problems = []
+    if value is None:
+        outcome, error = "no_json", "找不到完整的 JSON 物件"
+    else:
+        problems = validate_fields(value, schema) if schema else []
+        if problems:
+            outcome, error = "invalid", "；".join(problems)
+        else:
+            outcome, error = ("repaired" if repaired else "ok"), None
+
+    record_parse_outcome(outcome, {"repaired": repaired, "problems": problems,
+                                   "length": len(text)})
+    return {"value": value if error is None else None, "repaired": repaired,
+            "error": error, "problems": problems}
+
+
+def record_parse_outcome(outcome, details=None):
+    """記錄一次解析結果（ok、repaired、no_json、invalid），失敗時保留細節"""
+    with _parse_lock:
+        _parse_counts[outcome] += 1
+        if outcome in ("no_json", "invalid"):
+            _recent_failures.append(dict(details or {}, outcome=outcome))
+            print(f"分析結果解析失敗: {json.dumps(_recent_failures[-1], ensure_ascii=False)}")
+
+
+def parse_stats():
+    """回傳各解析結果的次數、失敗率與最近的失敗細節"""
+    with _parse_lock:
+        stats = dict(_parse_counts)
+        failures = list(_recent_failures)
+    total = sum(stats.values())
+    failed = stats.get("no_json", 0) + stats.get("invalid", 0)
+    stats["failure_rate"] = failed / total if total else 0.0
+    stats["recent_failures"] = failures
+    return stats
+
+
+class IncrementalJSONParser:
+    """
+    逐段餵入模型輸出，解析最外層 JSON 物件中已完成的欄位
+
+    物件開頭之前的文字（例如模型的前言）會被略過；
+    無法解析的欄位值記錄在 errors，不影響其他欄位。
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.errors = {}
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._state = "key"
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    @property
+    def text(self):
+        """目前收到的完整文字"""
+        return self._text
+
+    def feed(self, chunk):
+        """餵入一段文字，返回這次新完成的欄位名稱列表"""
+        self._text += chunk
+        completed = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            key = self._step(text, i)
+            if key is not None:
+                completed.append(key)
+        self._pos = len(text)
+        return completed
+
+    def _step(self, text, i):
+        c = text[i]
+        if not self._started:
+            if c == "{":
+                self._started = True
+                self._depth = 1
+            return None
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._depth == 1 and self._state == "key_string":
+                    self._key = json.loads(text[self._key_start:i + 1])
+                    self._state = "colon"
+            return None
+
+        if c == '"':
+            self._in_string = True
+            if self._depth == 1 and self._state == "key":
+                self._key_start = i
+                self._state = "key_string"
+                return None
+            if self._depth == 1 and self._state == "value_wait":
+                self._value_start = i
+                self._state = "value"
+            return None
+
+        if self._depth == 1:
+            if self._state == "colon":
+                if c == ":":
+                    self._state = "value_wait"
+                return None
+            if self._state == "value_wait" and not c.isspace():
+                self._value_start = i
+                self._state = "value"
+
+        if c in "{[":
+            self._depth += 1
+        elif c in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                self.done = True
+                if self._state == "value":
+                    return self._finish_value(text, i)
+        elif c == "," and self._depth == 1 and self._state == "value":
+            key = self._finish_value(text, i)
+            self._state = "key"
+            return key
+        return None
+
+    def _finish_value(self, text, end):
+        raw = text[self._value_start:end].strip()
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except ValueError as e:
+            self.errors[self._key] = str(e)
+            return None
+        return self._key
+
+    @property
+    def partial_field(self):
+        """正在輸出中的最外層字串欄位，返回 (欄位名稱, 目前內容)，沒有時返回 None"""
+        if (self.done or not self._in_string or self._depth != 1
+                or self._state != "value"):
+            return None
+        return self._key, decode_partial_string(self._text[self._value_start + 1:])
@@ -0,0 +1,171 @@
+"""
+Claude 呼叫的期限、重試與對沖請求
+
+每次分析有固定的延遲預算（期限），在期限內：
+- 429、5xx 與 overloaded（529）錯誤以帶抖動的指數退避重試，伺服器提供 retry-after 時依其等待；
+  剩餘時間不足以等待時直接放棄
+- 單次嘗試超過對沖門檻仍未回應時，送出第二個相同請求，採用先成功者並取消另一個
+
+對沖門檻預設為該模型單次嘗試耗時的 p95（樣本數足夠後才啟用），也可指定固定秒數。
+
+環境變數：
+- ANALYSIS_DEADLINE: 每次分析的期限秒數（預設 60）
+- ANALYSIS_MAX_ATTEMPTS: 最多嘗試次數（含第一次，預設 4）
+- ANALYSIS_HEDGE_AFTER: 對沖門檻，p95（預設）、秒數，或 0 / off 停用
+"""
+
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import anthropic
+
+from metrics import get_metrics
+
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", "60"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "4"))
+ANALYSIS_HEDGE_AFTER = os.getenv("ANALYSIS_HEDGE_AFTER", "p95")
+
+# 退避的起始與最大等待秒數
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# 以 p95 作為對沖門檻時所需的最少樣本數，樣本不足時不對沖
+HEDGE_MIN_SAMPLES = 20
+
+# 單次嘗試耗時記錄的階段名稱（對沖門檻的依據）
+ATTEMPT_STAGE = "claude_attempt"
+
+
+class DeadlineExceeded(Exception):
+    """超過分析期限"""
+
+
+def is_retryable(error):
+    """判斷錯誤是否值得重試：連線錯誤、逾時、429 與 5xx（含 529 overloaded）"""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_after(error):
+    """取出錯誤回應中 retry-after-ms / retry-after 指定的等待秒數，沒有時返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(retry, error=None, rand=random.random):
+    """第 retry 次重試前的等待秒數：有 retry-after 時依其等待，否則為 full jitter 指數退避"""
+    delay = retry_after(error) if error is not None else None
+    if delay is not None:
+        return delay
+    return rand() * min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** retry)
+
+
+def hedge_threshold(model_name, setting=None):
+    """依設定決定對沖門檻秒數，None 表示不對沖"""
+    setting = str(ANALYSIS_HEDGE_AFTER if setting is None else setting).strip().lower()
+    if setting in ("", "0", "off", "none"):
+        return None
+    if setting == "p95":
+        return get_metrics().quantile(ATTEMPT_STAGE, 0.95, min_samples=HEDGE_MIN_SAMPLES,
+                                      model=model_name)
+    return float(setting)
+
+
+async def hedged(attempt, timeout, hedge_after=None, clock=time.monotonic):
+    """
+    執行 attempt(剩餘秒數)，超過 hedge_after 秒未完成時再送出一次
+
+    返回 (結果, 勝出者, 是否送出對沖請求)，勝出者為 "primary" 或 "hedge"，另一個請求會被取消。
+    兩者都失敗時引發後完成者的錯誤，超過 timeout 秒引發 DeadlineExceeded。
+    """
+    started = clock()
+
+    def remaining():
+        return timeout - (clock() - started)
+
+    tasks = {asyncio.ensure_future(attempt(timeout)): "primary"}
+    pending = set(tasks)
+    error = None
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks[task], False
+                error = task.exception()
+            if pending:
+                hedge = asyncio.ensure_future(attempt(remaining()))
+                tasks[hedge] = "hedge"
+                pending.add(hedge)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, remaining()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"超過 {timeout:g} 秒期限")
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks[task], len(tasks) > 1
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_deadline(attempt, deadline=ANALYSIS_DEADLINE,
+                             max_attempts=ANALYSIS_MAX_ATTEMPTS, hedge_after=None,
+                             labels=None, sleep=asyncio.sleep, clock=time.monotonic,
+                             rand=random.random):
+    """
+    在期限內呼叫 attempt(剩餘秒數)，可重試的錯誤依退避重試，每輪可對沖
+
+    返回 (結果, 呼叫資訊)，呼叫資訊含 retries（重試次數）、hedged（是否送出對沖請求）、
+    winner（勝出的請求）。不可重試的錯誤、次數用盡或剩餘時間不足以等待時引發最後的錯誤。
+    每次嘗試的耗時以 labels 為標籤記入指標。
+    """
+    started = clock()
+    info = {"retries": 0, "hedged": False, "winner": None}
+
+    async def timed_attempt(timeout):
+        # 成功的嘗試（含對沖）耗時記入指標，作為之後的對沖門檻依據；被取消的不計
+        attempt_started = clock()
+        result = await attempt(timeout)
+        get_metrics().observe(ATTEMPT_STAGE, clock() - attempt_started, **(labels or {}))
+        return result
+
+    for retry in range(max_attempts):
+        remaining = deadline - (clock() - started)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"超過 {deadline:g} 秒期限")
+        try:
+            result, info["winner"], hedge_sent = await hedged(
+                timed_attempt, remaining, hedge_after, clock)
+            info["hedged"] = info["hedged"] or hedge_sent
+            return result, info
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not is_retryable(e) or retry == max_attempts - 1:
+                raise
+            delay = backoff_delay(retry, e, rand)
+            if delay >= deadline - (clock() - started):
+                raise
+            print(f"Claude API 暫時錯誤，{delay:.1f} 秒後重試: {str(e)}")
+            info["retries"] += 1
+            await sleep(delay)
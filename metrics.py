@@ -0,0 +1,249 @@
+"""
+效能與用量指標
+
+在行程內彙整各階段（網頁抓取、Claude 分析、地點查詢）的耗時與 Claude token 用量，
+耗時以最近的樣本計算 p50/p95/p99，並可輸出為 Prometheus 文字格式的檔案
+（供 node_exporter textfile collector 等收集），或顯示在 Streamlit 的診斷面板。
+
+環境變數：
+- METRICS_FILE: Prometheus 指標檔路徑（預設為快取目錄下的 metrics.prom，設為空字串停用）
+- METRICS_WRITE_INTERVAL: 指標檔最短寫入間隔秒數（預設 10）
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from cache_store import DEFAULT_CACHE_DIR
+
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(DEFAULT_CACHE_DIR, "metrics.prom"))
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "10"))
+
+# 每個階段保留最近的樣本數，用於計算分位數
+SAMPLE_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 每百萬 token 的美元價格：(輸入, 輸出, 快取寫入, 快取讀取)，依模型名稱關鍵字比對
+MODEL_PRICES = {
+    "opus": (15.0, 75.0, 18.75, 1.50),
+    "sonnet": (3.0, 15.0, 3.75, 0.30),
+    "haiku": (0.80, 4.0, 1.0, 0.08),
+}
+
+# Message Batches API 的價格折扣
+BATCH_DISCOUNT = 0.5
+
+PREFIX = "news_analyzer"
+
+
+def percentile(sorted_samples, q):
+    """以最近排名法計算已排序樣本的分位數"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(q * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def estimate_cost(model_name, usage, batch=False):
+    """依模型價格估算一次呼叫的美元費用（batch=True 時套用批次折扣），未知模型返回 None"""
+    for keyword, prices in MODEL_PRICES.items():
+        if keyword in model_name:
+            input_price, output_price, write_price, read_price = prices
+            cost = (usage.get("input_tokens", 0) * input_price
+                    + usage.get("output_tokens", 0) * output_price
+                    + usage.get("cache_creation_input_tokens", 0) * write_price
+                    + usage.get("cache_read_input_tokens", 0) * read_price) / 1_000_000
+            return cost * BATCH_DISCOUNT if batch else cost
+    return None
+
+
+class MetricsRegistry:
+    """執行緒安全的指標彙整"""
+
+    def __init__(self, path=METRICS_FILE, write_interval=METRICS_WRITE_INTERVAL,
+                 clock=time.monotonic):
+        self.path = path
+        self.write_interval = write_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._sums = Counter()
+        self._counts = Counter()
+        self._errors = Counter()
+        self._tokens = Counter()
+        self._cost = Counter()
+        self._last_write = None
+
+    @staticmethod
+    def _key(stage, labels):
+        return (stage, tuple(sorted(labels.items())))
+
+    def observe(self, stage, seconds, error=False, **labels):
+        """記錄一次階段耗時（秒）"""
+        key = self._key(stage, labels)
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=SAMPLE_WINDOW)).append(seconds)
+            self._sums[key] += seconds
+            self._counts[key] += 1
+            if error:
+                self._errors[key] += 1
+        self.maybe_write()
+
+    def quantile(self, stage, q, min_samples=1, **labels):
+        """回傳單一階段與標籤最近樣本的分位數，樣本數不足 min_samples 時返回 None"""
+        with self._lock:
+            values = self._samples.get(self._key(stage, labels))
+            if not values or len(values) < min_samples:
+                return None
+            values = sorted(values)
+        return percentile(values, q)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """計時區塊，發生例外時記為錯誤後重新拋出"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, error=True, **labels)
+            raise
+        self.observe(stage, time.perf_counter() - started, **labels)
+
+    def record_usage(self, model_name, usage, batch=False):
+        """累計一次 Claude 呼叫的 token 用量與估算費用"""
+        cost = estimate_cost(model_name, usage, batch)
+        with self._lock:
+            for kind, value in usage.items():
+                self._tokens[(model_name, kind)] += value
+            if cost is not None:
+                self._cost[model_name] += cost
+        self.maybe_write()
+
+    def snapshot(self):
+        """
+        回傳目前的指標
+
+        dict：stages（每個階段與標籤的 count、errors、mean、p50、p95、p99，單位秒）、
+        tokens（模型 → 種類 → token 數）、cost_usd（模型 → 累計美元）。
+        """
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            sums, counts = dict(self._sums), dict(self._counts)
+            errors = dict(self._errors)
+            tokens, cost = dict(self._tokens), dict(self._cost)
+
+        stages = []
+        for (stage, labels), values in sorted(samples.items()):
+            entry = {"stage": stage, "labels": dict(labels),
+                     "count": counts[(stage, labels)],
+                     "errors": errors.get((stage, labels), 0),
+                     "mean": sums[(stage, labels)] / counts[(stage, labels)]}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = percentile(values, q)
+            stages.append(entry)
+
+        token_totals = {}
+        for (model_name, kind), value in tokens.items():
+            token_totals.setdefault(model_name, {})[kind] = value
+        return {"stages": stages, "tokens": token_totals, "cost_usd": cost}
+
+    def render_prometheus(self):
+        """輸出 Prometheus 文字格式"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds 各處理階段耗時（最近樣本的分位數）",
+            f"# TYPE {PREFIX}_stage_seconds summary",
+        ]
+        for entry in snapshot["stages"]:
+            labels = dict(entry["labels"], stage=entry["stage"])
+            for q in QUANTILES:
+                value = entry[f"p{int(q * 100)}"]
+                lines.append(f"{PREFIX}_stage_seconds{_labels(labels, quantile=q)} {value:.6f}")
+            lines.append(f"{PREFIX}_stage_seconds_sum{_labels(labels)} "
+                         f"{entry['mean'] * entry['count']:.6f}")
+            lines.append(f"{PREFIX}_stage_seconds_count{_labels(labels)} {entry['count']}")
+
+        lines += [f"# HELP {PREFIX}_stage_errors_total 各處理階段的失敗次數",
+                  f"# TYPE {PREFIX}_stage_errors_total counter"]
+        for entry in snapshot["stages"]:
+            labels = dict(entry["labels"], stage=entry["stage"])
+            lines.append(f"{PREFIX}_stage_errors_total{_labels(labels)} {entry['errors']}")
+
+        lines += [f"# HELP {PREFIX}_tokens_total Claude API token 用量",
+                  f"# TYPE {PREFIX}_tokens_total counter"]
+        for model_name, kinds in sorted(snapshot["tokens"].items()):
+            for kind, value in sorted(kinds.items()):
+                lines.append(f"{PREFIX}_tokens_total"
+                             f"{_labels({'model': model_name, 'type': kind})} {value}")
+
+        lines += [f"# HELP {PREFIX}_cost_usd_total Claude API 估算費用（美元）",
+                  f"# TYPE {PREFIX}_cost_usd_total counter"]
+        for model_name, value in sorted(snapshot["cost_usd"].items()):
+            lines.append(f"{PREFIX}_cost_usd_total{_labels({'model': model_name})} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """
+        寫出 Prometheus 指標檔（先寫暫存檔再替換，避免收集端讀到一半的內容）
+
+        暫存檔名含行程與執行緒 id：Streamlit 與批次 CLI 等多個寫入端同時寫同一個檔案時
+        各自寫自己的暫存檔，不會交錯寫出損毀的內容。
+        """
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def maybe_write(self, force=False):
+        """距離上次寫入超過間隔（或 force）時寫出指標檔，寫入失敗不影響主流程"""
+        if not self.path:
+            return
+        now = self._clock()
+        with self._lock:
+            if (not force and self._last_write is not None
+                    and now - self._last_write < self.write_interval):
+                return
+            self._last_write = now
+        try:
+            self.write()
+        except OSError as e:
+            print(f"指標檔寫入失敗: {str(e)}")
+
+
+def _labels(labels, **extra):
+    items = dict(labels, **extra)
+    if not items:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\")
+                         .replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in sorted(items.items())
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """取得行程共用的指標彙整"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+            # 結束前補寫最後一次，避免遺漏寫入間隔內的資料
+            atexit.register(_registry.maybe_write, force=True)
+        return _registry
@@ -0,0 +1,227 @@
+"""
+近似重複文章索引
+
+中央社等通訊社的稿件常被十幾家媒體小幅改寫後轉載，每一份都完整抓取並分析一次。
+本模組為已分析的文章建立 MinHash 簽章：正規化後取字元 n-gram（中文不需斷詞）為 shingle，
+以 numpy 一次計算 120 個雜湊的最小值；簽章切成 20 個 band，各 band 的雜湊作為 LSH 桶，
+存在 SQLite（以桶為主鍵的 WITHOUT ROWID 表）。查詢時一次索引查詢取得同桶的候選文章，
+再以簽章估計 Jaccard 相似度，超過門檻即重用已儲存的分析結果。
+
+百萬篇文章時 LSH 表約兩千萬列，每次查詢只是 20 個主鍵查找加上少量候選簽章比對。
+
+環境變數：
+- DEDUP_INDEX_PATH: 索引資料庫路徑（預設為快取目錄下的 near_duplicates.sqlite3）
+- DEDUP_THRESHOLD: 視為重複的估計相似度下限（預設 0.75）
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from cache_store import DEFAULT_CACHE_DIR
+
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH",
+                             os.path.join(DEFAULT_CACHE_DIR, "near_duplicates.sqlite3"))
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.75"))
+
+# shingle 長度（字元數）、簽章長度與 LSH 切分；band × rows 必須等於簽章長度。
+# 20 × 6 的 S 曲線門檻約為 (1/20)^(1/6) ≈ 0.61：相似度 0.75 的文章有 98% 以上機率成為候選，
+# 同主題但不同寫法（相似度 0.1）的文章成為候選的機率約十萬分之二，候選數不隨索引大小膨脹
+SHINGLE_SIZE = 3
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+
+# 正規化後少於此字數的文章不建立索引（太短的文字容易誤判）
+MIN_TEXT_LENGTH = 50
+
+# 固定種子產生雜湊參數，簽章才能跨行程比較
+_rng = np.random.default_rng(20240601)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_SHINGLE_BASE = np.uint64(1000003)
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text):
+    """全半形統一、轉小寫並移除空白與標點，只留下文字與數字"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """正規化文字的字元 n-gram 雜湊（uint64 陣列），文字過短時為空陣列"""
+    codes = np.frombuffer(normalize_text(text).encode("utf-32-le"), dtype=np.uint32)
+    if len(codes) < max(size, MIN_TEXT_LENGTH):
+        return np.empty(0, dtype=np.uint64)
+    codes = codes.astype(np.uint64)
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes = hashes * _SHINGLE_BASE + codes[offset:offset + count]
+    return np.unique(hashes)
+
+
+def minhash_signature(text):
+    """計算 MinHash 簽章（NUM_PERM 個 uint32），文字過短時返回 None"""
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return None
+    # 乘法雜湊 (a·x + b) mod 2^64 取高 32 位，每個排列取最小值
+    with np.errstate(over="ignore"):
+        mixed = _MULTIPLIERS[:, None] * hashes[None, :] + _OFFSETS[:, None]
+    return (mixed >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    """把簽章切成 BANDS 段，返回各段的 LSH 桶鍵（低 5 位元為 band 編號的有號 64 位整數）"""
+    rows = signature.reshape(BANDS, ROWS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        mixed = (rows * _BAND_MULTIPLIERS).sum(axis=1)
+    keys = (mixed & np.uint64(0xFFFFFFFFFFFFFFE0)) | np.arange(BANDS, dtype=np.uint64)
+    return [int(key) for key in keys.view(np.int64)]
+
+
+def similarity(first, second):
+    """以兩個簽章相同位置的比例估計 Jaccard 相似度"""
+    return float(np.count_nonzero(first == second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """持久化的 MinHash LSH 索引，儲存每篇文章的簽章、來源與分析結果"""
+
+    def __init__(self, path=DEDUP_INDEX_PATH, threshold=DEDUP_THRESHOLD):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                variant TEXT NOT NULL,
+                source TEXT,
+                signature BLOB NOT NULL,
+                analysis BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                key INTEGER NOT NULL,
+                document_id INTEGER NOT NULL,
+                PRIMARY KEY (key, document_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def add(self, text, analysis, variant="", source=None, signature=None):
+        """
+        加入一篇已分析的文章，返回文件 id，文字過短時返回 None
+
+        variant 區分模型與提示詞版本，查詢時只比對相同 variant 的文章。
+        """
+        signature = minhash_signature(text) if signature is None else signature
+        if signature is None:
+            return None
+        payload = zlib.compress(json.dumps(analysis, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO documents (variant, source, signature, analysis, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (variant, source, signature.tobytes(), payload, time.time()),
+            )
+            document_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO buckets (key, document_id) VALUES (?, ?)",
+                [(key, document_id) for key in band_keys(signature)],
+            )
+            self._conn.commit()
+            self._counters["added"] += 1
+        return document_id
+
+    def find(self, text, variant="", threshold=None, signature=None):
+        """
+        找出最相似的已分析文章
+
+        返回 dict：analysis、source、similarity、created_at、document_id；
+        沒有估計相似度達門檻的文章時返回 None。
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = minhash_signature(text) if signature is None else signature
+        if signature is None:
+            return None
+        keys = band_keys(signature)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, source, signature, created_at FROM documents WHERE id IN ("
+                f"SELECT DISTINCT document_id FROM buckets WHERE key IN ({','.join('?' * len(keys))})"
+                ") AND variant = ?",
+                keys + [variant],
+            ).fetchall()
+            best = None
+            for document_id, source, blob, created_at in rows:
+                score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (document_id, score, source, created_at)
+            self._counters["candidates"] += len(rows)
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            payload = self._conn.execute(
+                "SELECT analysis FROM documents WHERE id = ?", (best[0],)).fetchone()[0]
+        return {
+            "analysis": json.loads(zlib.decompress(payload)),
+            "source": best[2],
+            "similarity": best[1],
+            "created_at": best[3],
+            "document_id": best[0],
+        }
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def stats(self):
+        """回傳文件數與加入、命中、未命中、候選比對次數"""
+        stats = dict(self._counters)
+        stats["documents"] = len(self)
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """取得行程共用的近似重複索引"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+        return _index
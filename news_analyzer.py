@@ -0,0 +1,916 @@
+"""
+新聞抓取與分析核心
+
+NewsAnalyzer 負責抓取文章（內容快取 → 純 HTTP → 共用瀏覽器池）與呼叫 Claude 分析，
+不依賴 Streamlit，網頁介面（app.py）與批次命令列工具（batch_cli.py）共用。
+
+環境變數：
+- ANALYSIS_TRIAGE_MODEL: 分級模式先使用的快速模型（預設 claude-3-5-haiku-20241022）
+- ANALYSIS_CASCADE_MARGIN: 分數距離飲料分類門檻幾分以內時改用設定的模型（預設 10）
+"""
+
+import asyncio
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import anthropic
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+from analysis_cache import analysis_cache_key, get_analysis_cache
+from background_loop import get_background_loop, run_blocking
+from browser_pool import get_browser_pool
+from http_fetcher import (
+    canonical_url, conditional_headers, fetch_static_article, get_content_cache,
+    record_fetch_tier
+)
+from llm_client import get_async_client
+from llm_json import IncrementalJSONParser, parse_llm_json
+from llm_retry import (
+    ANALYSIS_DEADLINE, ATTEMPT_STAGE, DeadlineExceeded, call_with_deadline, hedge_threshold,
+)
+from metrics import get_metrics
+from preprocess import (
+    ARTICLE_TOKEN_BUDGET, estimate_tokens, preprocess_article, truncate_to_budget,
+)
+from near_duplicates import get_duplicate_index, minhash_signature
+from rumor_rules import get_rumor_classifier, record_confirmation
+
+# 文章內容的候選選擇器（依優先順序）
+ARTICLE_SELECTORS = [
+    'article', '.article-content', '.content', '.post-content',
+    '.entry-content', '#article', '.article-body', 'main'
+]
+
+# 文章內容的最低長度，低於此長度視為抓取不完整
+MIN_CONTENT_LENGTH = 200
+
+# 快速抓取模式下直接丟棄的資源類型
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+
+# 快速抓取模式下直接丟棄的廣告與追蹤網域
+BLOCKED_TRACKER_HOSTS = (
+    'google-analytics.com', 'googletagmanager.com', 'googlesyndication.com',
+    'doubleclick.net', 'adservice.google.com', 'imasdk.googleapis.com',
+    'facebook.net', 'scorecardresearch.com', 'chartbeat.com', 'cxense.com',
+    'hotjar.com', 'clarity.ms', 'cloudflareinsights.com', 'taboola.com',
+    'outbrain.com', 'popin.cc', 'tenmax.io', 'clickforce.com.tw', 'onead.com.tw'
+)
+
+
+def is_tracker_url(url):
+    """判斷請求是否指向廣告或追蹤網域"""
+    host = urlparse(url).hostname or ""
+    return any(host == tracker or host.endswith("." + tracker)
+               for tracker in BLOCKED_TRACKER_HOSTS)
+
+
+# 在瀏覽器內一次評估所有候選選擇器，避免逐一 query_selector / inner_text 的往返
+# 挑選規則：依優先順序取第一個超過最低長度者，否則取最長的文字區塊
+SCORE_SELECTORS_JS = """
+([selectors, minLength]) => {
+    const candidates = [];
+    for (const selector of selectors) {
+        let element = null;
+        try {
+            element = document.querySelector(selector);
+        } catch (e) {
+            candidates.push({selector, length: 0, error: String(e)});
+            continue;
+        }
+        if (!element) continue;
+        const text = element.innerText || "";
+        candidates.push({selector, text, length: text.length});
+    }
+    const found = candidates.filter(c => c.length > 0);
+    let best = found.find(c => c.length > minLength);
+    if (!best) {
+        best = found.reduce((a, c) => (!a || c.length > a.length ? c : a), null);
+    }
+    return {
+        selector: best ? best.selector : null,
+        text: best ? best.text : "",
+        length: best ? best.length : 0,
+        candidates: candidates.map(c => ({
+            selector: c.selector, length: c.length, error: c.error || null
+        })),
+    };
+}
+"""
+
+
+
+# 分析指示：固定不變的評分指南、輸出格式與範例，作為系統提示詞並標記為可快取，
+# 讓每次分析共用同一段前綴；新聞內容放在其後的使用者訊息中。
+# 各段落分開定義，平行分析模式的評分與實體擷取提示詞共用相同內容
+_ANALYSIS_GUIDE = """
+        請分析使用者提供的新聞內容，並以JSON格式回應。
+
+        【重要分析指南】
+        1. 真實度評估關鍵指標：
+           - 官方來源、具體數據、權威人士發言 → 高分 (80-95)
+           - 網路傳言、未經證實消息 → 低分 (20-40)
+           - 「網傳」、「據說」、「傳言」關鍵詞 → 極低分 (10-30)
+           - 已被官方澄清/闢謠內容 → 極低分 (10-25)
+
+        2. 重要性評估標準：
+           - 娛樂、地方小活動 → 10-40分
+           - 一般社會新聞 → 40-70分  
+           - 重大政策、經濟影響 → 70-100分
+
+        3. 影響力評估標準：
+           - 個人趣事、小範圍活動 → 5-30分
+           - 特定群體關注事件 → 30-60分
+           - 廣泛社會影響、政策變革 → 60-100分
+
+"""
+
+_OUTPUT_OPEN = """\
+        請提供以下分析：
+        {
+"""
+
+_SCORE_FIELDS = """\
+            "summary": "100-150字的重點摘要",
+            "target_audience": "預期讀者群體",
+            "truthfulness": 真實度分數(0-100),
+            "importance": 重要性分數(0-100),
+            "impact": 影響力分數(0-100),
+            "drink_recommendation": {
+                "name": "推薦飲料名稱",
+                "reason": "推薦理由",
+                "category": "golden_lemon/honey_green/plain_water/expired_milk"
+            },
+"""
+
+_ENTITY_FIELDS = """\
+            "entities": {
+                "people": ["{"name": "姓名", "title": "職位", "wiki_link": "維基百科連結"}"],
+                "numbers": ["{"value": "數字", "context": "背景說明", "data_link": "相關資料連結"}"],
+                "locations": ["{"name": "地點名稱"}"],
+                "organizations": ["{"name": "機構名稱", "official_link": "官方連結"}"],
+                "dates": ["{"date": "日期時間", "event": "相關事件"}],
+                "datasets": ["{"name": "資料集關鍵字", "description": "說明", "search_link": "https://data.gov.tw/datasets/search?p=1&size=10&s=資料集關鍵字"}]
+            }
+"""
+
+_OUTPUT_CLOSE = """\
+        }
+
+"""
+
+_ENTITY_NOTES = """\
+        特別注意：
+        - 對於locations，只需要提供地點名稱，系統會自動查詢 OpenStreetMap 條目連結
+        - 例如：{"name": "台北市"} 或 {"name": "中正紀念堂"}
+        - 對於datasets，請根據新聞主題提取相關的政府資料集關鍵字，並設定搜尋連結
+        - 例如：{"name": "交通事故", "description": "道路交通事故統計", "search_link": "https://data.gov.tw/datasets/search?p=1&size=10&s=交通事故"}
+
+"""
+
+_DRINK_RULES = """\
+        飲料分類標準：
+        - golden_lemon (金桔檸檬): 真實度>70且重要性>70
+        - honey_green (蜂蜜綠茶): 真實度>70但重要性≤70
+        - plain_water (無糖白開水): 真實度≤70且重要性≤70
+        - expired_milk (過期奶茶): 真實度≤70但重要性>70
+
+        【評分範例參考】
+        - 央行政策/重大投資: 真實度85-95, 重要性85-95, 影響力80-90 → 金桔檸檬
+        - 動物園活動/地方慶典: 真實度75-85, 重要性25-40, 影響力15-30 → 蜂蜜綠茶  
+        - 網路傳言/個人經驗: 真實度10-30, 重要性5-15, 影響力5-10 → 無糖白開水
+        - 已闢謠假訊息: 真實度10-25, 重要性70-90, 影響力70-90 → 過期奶茶
+        """
+
+ANALYSIS_SYSTEM_PROMPT = (_ANALYSIS_GUIDE + _OUTPUT_OPEN + _SCORE_FIELDS + _ENTITY_FIELDS
+                          + _OUTPUT_CLOSE + _ENTITY_NOTES + _DRINK_RULES)
+
+# 平行分析：評分與摘要（輸出短，飲料推薦可先顯示）
+SCORING_SYSTEM_PROMPT = (_ANALYSIS_GUIDE + _OUTPUT_OPEN + _SCORE_FIELDS.rstrip(",\n") + "\n"
+                         + _OUTPUT_CLOSE + _DRINK_RULES)
+
+# 平行分析：實體擷取（輸出最長的部分，與評分同時呼叫）
+ENTITY_SYSTEM_PROMPT = ("""
+        請擷取使用者提供的新聞內容中的關鍵資訊，並以JSON格式回應。
+
+"""
+                        + _OUTPUT_OPEN + _ENTITY_FIELDS + _OUTPUT_CLOSE + _ENTITY_NOTES)
+
+ANALYSIS_USER_TEMPLATE = """新聞內容：
+{content}
+"""
+
+# 分析結果的必要欄位與型別，缺少或型別不符時視為解析失敗（entities 可省略）
+ANALYSIS_SCHEMA = {
+    "summary": str,
+    "target_audience": str,
+    "truthfulness": (int, float),
+    "importance": (int, float),
+    "impact": (int, float),
+    "drink_recommendation": {"name": str, "reason": str, "category": str},
+}
+
+# 提示詞版本：範本變更時自動改變，使舊的分析快取失效
+PROMPT_VERSION = hashlib.sha256(
+    (ANALYSIS_SYSTEM_PROMPT + "\0" + ANALYSIS_USER_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
+
+# 平行分析的提示詞版本，與完整分析的快取分開
+FAN_OUT_PROMPT_VERSION = hashlib.sha256(
+    (SCORING_SYSTEM_PROMPT + "\0" + ENTITY_SYSTEM_PROMPT + "\0" + ANALYSIS_USER_TEMPLATE)
+    .encode("utf-8")
+).hexdigest()[:12]
+
+# 實體擷取呼叫的必要欄位
+ENTITY_SCHEMA = {"entities": dict}
+
+# 平行分析時兩個呼叫的輸出上限：評分與摘要較短，實體清單較長
+SCORING_MAX_TOKENS = 800
+ENTITY_MAX_TOKENS = 1500
+
+# 回應中記錄的 token 用量欄位（含提示詞快取的寫入與讀取）
+USAGE_FIELDS = (
+    "input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens"
+)
+
+
+def usage_summary(usage):
+    """整理 API 回應的 token 用量，缺少的欄位記為 0"""
+    summary = {}
+    for field in USAGE_FIELDS:
+        value = getattr(usage, field, None)
+        summary[field] = value if isinstance(value, int) else 0
+    return summary
+
+
+# 飲料分類只取決於真實度與重要性是否超過此分數
+DRINK_THRESHOLD = 70
+
+TRIAGE_MODEL = os.getenv("ANALYSIS_TRIAGE_MODEL", "claude-3-5-haiku-20241022")
+CASCADE_MARGIN = float(os.getenv("ANALYSIS_CASCADE_MARGIN", "10"))
+
+_cascade_counts = Counter()
+_cascade_lock = threading.Lock()
+
+
+def drink_category(truthfulness, importance):
+    """依真實度與重要性決定飲料分類"""
+    if truthfulness > DRINK_THRESHOLD:
+        return "golden_lemon" if importance > DRINK_THRESHOLD else "honey_green"
+    return "expired_milk" if importance > DRINK_THRESHOLD else "plain_water"
+
+
+def escalation_reason(analysis, margin=CASCADE_MARGIN):
+    """
+    判斷快速模型的結果是否需要改用設定的模型，不需要時返回 None
+
+    原因為 invalid（無法解析）、near_threshold（真實度或重要性距門檻 margin 分以內）
+    或 inconsistent（飲料分類與分數不符）。
+    """
+    if "error" in analysis:
+        return "invalid"
+    scores = (analysis["truthfulness"], analysis["importance"])
+    if any(abs(score - DRINK_THRESHOLD) <= margin for score in scores):
+        return "near_threshold"
+    if analysis["drink_recommendation"]["category"] != drink_category(*scores):
+        return "inconsistent"
+    return None
+
+
+def record_cascade(reason, saved_seconds=None):
+    """記錄一次分級結果；reason 為 None 表示採用快速模型，saved_seconds 為估計節省的秒數"""
+    with _cascade_lock:
+        _cascade_counts["triaged"] += 1
+        if reason is not None:
+            _cascade_counts["escalated"] += 1
+            _cascade_counts[f"reason.{reason}"] += 1
+        if saved_seconds is not None:
+            _cascade_counts["saved_seconds"] += saved_seconds
+
+
+def cascade_stats():
+    """回傳分級次數、升級次數與比例、各升級原因次數與估計節省的秒數"""
+    with _cascade_lock:
+        counts = dict(_cascade_counts)
+    triaged = counts.get("triaged", 0)
+    escalated = counts.get("escalated", 0)
+    return {
+        "triaged": triaged,
+        "escalated": escalated,
+        "escalation_rate": escalated / triaged if triaged else 0.0,
+        "reasons": {key[len("reason."):]: value for key, value in counts.items()
+                    if key.startswith("reason.")},
+        "saved_seconds": counts.get("saved_seconds", 0.0),
+    }
+
+
+def parse_analysis(response_text):
+    """
+    解析模型回應為分析結果，失敗時返回 {"error": ...}
+
+    以括號配對取出 JSON 物件，截斷時修復，並檢查必要欄位。
+    """
+    parsed = parse_llm_json(response_text, ANALYSIS_SCHEMA)
+    if parsed["error"]:
+        return {"error": f"無法解析分析結果: {parsed['error']}"}
+    return parsed["value"]
+
+
+class NewsAnalyzer:
+    def __init__(self, api_key, model_name="claude-sonnet-4-20250514",
+                 fast_fetch=False, fetch_deadline=15.0, http_first=True,
+                 selectors=None, selector_strategy="evaluate", fetch_cache=True,
+                 cache_analysis=True, preprocess=True, token_budget=ARTICLE_TOKEN_BUDGET,
+                 deadline=ANALYSIS_DEADLINE, hedge_after=None, cascade=False,
+                 triage_model=TRIAGE_MODEL, cascade_margin=CASCADE_MARGIN, fan_out=False,
+                 pre_classify=False, confirm_heuristic=False, dedupe=False):
+        if selector_strategy not in ("evaluate", "sequential"):
+            raise ValueError(f"未知的選擇器策略: {selector_strategy}")
+        self.api_key = api_key
+        self._client = None  # 同步客戶端只供 Message Batches 使用，第一次使用時才建立
+        self._async_client = None  # 預設為行程共用的非同步客戶端
+        self.model_name = model_name
+        self.fast_fetch = fast_fetch
+        self.fetch_deadline = fetch_deadline
+        self.http_first = http_first
+        self.selectors = list(selectors or ARTICLE_SELECTORS)
+        self.selector_strategy = selector_strategy
+        self.fetch_cache = fetch_cache
+        self.content_cache = None  # 第一次抓取時才開啟，預設為行程共用快取
+        self.cache_analysis = cache_analysis
+        self.analysis_cache = None  # 第一次分析時才開啟，預設為行程共用快取
+        self.last_analysis_cached = False
+        self.last_usage = None
+        self.deadline = deadline
+        self.hedge_after = hedge_after  # None 時依 ANALYSIS_HEDGE_AFTER 設定
+        self.last_call = None
+        self.cascade = cascade  # 先以 triage_model 分析，接近分類門檻時才用 model_name
+        self.triage_model = triage_model
+        self.cascade_margin = cascade_margin
+        self.last_cascade = None
+        self.fan_out = fan_out  # 評分與實體擷取分成兩個同時送出的呼叫
+        self.pre_classify = pre_classify  # 明確的闢謠或傳言先以本機規則判定
+        self.confirm_heuristic = confirm_heuristic
+        self.last_heuristic = None
+        self.pending_confirmation = None
+        self.dedupe = dedupe  # 近似重複的文章重用已儲存的分析結果
+        self.duplicate_index = None  # 第一次查詢時才開啟，預設為行程共用索引
+        self.last_duplicate = None
+        self.preprocess = preprocess
+        self.token_budget = token_budget
+        self.last_preprocess = None
+        self.last_fetch_timings = {}
+        self.last_fetch_tier = None
+        self.last_fetch_selector = None
+    
+    @property
+    def client(self):
+        """同步 Anthropic 客戶端（Message Batches 等管理操作）"""
+        if self._client is None:
+            self._client = anthropic.Anthropic(api_key=self.api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    @property
+    def async_client(self):
+        """分析使用的 AsyncAnthropic 客戶端，預設從行程共用的客戶端池取得"""
+        if self._async_client is None:
+            self._async_client = get_async_client(self.api_key)
+        return self._async_client
+    
+    @async_client.setter
+    def async_client(self, client):
+        self._async_client = client
+    
+    async def _extract_article_text(self, page):
+        """依設定的策略擷取文章內容，回傳 (選擇器, 內容)"""
+        if self.selector_strategy == "sequential":
+            return await self._extract_sequential(page)
+        
+        best = await page.evaluate(SCORE_SELECTORS_JS,
+                                   [self.selectors, MIN_CONTENT_LENGTH])
+        for candidate in best["candidates"]:
+            if candidate.get("error"):
+                print(f"選擇器 {candidate['selector']} 無效: {candidate['error']}")
+        return best["selector"], best["text"]
+    
+    async def _extract_sequential(self, page):
+        """依序嘗試多種選擇器抓取文章內容（逐一往返，保留供比較）"""
+        content, chosen = "", None
+        for selector in self.selectors:
+            try:
+                element = await page.query_selector(selector)
+                if element:
+                    content = await element.inner_text()
+                    chosen = selector
+                    if len(content) > MIN_CONTENT_LENGTH:  # 確保內容足夠長
+                        break
+            except PlaywrightError as e:
+                print(f"選擇器 {selector} 擷取失敗: {str(e)}")
+                continue
+        
+        return chosen, content
+    
+    async def fetch_article_content(self, url):
+        """
+        抓取網頁文章內容
+        
+        先查詢以正規化網址為鍵的內容快取，命中時完全不啟動瀏覽器；
+        快取過期則以 ETag / Last-Modified 發出條件式請求，304 時沿用快取內容。
+        未命中時先以純 HTTP 取得伺服器端渲染的 HTML，內容不足或偵測為前端渲染頁面時，
+        才升級到 Playwright（透過共用的瀏覽器池）。
+        抓取來源記錄於 last_fetch_tier（cache / http / browser / failed）。
+        """
+        started = time.perf_counter()
+        timings = {}
+        last_mark = [started]
+        
+        def mark(stage):
+            # 記錄每個階段的耗時（毫秒）
+            now = time.perf_counter()
+            timings[stage] = (now - last_mark[0]) * 1000
+            last_mark[0] = now
+        
+        async def extract(page):
+            mark("acquire")
+            response = await page.goto(url, wait_until='networkidle')
+            mark("goto")
+            selector, content = await self._extract_article_text(page)
+            mark("extract")
+            return selector, content, response.headers if response else {}
+        
+        async def extract_fast(page):
+            # 期限從瀏覽器階段開始計算，與外層 wait_for 一致
+            deadline = last_mark[0] + self.fetch_deadline
+            mark("acquire")
+            blocked = [0]
+            
+            async def block_heavy_requests(route):
+                request = route.request
+                try:
+                    if (request.resource_type in BLOCKED_RESOURCE_TYPES
+                            or is_tracker_url(request.url)):
+                        blocked[0] += 1
+                        await route.abort()
+                    else:
+                        await route.continue_()
+                except PlaywrightError:
+                    # 頁面已關閉時攔截中的請求會失敗，可忽略
+                    pass
+            
+            await page.route("**/*", block_heavy_requests)
+            
+            def remaining_ms():
+                return max(1.0, (deadline - time.perf_counter()) * 1000)
+            
+            # 只等 DOM 解析完成，不等廣告與追蹤器造成的 networkidle
+            response = await page.goto(url, wait_until='domcontentloaded',
+                                       timeout=remaining_ms())
+            mark("goto")
+            
+            # 等到任一文章選擇器出現即可擷取，逾時則以目前的 DOM 擷取
+            try:
+                await page.wait_for_selector(", ".join(self.selectors),
+                                             timeout=remaining_ms())
+            except PlaywrightTimeoutError:
+                pass
+            mark("selector_wait")
+            
+            selector, content = await self._extract_article_text(page)
+            mark("extract")
+            timings["blocked_requests"] = blocked[0]
+            return selector, content, response.headers if response else {}
+        
+        self.last_fetch_tier = None
+        self.last_fetch_selector = None
+        cache_key = canonical_url(url)
+        cache = None
+        cached = None
+        try:
+            if self.fetch_cache:
+                if self.content_cache is None:
+                    self.content_cache = get_content_cache()
+                cache = self.content_cache
+                cached = cache.get_entry(cache_key)
+                mark("cache")
+                if cached and not cached["expired"]:
+                    self.last_fetch_tier = "cache"
+                    self.last_fetch_selector = cached["value"].get("selector")
+                    return cached["value"]["text"]
+            
+            validators = conditional_headers(cached["value"]) if cached else {}
+            if self.http_first or validators:
+                static = await run_blocking(fetch_static_article, url, self.selectors,
+                                            MIN_CONTENT_LENGTH, headers=validators or None)
+                mark("http")
+                if static["status"] == 304 and cached:
+                    # 內容未變更，延長快取有效期限
+                    cache.refresh(cache_key)
+                    cache.count("revalidated")
+                    self.last_fetch_tier = "cache"
+                    self.last_fetch_selector = cached["value"].get("selector")
+                    return cached["value"]["text"]
+                if (self.http_first and len(static["text"]) > MIN_CONTENT_LENGTH
+                        and not static["client_rendered"]):
+                    self.last_fetch_tier = "http"
+                    self.last_fetch_selector = static["selector"]
+                    self._store_content(cache, cache_key, static["text"], static["selector"],
+                                        static["etag"], static["last_modified"])
+                    return static["text"]
+            
+            pool = get_browser_pool()
+            if self.fast_fetch:
+                # 整頁的硬性期限，逾時會取消背景抓取並關閉 context
+                selector, content, headers = await asyncio.wait_for(
+                    pool.run(extract_fast), timeout=self.fetch_deadline)
+            else:
+                selector, content, headers = await pool.run(extract)
+            if content:
+                self.last_fetch_tier = "browser"
+                self.last_fetch_selector = selector
+                self._store_content(cache, cache_key, content, selector,
+                                    headers.get("etag"), headers.get("last-modified"))
+                return content
+            return "無法抓取文章內容"
+                
+        except asyncio.TimeoutError:
+            return f"抓取失敗: 超過 {self.fetch_deadline:g} 秒抓取期限"
+        except Exception as e:
+            return f"抓取失敗: {str(e)}"
+        finally:
+            timings["total"] = (time.perf_counter() - started) * 1000
+            self.last_fetch_timings = timings
+            record_fetch_tier(self.last_fetch_tier or "failed")
+            record_fetch_metrics(timings, self.last_fetch_tier or "failed")
+    
+    def _store_content(self, cache, key, text, selector, etag, last_modified):
+        """將抓取結果與驗證資訊寫入內容快取"""
+        if cache is None:
+            return
+        cache.set(key, {
+            "text": text,
+            "selector": selector,
+            "etag": etag,
+            "last_modified": last_modified,
+        })
+    
+    def analyze_news(self, content, bypass_cache=False, on_progress=None, source=None):
+        """
+        使用Claude API分析新聞（analyze_news_async 的同步包裝）
+        
+        在背景事件迴圈上以共用的非同步客戶端執行，連線跨次重用；
+        on_progress 會轉回呼叫端執行緒中呼叫，可直接更新 Streamlit 元件。
+        不可在背景事件迴圈的執行緒中呼叫。
+        """
+        runtime = get_background_loop()
+        if on_progress is None:
+            return runtime.run_sync(self.analyze_news_async(content, bypass_cache, source=source))
+        
+        updates = queue.Queue()
+        future = runtime.submit(self.analyze_news_async(
+            content, bypass_cache,
+            on_progress=lambda fields, partial: updates.put((dict(fields), partial)),
+            source=source))
+        future.add_done_callback(lambda f: updates.put(None))
+        for fields, partial in iter(updates.get, None):
+            on_progress(fields, partial)
+        return future.result()
+    
+    async def analyze_news_async(self, content, bypass_cache=False, on_progress=None,
+                                 source=None):
+        """
+        使用Claude API分析新聞
+        
+        送出前先經過 prepare_content 前處理（結果記錄於 last_preprocess）。
+        相同內容、模型與提示詞版本的分析結果會從快取直接回傳；
+        bypass_cache=True 時略過快取讀取並以新結果覆寫。
+        
+        提供 on_progress 時改用串流 API，每收到新內容就呼叫
+        on_progress(已完成的欄位, 輸出中的字串欄位)，後者為 (欄位名稱, 目前內容) 或 None。
+        每次串流嘗試開始時先呼叫 on_progress({}, None)：重試時前一次回應已回報的欄位作廢，
+        呼叫端應清除已顯示的內容。
+        
+        呼叫在 deadline 秒內依 llm_retry 的策略重試；非串流時慢請求會送出對沖請求。
+        重試與對沖情形記錄於 last_call。使用共用客戶端時須在背景事件迴圈上執行。
+        
+        cascade=True 時先以快速模型分析，結果可用時直接返回（串流模式一次回報所有欄位），
+        否則改用設定的模型；分級情形記錄於 last_cascade。
+        
+        fan_out=True 時評分與實體擷取同時以兩個呼叫送出，評分完成即回報 on_progress，
+        兩者合併為相同格式的分析結果。
+        
+        dedupe=True 時先查詢近似重複文章索引，相似度達門檻時重用其分析結果（含 duplicate_of 欄位，
+        記錄於 last_duplicate）；新的分析結果連同 source（原文網址或 id）加入索引。
+        
+        pre_classify=True 時先以本機規則判斷，明確的闢謠或傳言直接返回暫定結果
+        （含 heuristic 欄位，記錄於 last_heuristic）；confirm_heuristic=True 時另在背景
+        以 Claude 確認，pending_confirmation 為其 Future，結果寫入分析快取。
+        """
+        self.last_analysis_cached = False
+        self.last_duplicate = None
+        self.last_heuristic = None
+        self.pending_confirmation = None
+        self.last_usage = None
+        self.last_call = None
+        self.last_cascade = None
+        content = self.prepare_content(content)
+        cache, cache_key = self.analysis_cache_entry(content)
+        if cache is not None and not bypass_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self.last_analysis_cached = True
+                return cached
+        
+        signature = None
+        if self.dedupe:
+            if self.duplicate_index is None:
+                self.duplicate_index = get_duplicate_index()
+            signature = minhash_signature(content)
+            duplicate = None if bypass_cache else self._find_duplicate(content, signature)
+            if duplicate is not None:
+                if on_progress is not None:
+                    on_progress(duplicate, None)
+                return duplicate
+        
+        if self.pre_classify:
+            provisional = self._pre_classify(content, cache, cache_key)
+            if provisional is not None:
+                if on_progress is not None:
+                    on_progress(provisional, None)
+                return provisional
+        
+        analysis = await self._analyze_uncached(content, cache, cache_key, on_progress)
+        if signature is not None and "error" not in analysis:
+            self.duplicate_index.add(content, analysis, "|".join(self.analysis_variant()),
+                                     source, signature)
+        return analysis
+    
+    async def _analyze_uncached(self, content, cache, cache_key, on_progress=None):
+        """呼叫 Claude 分析已前處理的內容，成功的結果寫入分析快取"""
+        request = self.analysis_request(content)
+        
+        try:
+            if self.cascade:
+                analysis = await self._triage(content)
+                if analysis is not None:
+                    if on_progress is not None:
+                        on_progress(analysis, None)
+                    if cache is not None:
+                        cache.set(cache_key, analysis)
+                    return analysis
+            
+            if self.fan_out:
+                with get_metrics().span("analyze", model=self.model_name, mode="fan_out"):
+                    analysis = await self._fan_out(content, on_progress)
+                if cache is not None and "error" not in analysis:
+                    cache.set(cache_key, analysis)
+                return analysis
+            
+            with get_metrics().span("analyze", model=self.model_name,
+                                     mode="create" if on_progress is None else "stream"):
+                if on_progress is None:
+                    response = await self._call(
+                        lambda timeout: self.async_client.messages.create(
+                            **request, timeout=timeout),
+                        hedge_threshold(self.model_name, self.hedge_after))
+                    response_text = response.content[0].text
+                    self._record_usage(response)
+                else:
+                    # 串流結果已逐步顯示，不送出對沖請求
+                    response_text = await self._call(
+                        lambda timeout: self._stream_analysis(request, on_progress, timeout))
+            
+            analysis = parse_analysis(response_text)
+            if cache is not None and "error" not in analysis:
+                cache.set(cache_key, analysis)
+            return analysis
+        
+        except DeadlineExceeded:
+            return {"error": f"分析失敗: 超過 {self.deadline:g} 秒分析期限"}
+        except Exception as e:
+            return {"error": f"分析失敗: {str(e)}"}
+    
+    def analysis_cache_entry(self, content):
+        """返回已前處理內容的 (分析快取, 快取鍵)，未啟用分析快取時為 (None, None)"""
+        if not self.cache_analysis:
+            return None, None
+        if self.analysis_cache is None:
+            self.analysis_cache = get_analysis_cache()
+        model_key, version = self.analysis_variant()
+        return self.analysis_cache, analysis_cache_key(content, model_key, version)
+    
+    def analysis_variant(self):
+        """返回 (模型鍵, 提示詞版本)，設定不同的分析結果不共用快取與重複文章索引"""
+        # 分級模式的結果可能來自快速模型，與單一模型的結果分開快取
+        model_key = self.model_name
+        if self.cascade:
+            model_key = f"{self.triage_model}>{self.model_name}±{self.cascade_margin:g}"
+        return model_key, FAN_OUT_PROMPT_VERSION if self.fan_out else PROMPT_VERSION
+    
+    def prepare_content(self, content):
+        """
+        前處理文章：移除樣板與重複段落並依 token 預算裁切
+
+        清理後為空（整篇都像樣板）時沿用原文，但同樣依預算截斷，不會送出超過預算的內容。
+        """
+        self.last_preprocess = None
+        if not self.preprocess:
+            return content
+        self.last_preprocess = preprocess_article(content, self.token_budget)
+        if self.last_preprocess["text"] or self.last_preprocess["truncated"]:
+            return self.last_preprocess["text"]
+        if self.token_budget and estimate_tokens(content) > self.token_budget:
+            return truncate_to_budget(content, self.token_budget)
+        return content
+    
+    def analysis_request(self, content, model_name=None, system_prompt=ANALYSIS_SYSTEM_PROMPT,
+                         max_tokens=2000):
+        """組出分析請求：可快取的系統提示詞在前，新聞內容在後"""
+        return {
+            "model": model_name or self.model_name,
+            "max_tokens": max_tokens,
+            "system": [{
+                "type": "text",
+                "text": system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }],
+            "messages": [
+                {"role": "user", "content": ANALYSIS_USER_TEMPLATE.format(content=content)}
+            ],
+        }
+    
+    def _record_usage(self, message, model_name=None):
+        """記錄本次呼叫的 token 用量與提示詞快取命中情形，同一次分析的多個呼叫累加於 last_usage"""
+        usage = usage_summary(getattr(message, "usage", None))
+        get_metrics().record_usage(model_name or self.model_name, usage)
+        print("Claude API 用量: " + ", ".join(
+            f"{field}={value}" for field, value in usage.items()))
+        if self.last_usage is None:
+            self.last_usage = usage
+        else:
+            self.last_usage = {field: self.last_usage[field] + usage[field] for field in usage}
+    
+    async def _call(self, attempt, hedge_after=None, model_name=None):
+        """在分析期限內執行 attempt(剩餘秒數)，依勝出的請求記錄整體耗時"""
+        model_name = model_name or self.model_name
+        started = time.perf_counter()
+        result, self.last_call = await call_with_deadline(
+            attempt, deadline=self.deadline, hedge_after=hedge_after,
+            labels={"model": model_name})
+        get_metrics().observe("claude_call", time.perf_counter() - started,
+                              model=model_name, winner=self.last_call["winner"])
+        return result
+    
+    def _find_duplicate(self, content, signature):
+        """查詢近似重複的已分析文章，找到時返回其分析結果（含 duplicate_of 欄位）"""
+        with get_metrics().span("dedupe"):
+            match = self.duplicate_index.find(content, "|".join(self.analysis_variant()),
+                                              signature=signature)
+        if match is None:
+            return None
+        self.last_duplicate = {"source": match["source"],
+                               "similarity": round(match["similarity"], 3),
+                               "analyzed_at": match["created_at"]}
+        return dict(match["analysis"], duplicate_of=self.last_duplicate)
+    
+    def _pre_classify(self, content, cache, cache_key):
+        """以本機規則判斷，信心足夠時返回暫定結果，必要時在背景送出 Claude 確認"""
+        with get_metrics().span("pre_classify"):
+            provisional = get_rumor_classifier().provisional_analysis(content)
+        if provisional is None:
+            return None
+        self.last_heuristic = provisional["heuristic"]
+        if self.confirm_heuristic:
+            self.pending_confirmation = get_background_loop().submit(
+                self._confirm(content, cache, cache_key, self.last_heuristic))
+        return provisional
+    
+    async def _confirm(self, content, cache, cache_key, heuristic):
+        """以 Claude 分析規則判定的文章，記錄分類是否一致"""
+        analysis = await self._analyze_uncached(content, cache, cache_key)
+        if "error" not in analysis:
+            agreed = record_confirmation(heuristic, analysis)
+            print(f"規則判定經 Claude 確認：{'一致' if agreed else '不一致'}"
+                  f"（{heuristic['kind']}，{'、'.join(heuristic['matches'])}）")
+        return analysis
+    
+    async def _fan_out(self, content, on_progress=None):
+        """
+        評分與實體擷取同時呼叫，合併為完整的分析結果
+        
+        評分失敗時取消實體擷取並返回錯誤；實體擷取失敗時仍返回評分結果（entities 為空）。
+        """
+        scoring = self.analysis_request(content, system_prompt=SCORING_SYSTEM_PROMPT,
+                                        max_tokens=SCORING_MAX_TOKENS)
+        extraction = self.analysis_request(content, system_prompt=ENTITY_SYSTEM_PROMPT,
+                                           max_tokens=ENTITY_MAX_TOKENS)
+        hedge_after = hedge_threshold(self.model_name, self.hedge_after)
+        
+        async def extract_entities():
+            response = await self._call(
+                lambda timeout: self.async_client.messages.create(**extraction, timeout=timeout),
+                hedge_after)
+            self._record_usage(response)
+            return response.content[0].text
+        
+        entity_task = asyncio.ensure_future(extract_entities())
+        try:
+            if on_progress is None:
+                response = await self._call(
+                    lambda timeout: self.async_client.messages.create(**scoring, timeout=timeout),
+                    hedge_after)
+                self._record_usage(response)
+                scoring_text = response.content[0].text
+            else:
+                scoring_text = await self._call(
+                    lambda timeout: self._stream_analysis(scoring, on_progress, timeout))
+        except BaseException:
+            entity_task.cancel()
+            raise
+        
+        analysis = parse_analysis(scoring_text)
+        if "error" in analysis:
+            entity_task.cancel()
+            return analysis
+        if on_progress is not None:
+            on_progress(analysis, None)
+        
+        try:
+            parsed = parse_llm_json(await entity_task, ENTITY_SCHEMA)
+            if parsed["error"]:
+                raise ValueError(parsed["error"])
+            analysis["entities"] = parsed["value"]["entities"]
+        except Exception as e:
+            print(f"實體擷取失敗，只顯示評分結果: {str(e)}")
+            analysis["entities"] = {}
+        return analysis
+    
+    async def _triage(self, content):
+        """
+        以快速模型分析，結果可用時返回分析結果，需要改用設定的模型時返回 None
+        
+        節省的時間以設定模型單次呼叫耗時的中位數估計（尚無樣本時不計）；
+        升級時快速模型的耗時計為額外花費。
+        """
+        request = self.analysis_request(content, self.triage_model)
+        started = time.perf_counter()
+        try:
+            with get_metrics().span("analyze", model=self.triage_model, mode="triage"):
+                response = await self._call(
+                    lambda timeout: self.async_client.messages.create(**request, timeout=timeout),
+                    hedge_threshold(self.triage_model, self.hedge_after), self.triage_model)
+            self._record_usage(response, self.triage_model)
+            analysis = parse_analysis(response.content[0].text)
+            reason = escalation_reason(analysis, self.cascade_margin)
+        except Exception as e:
+            print(f"快速模型分析失敗，改用 {self.model_name}: {str(e)}")
+            analysis, reason = None, "triage_failed"
+        elapsed = time.perf_counter() - started
+        
+        if reason is None:
+            baseline = get_metrics().quantile(ATTEMPT_STAGE, 0.5, model=self.model_name)
+            saved = baseline - elapsed if baseline is not None else None
+        else:
+            saved = -elapsed
+        record_cascade(reason, saved)
+        self.last_cascade = {"model": self.triage_model if reason is None else self.model_name,
+                             "escalated": reason is not None, "reason": reason,
+                             "triage_seconds": elapsed}
+        return analysis if reason is None else None
+    
+    async def _stream_analysis(self, request, on_progress, timeout=None):
+        """
+        以串流 API 取得分析結果，邊接收邊回報已解析的欄位，返回完整文字
+
+        每次嘗試使用新的解析器，開始時以 on_progress({}, None) 通知呼叫端重新開始。
+        """
+        parser = IncrementalJSONParser()
+        on_progress({}, None)
+        async with self.async_client.messages.stream(**request, timeout=timeout) as stream:
+            async for text in stream.text_stream:
+                completed = parser.feed(text)
+                partial = parser.partial_field
+                if completed or partial:
+                    on_progress(parser.fields, partial)
+            self._record_usage(await stream.get_final_message())
+        return parser.text
+
+
+# 抓取計時中記入指標的階段
+FETCH_STAGES = ("cache", "http", "acquire", "goto", "selector_wait", "extract", "total")
+
+
+def record_fetch_metrics(timings, tier):
+    """將一次抓取的總耗時與各階段耗時記入指標（秒）"""
+    metrics = get_metrics()
+    for stage in FETCH_STAGES:
+        if stage in timings:
+            name = "fetch" if stage == "total" else f"fetch.{stage}"
+            metrics.observe(name, timings[stage] / 1000, tier=tier)
@@ -0,0 +1,198 @@
+"""
+文章前處理
+
+抓取到的文字常夾帶導覽選單、延伸閱讀清單、重複的版權宣告與分享按鈕文字，
+全部送進提示詞只會增加輸入 token 與延遲。本模組在抓取與分析之間：
+- 移除樣板行（版權、分享、訂閱、導覽選單等）與延伸閱讀區塊
+- 移除重複段落並正規化空白
+- 依 token 預算裁切內容，優先保留導言（前幾段）與含引述的段落
+
+token 數為估算值（中日韓文字約每字 1 token，其他文字約每 4 字元 1 token），
+用於預算控制與前後比較，不需呼叫 API。
+
+環境變數：
+- ARTICLE_TOKEN_BUDGET: 送入分析的文章 token 上限（預設 3000，0 表示不限制）
+"""
+
+import os
+import re
+
+from analysis_cache import normalize_content
+
+ARTICLE_TOKEN_BUDGET = int(os.getenv("ARTICLE_TOKEN_BUDGET", "3000"))
+
+# 一律保留的導言段落數
+LEDE_PARAGRAPHS = 2
+
+# 版權宣告：只檢查短行，避免誤刪報導著作權議題的內文
+COPYRIGHT_LINE = re.compile(
+    r"^(©|copyright\b)|all rights reserved|版權所有|不得轉載",
+    re.IGNORECASE,
+)
+COPYRIGHT_MAX_LENGTH = 40
+
+# 分享、訂閱、翻頁等介面文字：只檢查很短的行
+INTERFACE_LINE = re.compile(
+    r"^(分享|轉寄|列印|收藏|留言|按讚|訂閱|加入會員|登入|下載\s*app|看更多|點我|更多新聞"
+    r"|上一則|下一則|上一篇|下一篇|廣告|advertisement|sponsored)",
+    re.IGNORECASE,
+)
+INTERFACE_MAX_LENGTH = 20
+
+# 延伸閱讀類區塊的標題，其後的短行（文章標題清單）一併移除
+RELATED_SECTION = re.compile(
+    r"^(延伸閱讀|相關新聞|相關文章|推薦閱讀|熱門新聞|更多新聞|你可能也想看|猜你喜歡|看更多)"
+    r"[\s:：>》]*$"
+)
+
+# 句末標點：有這些標點的行視為內文而非清單或選單
+SENTENCE_END = re.compile(r"[。！？!?」』”\"]\s*$")
+QUOTE_MARKS = re.compile(r"[「『“\"]")
+MENU_SEPARATOR = re.compile(r"[\s|｜/／・•]+")
+CJK_CHARACTER = re.compile(r"[\u3000-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+# 句子邊界：中文句末標點、後接空白的英文句點與換行
+SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?\n])|(?<=\.)(?=\s)")
+
+# 日期、時間與記者署名：雖是短詞並列，但屬於報導資訊而非選單
+DATELINE = re.compile(r"\d|記者|報導|編輯|撰文|攝影|外電")
+
+# 延伸閱讀清單在長度達到此值且以句末標點結尾的行結束
+PROSE_MIN_LENGTH = 20
+
+
+def estimate_tokens(text):
+    """估算文字的 token 數"""
+    cjk = len(CJK_CHARACTER.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def is_menu_line(line):
+    """判斷是否為導覽選單（三個以上的短詞並列，沒有標點、數字或署名）"""
+    items = [item for item in MENU_SEPARATOR.split(line) if item]
+    return len(items) >= 3 and all(len(item) <= 4 for item in items) \
+        and not re.search(r"[，。！？、：；,.!?]", line) and not DATELINE.search(line)
+
+
+def is_boilerplate_line(line):
+    """判斷是否為版權宣告、介面文字或導覽選單"""
+    return (len(line) <= COPYRIGHT_MAX_LENGTH and bool(COPYRIGHT_LINE.search(line))) \
+        or (len(line) <= INTERFACE_MAX_LENGTH and bool(INTERFACE_LINE.match(line))) \
+        or is_menu_line(line)
+
+
+def strip_boilerplate(lines):
+    """移除樣板行與延伸閱讀區塊，返回 (保留的行, 移除行數)"""
+    kept, removed = [], 0
+    in_related = False
+    for line in lines:
+        if in_related:
+            if len(line) >= PROSE_MIN_LENGTH and SENTENCE_END.search(line):
+                in_related = False
+            else:
+                removed += 1
+                continue
+        if RELATED_SECTION.match(line):
+            in_related = True
+            removed += 1
+        elif is_boilerplate_line(line):
+            removed += 1
+        else:
+            kept.append(line)
+    return kept, removed
+
+
+def dedupe_paragraphs(paragraphs):
+    """移除重複段落（忽略空白與標點差異），返回 (段落, 移除數)"""
+    seen, kept = set(), []
+    for paragraph in paragraphs:
+        key = re.sub(r"[\W_]+", "", paragraph).lower()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        kept.append(paragraph)
+    return kept, len(paragraphs) - len(kept)
+
+
+def cut_to_budget(text, budget):
+    """以字元截斷文字，取估算 token 數不超過預算的最長前綴"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def truncate_to_budget(text, budget):
+    """以句子為單位截斷文字，使估算 token 數不超過預算；第一句就超過預算時改以字元截斷"""
+    result = ""
+    for sentence in SENTENCE_SPLIT.split(text):
+        if estimate_tokens(result + sentence) > budget:
+            if not result:
+                result = cut_to_budget(sentence, budget)
+            break
+        result += sentence
+    return result
+
+
+def fit_to_budget(paragraphs, budget):
+    """
+    挑選段落使總 token 數不超過預算，輸出維持原始順序
+
+    優先順序：導言段落、含引述的段落、其餘段落依原順序；放不下的段落略過，
+    但放不下的導言段落會在句子邊界截斷後保留。
+    """
+    costs = [estimate_tokens(p) + 1 for p in paragraphs]
+    if sum(costs) <= budget:
+        return paragraphs, False
+
+    def priority(index):
+        if index < LEDE_PARAGRAPHS:
+            return 0
+        if QUOTE_MARKS.search(paragraphs[index]):
+            return 1
+        return 2
+
+    selected, remaining = {}, budget
+    for index in sorted(range(len(paragraphs)), key=lambda i: (priority(i), i)):
+        paragraph, cost = paragraphs[index], costs[index]
+        if cost > remaining and priority(index) == 0:
+            paragraph = truncate_to_budget(paragraph, remaining - 1)
+            cost = estimate_tokens(paragraph) + 1
+        if paragraph and cost <= remaining:
+            selected[index] = paragraph
+            remaining -= cost
+
+    if not selected and paragraphs:
+        return [truncate_to_budget(paragraphs[0], budget)], True
+    return [selected[i] for i in sorted(selected)], True
+
+
+def preprocess_article(text, token_budget=ARTICLE_TOKEN_BUDGET):
+    """
+    清理文章並依 token 預算裁切
+
+    返回 dict：text、tokens_before、tokens_after、removed_lines（樣板行數）、
+    duplicate_paragraphs（重複段落數）、truncated（是否因預算刪減內容）。
+    token_budget 為 None 或 0 時不裁切。
+    """
+    tokens_before = estimate_tokens(text)
+    lines = normalize_content(text).split("\n")
+    lines, removed_lines = strip_boilerplate(lines)
+    paragraphs, duplicates = dedupe_paragraphs(lines)
+
+    truncated = False
+    if token_budget:
+        paragraphs, truncated = fit_to_budget(paragraphs, token_budget)
+
+    cleaned = "\n".join(paragraphs)
+    return {
+        "text": cleaned,
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(cleaned),
+        "removed_lines": removed_lines,
+        "duplicate_paragraphs": duplicates,
+        "truncated": truncated,
+    }
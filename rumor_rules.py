@@ -0,0 +1,269 @@
+"""
+本機規則預分類
+
+分析提示詞中決定低真實度的線索（網傳、據說、傳言、已闢謠……）在明確的案例裡幾乎一看就知道：
+事實查核轉載、「網傳……是假的」的澄清貼文，不必等 Claude 回應。
+本模組以 Aho–Corasick 多模式比對一次掃描全文找出所有線索，依權重計分，
+信心足夠且命中至少兩個不同線索時，直接給出暫定的分數與飲料分類（標記為 heuristic），
+其餘文章照常交給 Claude。
+
+環境變數：
+- RULES_MIN_CONFIDENCE: 直接採用規則結果的最低信心（0-1，預設 0.8）
+"""
+
+import math
+import os
+import threading
+import unicodedata
+from collections import Counter, deque
+
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.8"))
+
+# 直接判定至少需要的同類型不同線索數：一般新聞引述機關「已闢謠」只有單一線索，不算明確案例
+MIN_DISTINCT_CUES = 2
+
+# 線索：(關鍵字, 類型, 權重)。debunk 為闢謠與查核，rumor 為未經證實的傳言，
+# official 為正式來源（降低「傳言」判定的信心）
+RULE_PATTERNS = (
+    ("已闢謠", "debunk", 2.0),
+    ("闢謠", "debunk", 1.2),
+    ("事實查核", "debunk", 1.5),
+    ("查核中心", "debunk", 1.5),
+    ("mygopen", "debunk", 1.5),
+    ("蘭姆酒吐司", "debunk", 1.5),
+    ("假訊息", "debunk", 1.0),
+    ("不實訊息", "debunk", 1.0),
+    ("錯誤訊息", "debunk", 0.8),
+    ("並非事實", "debunk", 1.0),
+    ("子虛烏有", "debunk", 1.0),
+    ("是假的", "debunk", 1.0),
+    ("澄清", "debunk", 0.8),
+    ("勿轉傳", "debunk", 0.8),
+    ("散布謠言", "debunk", 1.0),
+    ("依法究辦", "debunk", 0.6),
+    ("社會秩序維護法", "debunk", 0.6),
+    ("網傳", "rumor", 1.2),
+    ("網路瘋傳", "rumor", 1.2),
+    ("據說", "rumor", 0.8),
+    ("傳言", "rumor", 1.0),
+    ("謠言", "rumor", 0.8),
+    ("轉傳", "rumor", 0.6),
+    ("line群組", "rumor", 0.6),
+    ("未經證實", "rumor", 1.0),
+    ("爆料", "rumor", 0.5),
+    ("聽說", "rumor", 0.6),
+    ("記者會", "official", 0.8),
+    ("統計", "official", 0.6),
+    ("三讀", "official", 1.0),
+    ("公告", "official", 0.6),
+    ("新聞稿", "official", 0.8),
+)
+
+# 判定結果對應的暫定分數，取自分析提示詞的評分範例
+PROVISIONAL_RESULTS = {
+    "debunk": {"truthfulness": 15, "importance": 75, "impact": 70,
+               "drink": ("過期奶茶", "expired_milk"),
+               "audience": "可能接觸到相關傳言的一般民眾"},
+    "rumor": {"truthfulness": 20, "importance": 10, "impact": 8,
+              "drink": ("無糖白開水", "plain_water"),
+              "audience": "社群媒體使用者"},
+}
+
+KIND_LABELS = {"debunk": "闢謠或查核內容", "rumor": "未經證實的傳言"}
+
+# 保留最近的比對結果與 Claude 確認結果，供診斷面板與調整權重參考
+RECENT_LIMIT = 20
+
+
+def normalize(text):
+    """全半形統一並轉小寫，讓關鍵字比對不受寫法影響"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick 多模式比對
+
+    建構時把所有關鍵字編成一個自動機（字典樹加上失敗連結），
+    之後每篇文章只需掃描一次，耗時與關鍵字數量無關。
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(pattern)
+
+    def _build(self):
+        # 廣度優先設定失敗連結，並把失敗狀態的輸出併入，掃描時不必再沿連結回溯
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def finditer(self, text):
+        """逐一返回 (起始位置, 關鍵字)，重疊的關鍵字都會返回"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                yield index - len(pattern) + 1, pattern
+
+
+class RumorClassifier:
+    """以加權線索判斷文章是否為明確的闢謠或傳言"""
+
+    def __init__(self, patterns=RULE_PATTERNS, min_confidence=RULES_MIN_CONFIDENCE):
+        self.rules = {normalize(keyword): (kind, weight) for keyword, kind, weight in patterns}
+        self.min_confidence = min_confidence
+        self.matcher = KeywordMatcher(self.rules)
+
+    def score(self, text):
+        """
+        計算各類線索的分數，返回 (分數 Counter, 命中的關鍵字)
+
+        同一關鍵字只計一次；較長的關鍵字已命中時，其中包含的較短關鍵字不重複計分
+        （例如「已闢謠」不再另計「闢謠」）。
+        """
+        spans = {}
+        for start, keyword in self.matcher.finditer(normalize(text)):
+            spans.setdefault(keyword, (start, start + len(keyword)))
+        matched = [keyword for keyword, (start, end) in spans.items()
+                   if not any(other != keyword and s <= start and end <= e
+                              for other, (s, e) in spans.items())]
+        scores = Counter()
+        for keyword in matched:
+            kind, weight = self.rules[keyword]
+            scores[kind] += weight
+        return scores, sorted(matched, key=lambda keyword: spans[keyword][0])
+
+    def classify(self, text):
+        """
+        判斷文章類型，返回 (類型, 信心, 命中的關鍵字)，沒有線索時類型為 None
+
+        闢謠線索優先（「網傳……是假的」屬於闢謠）；正式來源的線索會降低傳言判定的信心。
+        """
+        scores, matched = self.score(text)
+        if scores["debunk"] >= scores["rumor"] and scores["debunk"] > 0:
+            return "debunk", 1 - math.exp(-scores["debunk"]), matched
+        if scores["rumor"] > 0:
+            confidence = (1 - math.exp(-scores["rumor"])) * math.exp(-scores["official"])
+            return "rumor", confidence, matched
+        return None, 0.0, matched
+
+    def provisional_analysis(self, text):
+        """
+        信心達門檻且命中至少 MIN_DISTINCT_CUES 個同類型線索時，返回暫定的分析結果
+        （與 Claude 分析結果格式相同），否則返回 None
+        """
+        kind, confidence, matched = self.classify(text)
+        cues = [keyword for keyword in matched if kind and self.rules[keyword][0] == kind]
+        if kind is None or confidence < self.min_confidence or len(cues) < MIN_DISTINCT_CUES:
+            record_rule_outcome(None)
+            return None
+        record_rule_outcome(kind)
+        result = PROVISIONAL_RESULTS[kind]
+        drink_name, category = result["drink"]
+        keywords = "、".join(cues)
+        return {
+            "summary": _lead(text),
+            "target_audience": result["audience"],
+            "truthfulness": result["truthfulness"],
+            "importance": result["importance"],
+            "impact": result["impact"],
+            "drink_recommendation": {
+                "name": drink_name,
+                "reason": f"本機規則判定為{KIND_LABELS[kind]}（命中：{keywords}），分數為暫定值",
+                "category": category,
+            },
+            "entities": {},
+            "heuristic": {"kind": kind, "confidence": round(confidence, 3),
+                          "matches": matched},
+        }
+
+
+def _lead(text, limit=150):
+    """取文章開頭作為暫定摘要"""
+    lead = " ".join(text.split())
+    return lead if len(lead) <= limit else lead[:limit] + "…"
+
+
+_rule_counts = Counter()
+_recent_confirmations = deque(maxlen=RECENT_LIMIT)
+_rule_lock = threading.Lock()
+
+
+def record_rule_outcome(kind):
+    """記錄一次預分類結果，kind 為 None 表示交給 Claude"""
+    with _rule_lock:
+        _rule_counts["checked"] += 1
+        if kind is not None:
+            _rule_counts["matched"] += 1
+            _rule_counts[f"kind.{kind}"] += 1
+
+
+def record_confirmation(heuristic, analysis):
+    """記錄 Claude 對規則結果的確認，返回分類是否一致"""
+    agreed = (analysis["drink_recommendation"]["category"]
+              == PROVISIONAL_RESULTS[heuristic["kind"]]["drink"][1])
+    with _rule_lock:
+        _rule_counts["confirmed"] += 1
+        _rule_counts["agreed"] += agreed
+        _recent_confirmations.append({"kind": heuristic["kind"],
+                                      "matches": heuristic["matches"],
+                                      "category": analysis["drink_recommendation"]["category"],
+                                      "agreed": agreed})
+    return agreed
+
+
+def rule_stats():
+    """回傳預分類的檢查、命中與確認次數、命中率、確認一致率與最近的確認結果"""
+    with _rule_lock:
+        counts = dict(_rule_counts)
+        recent = list(_recent_confirmations)
+    checked = counts.get("checked", 0)
+    confirmed = counts.get("confirmed", 0)
+    return {
+        "checked": checked,
+        "matched": counts.get("matched", 0),
+        "match_rate": counts.get("matched", 0) / checked if checked else 0.0,
+        "confirmed": confirmed,
+        "agreement_rate": counts.get("agreed", 0) / confirmed if confirmed else 0.0,
+        "recent_confirmations": recent,
+    }
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_rumor_classifier():
+    """取得行程共用的預分類器（自動機只建構一次）"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = RumorClassifier()
+        return _classifier
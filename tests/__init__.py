@@ -10,3 +10,15 @@ NewsAnalyzer 測試套件
 
 __version__ = "1.0.0"
 __author__ = "NewsAnalyzer Team"
+
+import os
+import tempfile
+
+# 測試使用暫存的快取目錄，避免寫入專案目錄下的 .cache
+os.environ.setdefault(
+    "NEWS_ANALYZER_CACHE_DIR", tempfile.mkdtemp(prefix="news-analyzer-test-cache-")
+)
+# 測試不載入專案內建的地名索引，地點查詢一律經過快取與 Nominatim 路徑
+os.environ.setdefault(
+    "GAZETTEER_PATH", os.path.join(os.environ["NEWS_ANALYZER_CACHE_DIR"], "gazetteer.tsv.gz")
+)
@@ -17,9 +17,42 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 # 匯入測試模組
-from tests.test_analyzer import TestNewsAnalyzer, TestUtilityFunctions
-from tests.test_ui import TestStreamlitUI, TestUIIntegration
+from tests.test_analyzer import (
+    TestNewsAnalyzer, TestFastFetch, TestSelectorStrategies, TestUtilityFunctions,
+    TestPromptCaching, TestModelCascade, TestParallelFanOut
+)
+from tests.test_browser_pool import TestBrowserPool
+from tests.test_http_fetcher import (
+    TestStaticExtraction, TestCanonicalUrl, TestHttpFirstFetch
+)
+from tests.test_cache_store import (
+    TestSQLiteCache, TestFetchContentCache, TestAnalysisCache
+)
+from tests.test_ui import TestStreamlitUI, TestUIIntegration, TestEntityDisplay
 from tests.test_integration import TestIntegration, TestDataFlowIntegration
+from tests.test_geocoder import (
+    TestLocationNormalization, TestSearchNominatim, TestGeocodeCache,
+    TestTokenBucket, TestNominatimScheduler
+)
+from tests.test_gazetteer import TestGazetteer, TestBuildGazetteer, TestGazetteerLookup
+from tests.test_llm_json import (
+    TestIncrementalJSONParser, TestExtractJSONObject, TestStreamingAnalysis,
+    TestProgressiveRendering
+)
+from tests.test_preprocess import (
+    TestPreprocessArticle, TestTokenBudget, TestAnalyzerPreprocessing
+)
+from tests.test_metrics import TestMetricsRegistry, TestStageInstrumentation
+from tests.test_batch_cli import TestInputParsing, TestBatchPipeline
+from tests.test_bulk_analysis import TestBulkAnalyzer, TestBulkCommandLine
+from tests.test_llm_client import TestAsyncClientPool, TestSyncWrapper
+from tests.test_llm_retry import TestRetryPolicy, TestHedgedRequests, TestAnalyzerDeadline
+from tests.test_rumor_rules import TestKeywordMatcher, TestRumorClassifier, TestPreClassification
+from tests.test_near_duplicates import (
+    TestMinHash, TestNearDuplicateIndex, TestAnalyzerDeduplication
+)
+from tests.test_history_store import TestHistoryStore, TestHistoryRecording, TestHistoryView
+from tests.test_trend_analytics import TestTrendAggregation, TestTrendLoading
 from tests.test_config import TEST_CONFIG, get_test_env, validate_analysis_result
 
 
@@ -37,7 +70,55 @@ class TestRunner:
         
         # 添加分析器測試
         suite.addTest(unittest.makeSuite(TestNewsAnalyzer))
+        suite.addTest(unittest.makeSuite(TestFastFetch))
+        suite.addTest(unittest.makeSuite(TestSelectorStrategies))
+        suite.addTest(unittest.makeSuite(TestPromptCaching))
+        suite.addTest(unittest.makeSuite(TestModelCascade))
+        suite.addTest(unittest.makeSuite(TestParallelFanOut))
         suite.addTest(unittest.makeSuite(TestUtilityFunctions))
+        suite.addTest(unittest.makeSuite(TestBrowserPool))
+        suite.addTest(unittest.makeSuite(TestStaticExtraction))
+        suite.addTest(unittest.makeSuite(TestCanonicalUrl))
+        suite.addTest(unittest.makeSuite(TestHttpFirstFetch))
+        suite.addTest(unittest.makeSuite(TestSQLiteCache))
+        suite.addTest(unittest.makeSuite(TestFetchContentCache))
+        suite.addTest(unittest.makeSuite(TestAnalysisCache))
+        suite.addTest(unittest.makeSuite(TestLocationNormalization))
+        suite.addTest(unittest.makeSuite(TestSearchNominatim))
+        suite.addTest(unittest.makeSuite(TestGeocodeCache))
+        suite.addTest(unittest.makeSuite(TestTokenBucket))
+        suite.addTest(unittest.makeSuite(TestNominatimScheduler))
+        suite.addTest(unittest.makeSuite(TestGazetteer))
+        suite.addTest(unittest.makeSuite(TestBuildGazetteer))
+        suite.addTest(unittest.makeSuite(TestGazetteerLookup))
+        suite.addTest(unittest.makeSuite(TestIncrementalJSONParser))
+        suite.addTest(unittest.makeSuite(TestExtractJSONObject))
+        suite.addTest(unittest.makeSuite(TestStreamingAnalysis))
+        suite.addTest(unittest.makeSuite(TestProgressiveRendering))
+        suite.addTest(unittest.makeSuite(TestPreprocessArticle))
+        suite.addTest(unittest.makeSuite(TestTokenBudget))
+        suite.addTest(unittest.makeSuite(TestAnalyzerPreprocessing))
+        suite.addTest(unittest.makeSuite(TestMetricsRegistry))
+        suite.addTest(unittest.makeSuite(TestStageInstrumentation))
+        suite.addTest(unittest.makeSuite(TestInputParsing))
+        suite.addTest(unittest.makeSuite(TestBatchPipeline))
+        suite.addTest(unittest.makeSuite(TestBulkAnalyzer))
+        suite.addTest(unittest.makeSuite(TestAsyncClientPool))
+        suite.addTest(unittest.makeSuite(TestSyncWrapper))
+        suite.addTest(unittest.makeSuite(TestRetryPolicy))
+        suite.addTest(unittest.makeSuite(TestHedgedRequests))
+        suite.addTest(unittest.makeSuite(TestAnalyzerDeadline))
+        suite.addTest(unittest.makeSuite(TestKeywordMatcher))
+        suite.addTest(unittest.makeSuite(TestRumorClassifier))
+        suite.addTest(unittest.makeSuite(TestPreClassification))
+        suite.addTest(unittest.makeSuite(TestMinHash))
+        suite.addTest(unittest.makeSuite(TestNearDuplicateIndex))
+        suite.addTest(unittest.makeSuite(TestAnalyzerDeduplication))
+        suite.addTest(unittest.makeSuite(TestHistoryStore))
+        suite.addTest(unittest.makeSuite(TestHistoryRecording))
+        suite.addTest(unittest.makeSuite(TestHistoryView))
+        suite.addTest(unittest.makeSuite(TestTrendAggregation))
+        suite.addTest(unittest.makeSuite(TestTrendLoading))
         
         runner = unittest.TextTestRunner(verbosity=2 if self.verbose else 1)
         result = runner.run(suite)
@@ -52,6 +133,7 @@ class TestRunner:
         # 添加 UI 測試
         suite.addTest(unittest.makeSuite(TestStreamlitUI))
         suite.addTest(unittest.makeSuite(TestUIIntegration))
+        suite.addTest(unittest.makeSuite(TestEntityDisplay))
         
         runner = unittest.TextTestRunner(verbosity=2 if self.verbose else 1)
         result = runner.run(suite)
@@ -66,6 +148,7 @@ class TestRunner:
         # 添加整合測試
         suite.addTest(unittest.makeSuite(TestIntegration))
         suite.addTest(unittest.makeSuite(TestDataFlowIntegration))
+        suite.addTest(unittest.makeSuite(TestBulkCommandLine))
         
         runner = unittest.TextTestRunner(verbosity=2 if self.verbose else 1)
         result = runner.run(suite)
@@ -134,8 +217,52 @@ class TestRunner:
         """執行特定測試"""
         test_classes = {
             "analyzer": TestNewsAnalyzer,
+            "fast_fetch": TestFastFetch,
+            "selectors": TestSelectorStrategies,
             "utils": TestUtilityFunctions,
+            "browser_pool": TestBrowserPool,
+            "http_fetcher": TestStaticExtraction,
+            "canonical_url": TestCanonicalUrl,
+            "http_first": TestHttpFirstFetch,
+            "cache_store": TestSQLiteCache,
+            "content_cache": TestFetchContentCache,
+            "analysis_cache": TestAnalysisCache,
+            "geocoder": TestSearchNominatim,
+            "geocode_cache": TestGeocodeCache,
+            "nominatim_scheduler": TestNominatimScheduler,
+            "gazetteer": TestGazetteer,
+            "prompt_caching": TestPromptCaching,
+            "cascade": TestModelCascade,
+            "fan_out": TestParallelFanOut,
+            "llm_json": TestIncrementalJSONParser,
+            "json_extract": TestExtractJSONObject,
+            "preprocess": TestPreprocessArticle,
+            "token_budget": TestTokenBudget,
+            "metrics": TestMetricsRegistry,
+            "instrumentation": TestStageInstrumentation,
+            "batch_input": TestInputParsing,
+            "batch": TestBatchPipeline,
+            "bulk": TestBulkAnalyzer,
+            "bulk_cli": TestBulkCommandLine,
+            "client_pool": TestAsyncClientPool,
+            "sync_wrapper": TestSyncWrapper,
+            "retry": TestRetryPolicy,
+            "hedging": TestHedgedRequests,
+            "deadline": TestAnalyzerDeadline,
+            "keyword_matcher": TestKeywordMatcher,
+            "rumor_rules": TestRumorClassifier,
+            "pre_classify": TestPreClassification,
+            "minhash": TestMinHash,
+            "duplicate_index": TestNearDuplicateIndex,
+            "dedupe": TestAnalyzerDeduplication,
+            "history": TestHistoryStore,
+            "history_recording": TestHistoryRecording,
+            "history_view": TestHistoryView,
+            "trends": TestTrendAggregation,
+            "trend_loading": TestTrendLoading,
+            "streaming": TestStreamingAnalysis,
             "ui": TestStreamlitUI,
+            "entity_display": TestEntityDisplay,
             "ui_integration": TestUIIntegration,
             "integration": TestIntegration,
             "data_flow": TestDataFlowIntegration
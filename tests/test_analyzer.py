@@ -8,7 +8,10 @@ import os
 # 添加專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import NewsAnalyzer
+import news_analyzer
+from news_analyzer import NewsAnalyzer, is_tracker_url
+from http_fetcher import pick_article_text
+from metrics import MetricsRegistry
 
 
 class TestNewsAnalyzer(unittest.TestCase):
@@ -142,33 +145,457 @@ class TestNewsAnalyzer(unittest.TestCase):
             self.assertIn("name", location)
             self.assertIn("map_link", location)
 
-    @patch('app.async_playwright')
-    async def test_fetch_article_content_success(self, mock_playwright):
+    @patch('news_analyzer.get_browser_pool')
+    async def test_fetch_article_content_success(self, mock_get_pool):
         """測試網頁內容抓取成功"""
-        # 模擬 Playwright 回應
-        mock_context = AsyncMock()
-        mock_page = AsyncMock()
-        mock_element = AsyncMock()
-        
-        mock_element.inner_text.return_value = "測試新聞內容" * 50  # 確保長度足夠
-        mock_page.query_selector.return_value = mock_element
-        mock_context.new_page.return_value = mock_page
-        mock_playwright.return_value.__aenter__.return_value.chromium.launch.return_value = mock_context
+        # 模擬瀏覽器池回應
+        mock_get_pool.return_value.run = AsyncMock(
+            return_value=("article", "測試新聞內容" * 50, {}))  # 確保長度足夠
         
         result = await self.analyzer.fetch_article_content("https://example.com/news")
         
         self.assertIn("測試新聞內容", result)
 
-    @patch('app.async_playwright')
-    async def test_fetch_article_content_failure(self, mock_playwright):
+    @patch('news_analyzer.get_browser_pool')
+    async def test_fetch_article_content_failure(self, mock_get_pool):
         """測試網頁內容抓取失敗"""
-        mock_playwright.side_effect = Exception("網路錯誤")
+        mock_get_pool.return_value.run = AsyncMock(side_effect=Exception("網路錯誤"))
         
         result = await self.analyzer.fetch_article_content("https://example.com/news")
         
         self.assertIn("抓取失敗", result)
 
 
+class TestPromptCaching(unittest.TestCase):
+    """提示詞快取測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False)
+        self.analyzer.async_client = AsyncMock()
+        self.analyzer.async_client.messages.create.return_value = Mock(
+            content=[Mock(text="{}")],
+            usage=Mock(input_tokens=150, cache_creation_input_tokens=0,
+                       cache_read_input_tokens=1480, output_tokens=700),
+        )
+
+    def analyze(self, content):
+        with patch('builtins.print'):
+            self.analyzer.analyze_news(content)
+        return self.analyzer.async_client.messages.create.call_args.kwargs
+
+    def test_static_instructions_are_cacheable_prefix(self):
+        """測試分析指示為標記快取的系統提示詞，新聞內容只出現在使用者訊息"""
+        request = self.analyze("立法院今日三讀通過法案。")
+
+        system = request["system"]
+        self.assertEqual(system[0]["text"], news_analyzer.ANALYSIS_SYSTEM_PROMPT)
+        self.assertEqual(system[0]["cache_control"], {"type": "ephemeral"})
+        self.assertNotIn("立法院今日三讀", system[0]["text"])
+        self.assertIn("立法院今日三讀通過法案。", request["messages"][0]["content"])
+
+    def test_prefix_identical_across_articles(self):
+        """測試不同新聞共用完全相同的系統提示詞"""
+        first = self.analyze("第一篇新聞")
+        second = self.analyze("第二篇新聞")
+
+        self.assertEqual(first["system"], second["system"])
+
+    def test_usage_recorded(self):
+        """測試記錄快取讀取與未快取的輸入 token"""
+        self.analyze("新聞內容")
+
+        self.assertEqual(self.analyzer.last_usage, {
+            "input_tokens": 150, "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 1480, "output_tokens": 700,
+        })
+
+
+def analysis_response(truthfulness, importance, category=None):
+    """產生指定分數的模型回應"""
+    category = category or news_analyzer.drink_category(truthfulness, importance)
+    text = json.dumps({
+        "summary": "測試摘要", "target_audience": "一般讀者",
+        "truthfulness": truthfulness, "importance": importance, "impact": 50,
+        "drink_recommendation": {"name": "飲料", "reason": "理由", "category": category},
+    }, ensure_ascii=False)
+    return Mock(content=[Mock(text=text)], usage=None)
+
+
+class TestModelCascade(unittest.TestCase):
+    """分級模型測試：先用快速模型，接近分類門檻時才改用設定的模型"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", "large-model", cache_analysis=False,
+                                     cascade=True, triage_model="small-model",
+                                     cascade_margin=10, hedge_after="off")
+        self.analyzer.async_client = AsyncMock()
+        self.create = self.analyzer.async_client.messages.create
+        self.metrics = MetricsRegistry(path=None)
+        for patcher in (patch('news_analyzer._cascade_counts', news_analyzer.Counter()),
+                        patch('news_analyzer.get_metrics', return_value=self.metrics),
+                        patch('llm_retry.get_metrics', return_value=self.metrics)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def analyze(self, *responses, **kwargs):
+        self.create.side_effect = list(responses)
+        with patch('builtins.print'):
+            return self.analyzer.analyze_news("測試新聞內容", **kwargs)
+
+    def models(self):
+        return [call.kwargs["model"] for call in self.create.call_args_list]
+
+    def test_clear_scores_use_triage_model(self):
+        """測試分數遠離門檻時只呼叫快速模型"""
+        result = self.analyze(analysis_response(90, 30))
+
+        self.assertEqual(result["drink_recommendation"]["category"], "honey_green")
+        self.assertEqual(self.models(), ["small-model"])
+        self.assertFalse(self.analyzer.last_cascade["escalated"])
+
+    def test_scores_near_threshold_escalate(self):
+        """測試任一分數在門檻附近時改用設定的模型"""
+        result = self.analyze(analysis_response(90, 65), analysis_response(88, 75))
+
+        self.assertEqual(self.models(), ["small-model", "large-model"])
+        self.assertEqual(result["importance"], 75)
+        self.assertEqual(self.analyzer.last_cascade["reason"], "near_threshold")
+
+    def test_invalid_or_inconsistent_output_escalates(self):
+        """測試快速模型結果無法解析或分類與分數不符時升級"""
+        invalid = Mock(content=[Mock(text="無法分析")], usage=None)
+        self.analyze(invalid, analysis_response(20, 20))
+        self.assertEqual(self.analyzer.last_cascade["reason"], "invalid")
+
+        self.create.reset_mock()
+        self.analyze(analysis_response(95, 20, "golden_lemon"), analysis_response(20, 20))
+        self.assertEqual(self.analyzer.last_cascade["reason"], "inconsistent")
+        self.assertEqual(self.models(), ["small-model", "large-model"])
+
+    def test_triage_failure_escalates(self):
+        """測試快速模型呼叫失敗時改用設定的模型"""
+        result = self.analyze(Exception("model not found"), analysis_response(20, 20))
+
+        self.assertNotIn("error", result)
+        self.assertEqual(self.analyzer.last_cascade["reason"], "triage_failed")
+
+    def test_stats_report_escalation_rate(self):
+        """測試統計升級比例與估計節省的時間"""
+        for _ in range(3):
+            self.metrics.observe("claude_attempt", 10.0, model="large-model")
+        self.analyze(analysis_response(90, 30))
+        self.analyze(analysis_response(90, 65), analysis_response(88, 75))
+
+        stats = news_analyzer.cascade_stats()
+        self.assertEqual(stats["triaged"], 2)
+        self.assertEqual(stats["escalation_rate"], 0.5)
+        self.assertEqual(stats["reasons"], {"near_threshold": 1})
+        self.assertGreater(stats["saved_seconds"], 9)
+
+    def test_streaming_reports_triage_result_once(self):
+        """測試串流模式下快速模型的結果一次回報所有欄位"""
+        progress = []
+        result = self.analyze(analysis_response(10, 10),
+                              on_progress=lambda fields, partial: progress.append(fields))
+
+        self.assertEqual(progress, [result])
+
+
+class TestParallelFanOut(unittest.TestCase):
+    """平行分析測試：評分與實體擷取同時呼叫後合併"""
+
+    ENTITIES = {"people": [{"name": "王小明", "title": "部長", "wiki_link": ""}],
+                "locations": [{"name": "台北市"}]}
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False, fan_out=True,
+                                     hedge_after="off")
+        self.analyzer.async_client = AsyncMock()
+        self.events = []
+        self.entity_reply = json.dumps({"entities": self.ENTITIES}, ensure_ascii=False)
+        self.entity_delay = 0.05
+        self.analyzer.async_client.messages.create.side_effect = self.create
+
+    async def create(self, **request):
+        if request["system"][0]["text"] == news_analyzer.ENTITY_SYSTEM_PROMPT:
+            self.events.append("entities started")
+            await asyncio.sleep(self.entity_delay)
+            self.events.append("entities done")
+            if isinstance(self.entity_reply, Exception):
+                raise self.entity_reply
+            return Mock(content=[Mock(text=self.entity_reply)], usage=None)
+        self.events.append("scoring started")
+        return analysis_response(85, 90)
+
+    def analyze(self, **kwargs):
+        with patch('builtins.print'):
+            return self.analyzer.analyze_news("測試新聞內容", **kwargs)
+
+    def test_results_merged_into_single_shape(self):
+        """測試兩個呼叫的結果合併為完整分析結果"""
+        result = self.analyze()
+
+        self.assertEqual(result["drink_recommendation"]["category"], "golden_lemon")
+        self.assertEqual(result["entities"], self.ENTITIES)
+        requests = [call.kwargs for call in
+                    self.analyzer.async_client.messages.create.call_args_list]
+        self.assertEqual(len(requests), 2)
+        scoring = next(r for r in requests
+                       if r["system"][0]["text"] == news_analyzer.SCORING_SYSTEM_PROMPT)
+        self.assertNotIn('"entities"', scoring["system"][0]["text"])
+        self.assertLess(scoring["max_tokens"], 2000)
+
+    def test_calls_run_concurrently(self):
+        """測試實體擷取進行中評分呼叫就已送出"""
+        self.analyze()
+
+        self.assertLess(self.events.index("scoring started"), self.events.index("entities done"))
+
+    def test_scores_reported_before_entities(self):
+        """測試評分完成即回報進度，不等待實體擷取"""
+        reported = []
+
+        def on_progress(fields, partial):
+            if "drink_recommendation" in fields and not reported:
+                reported.append(list(self.events))
+
+        self.analyzer.async_client.messages.stream = Mock(side_effect=self.fake_stream)
+        result = self.analyze(on_progress=on_progress)
+
+        self.assertNotIn("entities done", reported[0])
+        self.assertEqual(result["entities"], self.ENTITIES)
+
+    def fake_stream(self, **request):
+        text = analysis_response(85, 90).content[0].text
+        events = self.events
+
+        class Stream:
+            async def __aenter__(self):
+                events.append("scoring started")
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            @property
+            async def text_stream(self):
+                for start in range(0, len(text), 20):
+                    yield text[start:start + 20]
+
+            async def get_final_message(self):
+                return Mock(usage=None)
+
+        return Stream()
+
+    def test_entity_failure_keeps_scores(self):
+        """測試實體擷取失敗時仍返回評分結果"""
+        self.entity_reply = Exception("bad request")
+        result = self.analyze()
+
+        self.assertEqual(result["importance"], 90)
+        self.assertEqual(result["entities"], {})
+
+    def test_full_prompt_unchanged(self):
+        """測試拆分段落後完整分析的提示詞仍包含評分與實體欄位"""
+        prompt = news_analyzer.ANALYSIS_SYSTEM_PROMPT
+        self.assertIn('"drink_recommendation"', prompt)
+        self.assertIn('"entities"', prompt)
+        self.assertNotEqual(news_analyzer.PROMPT_VERSION, news_analyzer.FAN_OUT_PROMPT_VERSION)
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, request):
+        self.request = request
+        self.action = None
+
+    async def abort(self):
+        self.action = "abort"
+
+    async def continue_(self):
+        self.action = "continue"
+
+
+class FakeElement:
+    def __init__(self, text):
+        self.text = text
+
+    async def inner_text(self):
+        return self.text
+
+
+class FakeArticlePage:
+    """模擬 Playwright 頁面，goto 時將預設請求送進攔截器"""
+
+    def __init__(self, elements, requests=()):
+        self.elements = elements
+        self.requests = requests
+        self.routes = []
+        self.goto_calls = []
+        self.round_trips = 0
+
+    async def route(self, pattern, handler):
+        self.handler = handler
+
+    async def goto(self, url, wait_until=None, timeout=None):
+        self.goto_calls.append(wait_until)
+        for request in self.requests:
+            route = FakeRoute(request)
+            await self.handler(route)
+            self.routes.append(route)
+
+    async def wait_for_selector(self, selector, timeout=None):
+        return None
+
+    async def query_selector(self, selector):
+        self.round_trips += 1
+        return self.elements.get(selector)
+
+    async def evaluate(self, expression, arg):
+        # 以 Python 模擬 SCORE_SELECTORS_JS 的評分規則
+        self.round_trips += 1
+        selectors, min_length = arg
+        texts = {s: self.elements[s].text for s in selectors if s in self.elements}
+        selector, text = pick_article_text(texts, selectors, min_length)
+        return {
+            "selector": selector,
+            "text": text,
+            "length": len(text),
+            "candidates": [{"selector": s, "length": len(t), "error": None}
+                           for s, t in texts.items()],
+        }
+
+
+class FakePool:
+    def __init__(self, page):
+        self.page = page
+
+    async def run(self, page_fn):
+        return await page_fn(self.page)
+
+
+class TestFastFetch(unittest.TestCase):
+    """快速抓取模式測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", fast_fetch=True, http_first=False,
+                                     fetch_cache=False)
+        self.page = FakeArticlePage(
+            {"article": FakeElement("快速抓取的新聞內容。" * 30)},
+            [
+                FakeRequest("https://news.example.com/a.html", "document"),
+                FakeRequest("https://news.example.com/photo.jpg", "image"),
+                FakeRequest("https://news.example.com/font.woff2", "font"),
+                FakeRequest("https://www.google-analytics.com/g/collect", "xhr"),
+                FakeRequest("https://news.example.com/app.js", "script"),
+            ],
+        )
+
+    def fetch(self):
+        with patch('news_analyzer.get_browser_pool', return_value=FakePool(self.page)):
+            return asyncio.run(
+                self.analyzer.fetch_article_content("https://news.example.com/a.html")
+            )
+
+    def test_fast_fetch_blocks_heavy_requests(self):
+        """測試快速模式攔截圖片、字型與追蹤請求"""
+        content = self.fetch()
+
+        self.assertIn("快速抓取的新聞內容", content)
+        actions = [route.action for route in self.page.routes]
+        self.assertEqual(actions, ["continue", "abort", "abort", "abort", "continue"])
+        self.assertEqual(self.page.goto_calls, ["domcontentloaded"])
+
+    def test_fast_fetch_records_stage_timings(self):
+        """測試快速模式記錄各階段耗時"""
+        self.fetch()
+
+        timings = self.analyzer.last_fetch_timings
+        for stage in ["acquire", "goto", "selector_wait", "extract", "total"]:
+            self.assertIn(stage, timings)
+        self.assertEqual(timings["blocked_requests"], 3)
+
+    def test_fast_fetch_deadline(self):
+        """測試快速模式超過抓取期限"""
+        self.analyzer.fetch_deadline = 0.05
+
+        async def slow_goto(url, wait_until=None, timeout=None):
+            await asyncio.sleep(1)
+
+        self.page.goto = slow_goto
+        content = self.fetch()
+
+        self.assertIn("抓取失敗", content)
+
+    def test_tracker_url_detection(self):
+        """測試追蹤網域判斷"""
+        self.assertTrue(is_tracker_url("https://www.googletagmanager.com/gtm.js"))
+        self.assertTrue(is_tracker_url("https://securepubads.g.doubleclick.net/x"))
+        self.assertFalse(is_tracker_url("https://news.ltn.com.tw/news/1"))
+        self.assertFalse(is_tracker_url("https://notdoubleclick.net/x"))
+
+
+class TestSelectorStrategies(unittest.TestCase):
+    """選擇器擷取策略測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.page = FakeArticlePage({
+            "article": FakeElement("短內容"),
+            ".content": FakeElement("較長的內容。" * 10),
+            "main": FakeElement("主要區塊。" * 5),
+        })
+
+    def extract(self, **kwargs):
+        analyzer = NewsAnalyzer("test_api_key", **kwargs)
+        return asyncio.run(analyzer._extract_article_text(self.page))
+
+    def test_evaluate_uses_single_round_trip(self):
+        """測試單次 evaluate 取得最佳文字區塊"""
+        selector, text = self.extract()
+
+        self.assertEqual(self.page.round_trips, 1)
+        self.assertEqual(selector, ".content")
+        self.assertEqual(text, "較長的內容。" * 10)
+
+    def test_evaluate_prefers_first_long_enough(self):
+        """測試優先選擇依序第一個超過最低長度的區塊"""
+        self.page.elements["main"] = FakeElement("主要區塊。" * 100)
+        self.page.elements["article"] = FakeElement("文章內容。" * 50)
+
+        selector, _ = self.extract()
+
+        self.assertEqual(selector, "article")
+
+    def test_sequential_strategy_kept_for_comparison(self):
+        """測試保留逐一查詢的舊行為"""
+        selector, text = self.extract(selector_strategy="sequential")
+
+        self.assertEqual(self.page.round_trips, 8)
+        self.assertEqual(selector, "main")
+        self.assertEqual(text, "主要區塊。" * 5)
+
+    def test_custom_selectors(self):
+        """測試自訂選擇器清單"""
+        selector, _ = self.extract(selectors=["main"])
+
+        self.assertEqual(selector, "main")
+
+    def test_unknown_strategy(self):
+        """測試未知的擷取策略"""
+        with self.assertRaises(ValueError):
+            NewsAnalyzer("test_api_key", selector_strategy="parallel")
+
+
 class TestUtilityFunctions(unittest.TestCase):
     """工具函數測試"""
     
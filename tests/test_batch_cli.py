@@ -0,0 +1,213 @@
+import unittest
+import sys
+import os
+import csv
+import json
+import asyncio
+import tempfile
+from concurrent.futures import Future
+from unittest.mock import patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_cli import (
+    CSV_FIELDS, ResultWriter, completed_ids, main, parse_input_line, read_inputs, run_batch
+)
+
+
+ANALYSIS = {
+    "summary": "立法院三讀通過勞基法修正案",
+    "target_audience": "勞工",
+    "truthfulness": 88,
+    "importance": 80,
+    "impact": 75,
+    "drink_recommendation": {"name": "金桔檸檬", "reason": "官方來源", "category": "golden_lemon"},
+    "entities": {"locations": [{"name": "台北市"}]},
+}
+
+
+class FakeAnalyzer:
+    """以網址決定抓取結果的假分析器，記錄同時進行中的抓取數"""
+
+    active = 0
+    peak = 0
+
+    def __init__(self):
+        self.last_fetch_tier = None
+
+    async def fetch_article_content(self, url):
+        FakeAnalyzer.active += 1
+        FakeAnalyzer.peak = max(FakeAnalyzer.peak, FakeAnalyzer.active)
+        await asyncio.sleep(0.01)
+        FakeAnalyzer.active -= 1
+        if "broken" in url:
+            return "抓取失敗: 連線逾時"
+        self.last_fetch_tier = "http"
+        return f"{url} 的新聞內容"
+
+    async def analyze_news_async(self, content, bypass_cache=False, source=None):
+        return json.loads(json.dumps(ANALYSIS))
+
+
+class TestInputParsing(unittest.TestCase):
+    """批次輸入解析測試"""
+
+    def test_line_types(self):
+        """測試網址、JSON 與文字檔路徑"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "a.txt"), "w", encoding="utf-8") as f:
+                f.write("文章內容")
+
+            url = parse_input_line("https://news.example.com/1\n")
+            text = parse_input_line('{"id": "n1", "text": "新聞"}')
+            path = parse_input_line("a.txt", tmpdir)
+
+        self.assertEqual(url["id"], "https://news.example.com/1")
+        self.assertEqual(text["id"], "n1")
+        self.assertEqual(path["text"], "文章內容")
+        self.assertIsNone(parse_input_line("# 註解"))
+        self.assertIsNone(parse_input_line("   "))
+
+    def test_bad_line_becomes_error_record(self):
+        """測試無法解析的行輸出為錯誤紀錄而不中斷"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "inputs.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("missing.txt\nhttps://news.example.com/1\n")
+
+            records = list(read_inputs([path]))
+
+        self.assertIn("輸入無法解析", records[0]["error"])
+        self.assertEqual(records[1]["url"], "https://news.example.com/1")
+
+
+class TestBatchPipeline(unittest.TestCase):
+    """批次管線測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        FakeAnalyzer.active = FakeAnalyzer.peak = 0
+        patcher = patch('batch_cli.resolve_location_async',
+                        side_effect=self.resolve)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def resolve(name):
+        future = Future()
+        future.set_result(f"https://www.openstreetmap.org/relation/{len(name)}")
+        return future
+
+    def run_batch(self, records, path, fmt="jsonl", **kwargs):
+        writer = ResultWriter(path, fmt)
+        try:
+            return asyncio.run(run_batch(iter(records), writer, FakeAnalyzer, **kwargs))
+        finally:
+            writer.close()
+
+    def read_jsonl(self, path):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_results_streamed_with_bounded_fetch(self):
+        """測試每筆結果寫入輸出，抓取並行數不超過 worker 數"""
+        records = [{"id": str(i), "source": f"https://news.example.com/{i}",
+                    "url": f"https://news.example.com/{i}"} for i in range(10)]
+        records.append({"id": "t", "source": "text:t", "text": "新聞內容"})
+        path = os.path.join(self.tmpdir.name, "out.jsonl")
+
+        with patch('builtins.print'):
+            summary = self.run_batch(records, path, fetch_workers=3)
+
+        rows = self.read_jsonl(path)
+        self.assertEqual(summary, {"written": 11, "failed": 0, "skipped": 0})
+        self.assertEqual(sorted(row["id"] for row in rows), sorted(r["id"] for r in records))
+        self.assertLessEqual(FakeAnalyzer.peak, 3)
+        location = rows[0]["analysis"]["entities"]["locations"][0]
+        self.assertEqual(location["osm_link"], "https://www.openstreetmap.org/relation/3")
+
+    def test_fetch_failure_recorded(self):
+        """測試抓取失敗的紀錄以錯誤輸出且不送去分析"""
+        path = os.path.join(self.tmpdir.name, "out.jsonl")
+        records = [{"id": "b", "source": "https://broken.example.com",
+                    "url": "https://broken.example.com"}]
+
+        with patch('builtins.print'):
+            summary = self.run_batch(records, path)
+
+        row = self.read_jsonl(path)[0]
+        self.assertEqual(row["status"], "error")
+        self.assertIn("抓取失敗", row["error"])
+        self.assertNotIn("analysis", row)
+        self.assertEqual(summary["failed"], 1)
+
+    def test_resume_skips_completed(self):
+        """測試續跑時略過已完成的紀錄，重試失敗的紀錄並忽略中斷時寫一半的行"""
+        path = os.path.join(self.tmpdir.name, "out.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "1", "status": "ok"}) + "\n")
+            f.write(json.dumps({"id": "2", "status": "error"}) + "\n")
+            f.write('{"id": "3", "sta')
+
+        records = [{"id": i, "source": i, "text": "新聞"} for i in ("1", "2", "3")]
+        done = completed_ids(path, "jsonl")
+        with patch('builtins.print'):
+            summary = self.run_batch(records, path, skip_ids=done)
+
+        self.assertEqual(done, {"1"})
+        self.assertEqual(summary["skipped"], 1)
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[2], '{"id": "3", "sta')
+        self.assertEqual(sorted(json.loads(line)["id"] for line in lines[3:]), ["2", "3"])
+
+    def test_csv_output(self):
+        """測試 CSV 輸出與續跑"""
+        path = os.path.join(self.tmpdir.name, "out.csv")
+        records = [{"id": "1", "source": "1", "text": "新聞"}]
+
+        with patch('builtins.print'):
+            self.run_batch(records, path, fmt="csv", geocode=False)
+            self.run_batch([{"id": "2", "source": "2", "text": "新聞"}], path, fmt="csv")
+
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row["id"] for row in rows], ["1", "2"])
+        self.assertEqual(rows[0]["drink_category"], "golden_lemon")
+        self.assertEqual(json.loads(rows[0]["locations"]), [{"name": "台北市"}])
+        self.assertEqual(completed_ids(path, "csv"), {"1", "2"})
+
+    def test_csv_resume_ignores_truncated_row(self):
+        """測試 CSV 最後一列在 status 欄之後中斷時不視為已完成，續跑後也不會誤判"""
+        path = os.path.join(self.tmpdir.name, "out.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(CSV_FIELDS) + "\r\n")
+            f.write("1,1,ok," + "," * (len(CSV_FIELDS) - 4) + "0.5\r\n")
+            f.write("2,2,ok,,http,摘要寫到一半")
+
+        self.assertEqual(completed_ids(path, "csv"), {"1"})
+        with patch('builtins.print'):
+            summary = self.run_batch([{"id": i, "source": i, "text": "新聞"} for i in ("1", "2")],
+                                     path, fmt="csv", skip_ids=completed_ids(path, "csv"))
+
+        self.assertEqual(summary["skipped"], 1)
+        # 殘缺列補上換行後獨立成一列，欄位不足仍不算完成，重新分析的結果在其後
+        self.assertEqual(completed_ids(path, "csv"), {"1", "2"})
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row["id"] for row in rows], ["1", "2", "2"])
+        self.assertIsNone(rows[1]["elapsed"])
+        self.assertIsNotNone(rows[2]["elapsed"])
+
+    def test_requires_api_key(self):
+        """測試未提供 API Key 時結束"""
+        with patch.dict(os.environ, {}, clear=True), \
+                patch('sys.stderr'), self.assertRaises(SystemExit):
+            main(["inputs.txt", "--output", "out.jsonl"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
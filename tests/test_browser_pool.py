@@ -0,0 +1,168 @@
+import unittest
+import sys
+import os
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background_loop import BackgroundLoop
+from browser_pool import BrowserPool
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def new_page(self):
+        return FakePage(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **options):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+        self.connected = False
+
+
+class FakeChromium:
+    def __init__(self):
+        self.browsers = []
+
+    async def launch(self, **options):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeChromium()
+        self.stopped = False
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        self.stopped = True
+
+
+class TestBrowserPool(unittest.TestCase):
+    """瀏覽器池測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.playwright = FakePlaywright()
+        self.runtime = BackgroundLoop(name="test-browser-pool")
+
+    def make_pool(self, **kwargs):
+        return BrowserPool(
+            runtime=self.runtime, playwright_factory=lambda: self.playwright, **kwargs
+        )
+
+    def run_page(self, pool, page_fn):
+        return self.runtime.run_sync(pool.run(page_fn), timeout=5)
+
+    def test_browser_is_reused_across_pages(self):
+        """測試瀏覽器在多次抓取間重複使用"""
+        pool = self.make_pool(size=1, max_pages_per_browser=10)
+
+        async def get_browser(page):
+            return page.context.browser
+
+        first = self.run_page(pool, get_browser)
+        second = self.run_page(pool, get_browser)
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.playwright.chromium.browsers), 1)
+
+    def test_each_page_gets_fresh_context(self):
+        """測試每次借出都使用新的隔離 context 並在結束後關閉"""
+        pool = self.make_pool(size=1)
+
+        async def get_context(page):
+            return page.context
+
+        first = self.run_page(pool, get_context)
+        second = self.run_page(pool, get_context)
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+
+    def test_browser_recycled_after_max_pages(self):
+        """測試瀏覽器服務滿指定頁數後回收"""
+        pool = self.make_pool(size=1, max_pages_per_browser=2)
+
+        async def noop(page):
+            return None
+
+        for _ in range(3):
+            self.run_page(pool, noop)
+
+        browsers = self.playwright.chromium.browsers
+        self.assertEqual(len(browsers), 2)
+        self.assertTrue(browsers[0].closed)
+        self.assertEqual(pool.stats()["recycled"], 1)
+
+    def test_crashed_browser_is_restarted(self):
+        """測試崩潰的瀏覽器在下次借出時重新啟動"""
+        pool = self.make_pool(size=1)
+
+        async def crash(page):
+            page.context.browser.connected = False
+            raise RuntimeError("Target closed")
+
+        async def get_browser(page):
+            return page.context.browser
+
+        with self.assertRaises(RuntimeError):
+            self.run_page(pool, crash)
+
+        browser = self.run_page(pool, get_browser)
+
+        self.assertTrue(browser.is_connected())
+        self.assertEqual(len(self.playwright.chromium.browsers), 2)
+        self.assertEqual(pool.stats()["crashed"], 1)
+
+    def test_shutdown_closes_browsers(self):
+        """測試關閉瀏覽器池"""
+        pool = self.make_pool(size=2)
+
+        async def noop(page):
+            return None
+
+        self.run_page(pool, noop)
+        pool.shutdown()
+
+        self.assertTrue(all(b.closed for b in self.playwright.chromium.browsers))
+        self.assertTrue(self.playwright.stopped)
+
+    def test_invalid_size(self):
+        """測試無效的瀏覽器池大小"""
+        with self.assertRaises(ValueError):
+            self.make_pool(size=0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
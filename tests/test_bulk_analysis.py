@@ -0,0 +1,153 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch
+
+import anthropic
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_cli import main
+from bulk_analysis import BulkAnalyzer, batch_custom_id
+from cache_store import SQLiteCache
+from fake_batch_server import FakeBatchServer, default_responder
+from news_analyzer import ANALYSIS_SYSTEM_PROMPT, NewsAnalyzer
+
+
+ARTICLES = [
+    ("https://news.example.com/1", "立法院今日三讀通過勞動基準法修正案。"),
+    ("https://news.example.com/2", "高雄港新航線今日正式啟用。"),
+    ("https://news.example.com/3", "台北市政府宣布明年起調整公車票價。"),
+]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestBulkAnalyzer(unittest.TestCase):
+    """Message Batches 批次分析測試（透過本機替身伺服器）"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.server = FakeBatchServer(polls_until_ended=1).start()
+        self.addCleanup(self.server.stop)
+        self.analyzer = self.make_analyzer()
+        self.state_path = os.path.join(self.tmpdir.name, "batches.json")
+
+    def make_analyzer(self):
+        analyzer = NewsAnalyzer("test_api_key")
+        analyzer.client = anthropic.Anthropic(api_key="test_api_key",
+                                              base_url=self.server.base_url)
+        analyzer.analysis_cache = SQLiteCache(
+            os.path.join(self.tmpdir.name, "analysis.sqlite3"), default_ttl=60)
+        self.addCleanup(analyzer.analysis_cache.close)
+        return analyzer
+
+    def bulk(self, **kwargs):
+        kwargs.setdefault("poll_interval", 0)
+        return BulkAnalyzer(self.analyzer, state_path=self.state_path, **kwargs)
+
+    def test_results_mapped_back_to_articles(self):
+        """測試結果依 custom_id 對應回文章 id，請求與單篇分析使用相同提示詞"""
+        with patch('builtins.print'):
+            results = self.bulk().run(ARTICLES)
+
+        self.assertEqual(set(results), {article_id for article_id, _ in ARTICLES})
+        self.assertEqual(results["https://news.example.com/2"]["summary"],
+                         "高雄港新航線今日正式啟用。")
+        request = self.server.created[0][0]
+        self.assertEqual(request["custom_id"], batch_custom_id("https://news.example.com/1"))
+        self.assertEqual(request["params"]["system"][0]["text"], ANALYSIS_SYSTEM_PROMPT)
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_cached_articles_not_resubmitted(self):
+        """測試結果寫入分析快取，之後單篇或批次分析都不再送出請求"""
+        with patch('builtins.print'):
+            self.bulk().run(ARTICLES[:2])
+            bulk = self.bulk()
+            results = bulk.run(ARTICLES)
+            single = self.analyzer.analyze_news(ARTICLES[0][1])
+
+        self.assertEqual(len(self.server.created), 2)
+        self.assertEqual(len(self.server.created[1]), 1)
+        self.assertEqual(bulk.stats["cached"], 2)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(self.analyzer.last_analysis_cached)
+        self.assertEqual(single, results[ARTICLES[0][0]])
+
+    def test_errored_request_reported(self):
+        """測試單筆請求失敗只影響該篇文章"""
+        def responder(params):
+            if "高雄港" in json.dumps(params, ensure_ascii=False):
+                return None
+            return default_responder(params)
+
+        self.server.responder = responder
+        with patch('builtins.print'):
+            results = self.bulk().run(ARTICLES)
+
+        self.assertIn("替身伺服器模擬失敗", results["https://news.example.com/2"]["error"])
+        self.assertNotIn("error", results["https://news.example.com/1"])
+
+    def test_large_corpus_split_into_batches(self):
+        """測試超過單批上限時切成多個批次"""
+        with patch('builtins.print'):
+            results = self.bulk(max_requests=2).run(ARTICLES)
+
+        self.assertEqual([len(requests) for requests in self.server.created], [2, 1])
+        self.assertEqual(len(results), 3)
+
+    def test_resume_after_interruption(self):
+        """測試輪詢中斷後重跑會繼續取回原批次而不重複送出"""
+        def interrupt(seconds):
+            raise Interrupted()
+
+        with patch('builtins.print'), self.assertRaises(Interrupted):
+            self.bulk(sleep=interrupt).run(ARTICLES)
+        self.assertTrue(os.path.exists(self.state_path))
+
+        with patch('builtins.print'):
+            results = self.bulk().run(ARTICLES)
+
+        self.assertEqual(len(self.server.created), 1)
+        self.assertEqual(len(results), 3)
+        self.assertFalse(os.path.exists(self.state_path))
+
+
+class TestBulkCommandLine(unittest.TestCase):
+    """批次命令列工具的 Message Batches 模式端對端測試"""
+
+    def test_bulk_mode_end_to_end(self):
+        """測試從輸入檔經替身伺服器到輸出檔"""
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                FakeBatchServer(polls_until_ended=2) as server:
+            inputs = os.path.join(tmpdir, "archive.jsonl")
+            output = os.path.join(tmpdir, "rescored.jsonl")
+            with open(inputs, "w", encoding="utf-8") as f:
+                for article_id, text in ARTICLES:
+                    f.write(json.dumps({"id": article_id, "text": text},
+                                       ensure_ascii=False) + "\n")
+
+            env = {"ANTHROPIC_API_KEY": "test_api_key", "ANTHROPIC_BASE_URL": server.base_url}
+            with patch.dict(os.environ, env), patch('builtins.print'):
+                status = main([inputs, "--output", output, "--bulk", "--poll-interval", "0",
+                               "--no-geocode", "--bypass-cache"])
+
+            with open(output, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(server.created), 1)
+        self.assertEqual(sorted(row["id"] for row in rows),
+                         sorted(article_id for article_id, _ in ARTICLES))
+        self.assertTrue(all(row["status"] == "ok" for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,241 @@
+import unittest
+import asyncio
+import sys
+import os
+import tempfile
+import time
+import json
+from unittest.mock import patch, AsyncMock, Mock
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import news_analyzer
+from news_analyzer import NewsAnalyzer
+from analysis_cache import analysis_cache_key
+from cache_store import SQLiteCache
+
+
+class TestSQLiteCache(unittest.TestCase):
+    """持久化快取測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "test.sqlite3")
+        self.cache = SQLiteCache(self.path, default_ttl=60)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_set_and_get(self):
+        """測試寫入與讀取"""
+        self.cache.set("key", {"text": "內容"})
+
+        self.assertEqual(self.cache.get("key"), {"text": "內容"})
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_persisted_across_instances(self):
+        """測試資料持久化於磁碟"""
+        self.cache.set("key", [1, 2, 3])
+        other = SQLiteCache(self.path)
+
+        self.assertEqual(other.get("key"), [1, 2, 3])
+        other.close()
+
+    def test_expired_entry_returned_for_revalidation(self):
+        """測試過期項目仍可取得以便重新驗證"""
+        self.cache.set("key", "舊內容", ttl=-1)
+
+        self.assertIsNone(self.cache.get("key"))
+        entry = self.cache.get_entry("key")
+        self.assertTrue(entry["expired"])
+        self.assertEqual(entry["value"], "舊內容")
+
+        self.cache.refresh("key")
+        self.assertEqual(self.cache.get("key"), "舊內容")
+
+    def test_lru_eviction_by_size(self):
+        """測試超過容量時淘汰最久未使用的項目"""
+        cache = SQLiteCache(os.path.join(self.tmpdir.name, "lru.sqlite3"), max_bytes=350)
+        for key in ["a", "b", "c"]:
+            cache.set(key, "x" * 100)
+            time.sleep(0.01)
+        cache.get("a")  # a 變成最近使用
+        time.sleep(0.01)
+        cache.set("d", "x" * 100)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("d"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.close()
+
+    def test_hit_miss_counters(self):
+        """測試命中與未命中計數"""
+        self.cache.set("key", 1)
+        self.cache.get("key")
+        self.cache.get("missing")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 0.5)
+
+
+class TestFetchContentCache(unittest.TestCase):
+    """抓取內容快取流程測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.analyzer = NewsAnalyzer("test_api_key")
+        self.analyzer.content_cache = SQLiteCache(
+            os.path.join(self.tmpdir.name, "content.sqlite3"), default_ttl=60
+        )
+        self.pool = AsyncMock()
+        self.pool.run.return_value = ("article", "瀏覽器內容。" * 50, {})
+
+    def tearDown(self):
+        self.analyzer.content_cache.close()
+        self.tmpdir.cleanup()
+
+    def fetch(self, url, static_result):
+        with patch('news_analyzer.fetch_static_article', return_value=static_result) as mock_static, \
+                patch('news_analyzer.get_browser_pool', return_value=self.pool):
+            content = asyncio.run(self.analyzer.fetch_article_content(url))
+        return content, mock_static
+
+    def static_result(self, status=200, text="", etag=None):
+        return {"status": status, "text": text, "selector": "article",
+                "client_rendered": False, "etag": etag, "last_modified": None}
+
+    def test_cache_hit_skips_fetch(self):
+        """測試快取命中時不發出任何請求"""
+        url = "https://news.example.com/a?utm_source=line"
+        first, _ = self.fetch(url, self.static_result(text="靜態內容。" * 50))
+        second, mock_static = self.fetch(
+            "https://news.example.com/a", self.static_result(text="不應使用")
+        )
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.analyzer.last_fetch_tier, "cache")
+        mock_static.assert_not_called()
+        self.pool.run.assert_not_called()
+
+    def test_expired_entry_revalidated_with_etag(self):
+        """測試過期項目以 ETag 條件式請求重新驗證"""
+        url = "https://news.example.com/b"
+        self.fetch(url, self.static_result(text="靜態內容。" * 50, etag='"v1"'))
+        self.analyzer.content_cache.refresh(
+            "https://news.example.com/b", ttl=-1
+        )
+
+        content, mock_static = self.fetch(url, self.static_result(status=304))
+
+        self.assertIn("靜態內容", content)
+        self.assertEqual(self.analyzer.last_fetch_tier, "cache")
+        headers = mock_static.call_args.kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(self.analyzer.content_cache.stats()["revalidated"], 1)
+        self.assertIsNotNone(self.analyzer.content_cache.get("https://news.example.com/b"))
+
+    def test_browser_result_cached(self):
+        """測試瀏覽器抓取結果寫入快取"""
+        url = "https://news.example.com/c"
+        self.fetch(url, self.static_result(text="短"))
+        self.fetch(url, self.static_result(text="短"))
+
+        self.pool.run.assert_called_once()
+        self.assertEqual(self.analyzer.last_fetch_tier, "cache")
+
+    def test_failures_not_cached(self):
+        """測試抓取失敗時不寫入快取"""
+        self.pool.run.return_value = (None, "", {})
+        content, _ = self.fetch("https://news.example.com/d", self.static_result())
+
+        self.assertIn("無法抓取", content)
+        self.assertEqual(self.analyzer.content_cache.stats()["entries"], 0)
+
+
+class TestAnalysisCache(unittest.TestCase):
+    """分析結果快取測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.analyzer = NewsAnalyzer("test_api_key")
+        self.analyzer.analysis_cache = SQLiteCache(
+            os.path.join(self.tmpdir.name, "analysis.sqlite3"), default_ttl=60
+        )
+        self.result = {
+            "summary": "摘要", "target_audience": "一般民眾",
+            "truthfulness": 80, "importance": 60, "impact": 50,
+            "drink_recommendation": {"name": "蜂蜜綠茶", "reason": "真實但不重要",
+                                     "category": "honey_green"},
+        }
+        self.analyzer.async_client = AsyncMock()
+        self.analyzer.async_client.messages.create.return_value = Mock(
+            content=[Mock(text="分析結果：" + json.dumps(self.result, ensure_ascii=False))]
+        )
+
+    def tearDown(self):
+        self.analyzer.analysis_cache.close()
+        self.tmpdir.cleanup()
+
+    def test_repeat_analysis_served_from_cache(self):
+        """測試相同內容第二次分析直接回傳快取結果"""
+        first = self.analyzer.analyze_news("台北市政府今日宣布新政策。")
+        self.assertFalse(self.analyzer.last_analysis_cached)
+
+        second = self.analyzer.analyze_news("  台北市政府今日宣布新政策。\r\n")
+
+        self.assertEqual(first, second)
+        self.assertTrue(self.analyzer.last_analysis_cached)
+        self.analyzer.async_client.messages.create.assert_called_once()
+
+    def test_bypass_flag_calls_api(self):
+        """測試略過快取時重新呼叫 API"""
+        self.analyzer.analyze_news("新聞內容")
+        self.analyzer.analyze_news("新聞內容", bypass_cache=True)
+
+        self.assertEqual(self.analyzer.async_client.messages.create.call_count, 2)
+        self.assertFalse(self.analyzer.last_analysis_cached)
+
+    def test_model_is_part_of_key(self):
+        """測試不同模型不共用快取"""
+        self.analyzer.analyze_news("新聞內容")
+        self.analyzer.model_name = "claude-3-opus-20240229"
+        self.analyzer.analyze_news("新聞內容")
+
+        self.assertEqual(self.analyzer.async_client.messages.create.call_count, 2)
+
+    def test_prompt_change_invalidates_cache(self):
+        """測試提示詞版本變更時快取失效"""
+        self.analyzer.analyze_news("新聞內容")
+        with patch.object(news_analyzer, "PROMPT_VERSION", "changed"):
+            self.analyzer.analyze_news("新聞內容")
+
+        self.assertEqual(self.analyzer.async_client.messages.create.call_count, 2)
+
+    def test_errors_not_cached(self):
+        """測試分析失敗不寫入快取"""
+        self.analyzer.async_client.messages.create.side_effect = Exception("API 錯誤")
+        result = self.analyzer.analyze_news("新聞內容")
+
+        self.assertIn("error", result)
+        self.assertEqual(self.analyzer.analysis_cache.stats()["entries"], 0)
+
+    def test_cache_key_normalizes_whitespace(self):
+        """測試快取鍵忽略空白差異但區分內容"""
+        key = analysis_cache_key("第一段\n\n第二段", "model", "v1")
+
+        self.assertEqual(key, analysis_cache_key("第一段 \n第二段  ", "model", "v1"))
+        self.assertNotEqual(key, analysis_cache_key("第一段\n第三段", "model", "v1"))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
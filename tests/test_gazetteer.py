@@ -0,0 +1,190 @@
+import unittest
+import sys
+import os
+import gzip
+import json
+import tempfile
+import xml.etree.ElementTree as ET
+from unittest.mock import patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geocoder
+from build_gazetteer import build_gazetteer, read_nominatim_dump, read_osm_xml
+from cache_store import SQLiteCache
+from gazetteer import Gazetteer
+
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="101" lat="25.03" lon="121.56">
+    <tag k="place" v="city"/>
+    <tag k="name" v="臺北市"/>
+  </node>
+  <node id="102" lat="25.04" lon="121.51">
+    <tag k="amenity" v="cafe"/>
+    <tag k="name" v="路邊咖啡"/>
+  </node>
+  <way id="201">
+    <tag k="tourism" v="attraction"/>
+    <tag k="name" v="台北101"/>
+    <tag k="alt_name" v="臺北101;Taipei 101"/>
+  </way>
+  <relation id="301">
+    <tag k="boundary" v="administrative"/>
+    <tag k="admin_level" v="4"/>
+    <tag k="name" v="臺北市"/>
+    <tag k="name:en" v="Taipei"/>
+  </relation>
+</osm>
+"""
+
+
+class TestGazetteer(unittest.TestCase):
+    """離線地名索引測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.gazetteer = Gazetteer([
+            ("台北市", "relation", 301),
+            ("立法院", "way", 202),
+            ("中正紀念堂", "way", 203),
+            ("台北市", "node", 101),
+        ])
+
+    def test_lookup(self):
+        """測試查詢收錄與未收錄的地名"""
+        self.assertEqual(self.gazetteer.lookup("立法院"), ("way", 202))
+        self.assertEqual(self.gazetteer.lookup_link("中正紀念堂"),
+                         "https://www.openstreetmap.org/way/203")
+        self.assertIsNone(self.gazetteer.lookup("台北"))
+        self.assertIsNone(self.gazetteer.lookup("台北市政府"))
+        self.assertIsNone(Gazetteer().lookup("台北市"))
+
+    def test_first_entry_wins_for_duplicate_names(self):
+        """測試同名時保留第一筆"""
+        self.assertEqual(len(self.gazetteer), 3)
+        self.assertEqual(self.gazetteer.lookup("台北市"), ("relation", 301))
+
+    def test_save_and_load_round_trip(self):
+        """測試索引檔寫出與載入"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "data", "gazetteer.tsv.gz")
+            self.gazetteer.save(path)
+            loaded = Gazetteer.load(path)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+
+        self.assertEqual(list(loaded.entries()), list(self.gazetteer.entries()))
+        self.assertTrue(lines[0].startswith("#"))
+        self.assertEqual(lines[1:], sorted(lines[1:]))
+
+
+class TestBuildGazetteer(unittest.TestCase):
+    """地名索引建立腳本測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_build_from_osm_xml(self):
+        """測試從 OSM XML 建立索引"""
+        gazetteer = build_gazetteer(read_osm_xml(self.write("taiwan.osm", OSM_XML)))
+
+        # 行政邊界 relation 優先於同名的聚落 node
+        self.assertEqual(gazetteer.lookup("台北市"), ("relation", 301))
+        self.assertEqual(gazetteer.lookup("taipei"), ("relation", 301))
+        # 別名以分號分隔
+        self.assertEqual(gazetteer.lookup("taipei 101"), ("way", 201))
+        self.assertEqual(gazetteer.lookup("台北101"), ("way", 201))
+        # 非地標的一般店家不收錄
+        self.assertIsNone(gazetteer.lookup("路邊咖啡"))
+
+    def test_osm_xml_releases_parsed_elements(self):
+        """測試逐筆讀取 OSM XML 時根元素不會累積已處理的節點"""
+        nodes = "".join(f'<node id="{i}"><tag k="place" v="village"/>'
+                        f'<tag k="name" v="村{i}"/></node>' for i in range(2000))
+        path = self.write("villages.osm", f'<osm version="0.6">{nodes}</osm>')
+        roots = []
+        iterparse = ET.iterparse
+
+        def tracking_iterparse(source, events):
+            for event, element in iterparse(source, ("start",) + tuple(events)):
+                if not roots:
+                    roots.append(element)
+                if event in events:
+                    yield event, element
+
+        with patch('build_gazetteer.ET.iterparse', tracking_iterparse):
+            sizes = [len(roots[0]) for _ in read_osm_xml(path)]
+
+        # 解析器一次讀入一個區塊，根元素最多只暫存區塊內的節點
+        self.assertEqual(len(sizes), 2000)
+        self.assertLess(max(sizes), 500)
+
+    def test_build_from_nominatim_dump(self):
+        """測試從 Nominatim 結果傾印建立索引"""
+        results = [
+            {"osm_type": "way", "osm_id": 202, "class": "office", "type": "government",
+             "display_name": "立法院, 中正區, 臺北市, 臺灣",
+             "namedetails": {"name": "立法院", "name:en": "Legislative Yuan"}},
+            {"osm_type": "relation", "osm_id": 301, "class": "boundary",
+             "type": "administrative", "display_name": "臺北市, 臺灣"},
+        ]
+        path = self.write("dump.jsonl", "\n".join(json.dumps(r) for r in results))
+        gazetteer = build_gazetteer(read_nominatim_dump(path))
+
+        self.assertEqual(gazetteer.lookup("立法院"), ("way", 202))
+        self.assertEqual(gazetteer.lookup("legislative yuan"), ("way", 202))
+        self.assertEqual(gazetteer.lookup("台北市"), ("relation", 301))
+
+
+class TestGazetteerLookup(unittest.TestCase):
+    """地點查詢優先使用離線索引的測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(os.path.join(self.tmpdir.name, "geocode.sqlite3"))
+        self.gazetteer = Gazetteer([("台北市", "relation", 301)])
+        for patcher in [
+            patch('geocoder.get_geocode_cache', return_value=self.cache),
+            patch('geocoder.get_gazetteer', return_value=self.gazetteer),
+            patch('geocoder._scheduler', geocoder.NominatimScheduler(rate=100)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_gazetteer_hit_skips_nominatim(self):
+        """測試索引收錄的地名不呼叫 Nominatim"""
+        with patch('geocoder.search_nominatim') as mock_search:
+            link = geocoder.get_openstreetmap_entity_link("臺北市")
+
+        self.assertEqual(link, "https://www.openstreetmap.org/relation/301")
+        mock_search.assert_not_called()
+        self.assertEqual(geocoder.get_nominatim_scheduler().stats()["gazetteer_hits"], 1)
+
+    def test_gazetteer_miss_falls_back_to_nominatim(self):
+        """測試索引未收錄時改查 Nominatim"""
+        with patch('geocoder.search_nominatim',
+                   return_value=("https://www.openstreetmap.org/way/202", "found")) as mock_search:
+            link = geocoder.get_openstreetmap_entity_link("立法院")
+
+        self.assertEqual(link, "https://www.openstreetmap.org/way/202")
+        mock_search.assert_called_once_with("立法院")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,307 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest.mock import patch, Mock
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import geocoder
+from cache_store import SQLiteCache
+
+
+def nominatim_response(results, status_code=200, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = results
+    return response
+
+
+TAIPEI_RESULT = [{"osm_type": "relation", "osm_id": 1293250, "class": "boundary",
+                  "type": "administrative"}]
+
+
+class TestLocationNormalization(unittest.TestCase):
+    """地點名稱正規化測試"""
+
+    def test_variant_characters(self):
+        """測試臺／台統一"""
+        self.assertEqual(geocoder.normalize_location_name("臺北市"),
+                         geocoder.normalize_location_name("台北市"))
+
+    def test_full_width_and_whitespace(self):
+        """測試全形轉半形與空白處理"""
+        self.assertEqual(geocoder.normalize_location_name(" 台北　101 "), "台北 101")
+        self.assertEqual(geocoder.normalize_location_name("立法 院"), "立法院")
+        self.assertEqual(geocoder.normalize_location_name("Ｔａｉｐｅｉ  City"),
+                         "taipei city")
+
+
+class TestSearchNominatim(unittest.TestCase):
+    """Nominatim 查詢結果分類測試"""
+
+    @patch('geocoder.requests.get')
+    def test_relation_found(self, mock_get):
+        """測試找到 relation 條目"""
+        mock_get.return_value = nominatim_response(TAIPEI_RESULT)
+
+        link, status = geocoder.search_nominatim("台北市")
+
+        self.assertEqual(link, "https://www.openstreetmap.org/relation/1293250")
+        self.assertEqual(status, "found")
+
+    @patch('geocoder.requests.get')
+    def test_no_results(self, mock_get):
+        """測試查無結果"""
+        mock_get.return_value = nominatim_response([])
+
+        link, status = geocoder.search_nominatim("不存在的地方")
+
+        self.assertTrue(link.startswith("https://www.openstreetmap.org/search"))
+        self.assertEqual(status, "not_found")
+
+    @patch('geocoder.requests.get')
+    def test_api_errors_fall_back(self, mock_get):
+        """測試 API 錯誤時返回備選搜尋連結"""
+        for response in [nominatim_response([], 403), requests.exceptions.Timeout()]:
+            with self.subTest(response=response):
+                if isinstance(response, Exception):
+                    mock_get.side_effect = response
+                else:
+                    mock_get.return_value = response
+                link, status = geocoder.search_nominatim("台北市")
+
+                self.assertIn("search?query=", link)
+                self.assertEqual(status, "fallback")
+
+    @patch('geocoder.requests.get')
+    def test_rate_limited_raises(self, mock_get):
+        """測試 HTTP 429 拋出 NominatimRateLimited 並帶回 Retry-After"""
+        for headers, expected in [({"Retry-After": "3"}, 3.0), ({}, None),
+                                  ({"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}, None)]:
+            with self.subTest(headers=headers):
+                mock_get.return_value = nominatim_response([], 429, headers)
+                with self.assertRaises(geocoder.NominatimRateLimited) as caught:
+                    geocoder.search_nominatim("台北市")
+                self.assertEqual(caught.exception.retry_after, expected)
+
+
+class TestGeocodeCache(unittest.TestCase):
+    """地點查詢快取測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(os.path.join(self.tmpdir.name, "geocode.sqlite3"))
+        for patcher in [
+            patch('geocoder.get_geocode_cache', return_value=self.cache),
+            patch('geocoder._scheduler', geocoder.NominatimScheduler(rate=100)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    @patch('geocoder.search_nominatim')
+    def test_repeat_lookup_served_from_cache(self, mock_search):
+        """測試同一地點（含異體字）只查詢一次"""
+        mock_search.return_value = ("https://www.openstreetmap.org/relation/1", "found")
+
+        first = geocoder.get_openstreetmap_entity_link("台北市")
+        second = geocoder.get_openstreetmap_entity_link("臺北市")
+
+        self.assertEqual(first, second)
+        mock_search.assert_called_once()
+        self.assertEqual(geocoder.geocode_cache_stats()["hits_found"], 1)
+
+    @patch('geocoder.search_nominatim')
+    def test_ttl_depends_on_status(self, mock_search):
+        """測試查無結果與備選連結使用較短的 TTL"""
+        ttls = {}
+        original_set = self.cache.set
+
+        def record_set(key, value, ttl=None):
+            ttls[value["status"]] = ttl
+            original_set(key, value, ttl=ttl)
+
+        with patch.object(self.cache, "set", side_effect=record_set):
+            for name, status in [("甲", "found"), ("乙", "not_found"), ("丙", "fallback")]:
+                mock_search.return_value = ("https://www.openstreetmap.org/x", status)
+                geocoder.get_openstreetmap_entity_link(name)
+
+        self.assertGreater(ttls["found"], ttls["not_found"])
+        self.assertGreater(ttls["not_found"], ttls["fallback"])
+
+    @patch('geocoder.search_nominatim')
+    def test_expired_fallback_is_retried(self, mock_search):
+        """測試備選連結過期後重新查詢"""
+        mock_search.return_value = ("https://www.openstreetmap.org/search?query=x", "fallback")
+        geocoder.get_openstreetmap_entity_link("台南市")
+        self.cache.refresh(geocoder.normalize_location_name("台南市"), ttl=-1)
+
+        mock_search.return_value = ("https://www.openstreetmap.org/relation/2", "found")
+        link = geocoder.get_openstreetmap_entity_link("台南市")
+
+        self.assertEqual(link, "https://www.openstreetmap.org/relation/2")
+        self.assertEqual(mock_search.call_count, 2)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Token bucket 節流測試"""
+
+    def test_waits_for_next_token(self):
+        """測試 token 用完時等待補充"""
+        now = [0.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = geocoder.TokenBucket(1.0, clock=lambda: now[0], sleep=fake_sleep)
+        bucket.acquire()
+        bucket.acquire()
+        bucket.acquire()
+
+        self.assertEqual(sleeps, [1.0, 1.0])
+        self.assertAlmostEqual(now[0], 2.0)
+
+    def test_invalid_rate(self):
+        """測試無效的速率"""
+        with self.assertRaises(ValueError):
+            geocoder.TokenBucket(0)
+
+
+class TestNominatimScheduler(unittest.TestCase):
+    """Nominatim 排程器測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(os.path.join(self.tmpdir.name, "geocode.sqlite3"))
+        patcher = patch('geocoder.get_geocode_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def lookup(self, name):
+        self.calls.append((name, time.monotonic()))
+        self.release.wait(5)
+        return f"https://www.openstreetmap.org/relation/{len(self.calls)}", "found"
+
+    def test_duplicate_in_flight_lookups_merged(self):
+        """測試查詢中的同名地點只發出一次請求"""
+        scheduler = geocoder.NominatimScheduler(rate=100, lookup=self.lookup)
+
+        first = scheduler.submit("台北市")
+        second = scheduler.submit("臺北市")
+        self.release.set()
+
+        self.assertIs(first, second)
+        self.assertEqual(first.result(5), second.result(5))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(scheduler.stats()["merged"], 1)
+
+    def test_rate_limit_spaces_requests(self):
+        """測試請求開始時間符合速率上限"""
+        self.release.set()
+        scheduler = geocoder.NominatimScheduler(rate=20, lookup=self.lookup)
+
+        futures = [scheduler.submit(name) for name in ["甲", "乙", "丙", "丁"]]
+        for future in futures:
+            future.result(5)
+
+        starts = [started for _, started in self.calls]
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        self.assertTrue(all(gap >= 0.045 for gap in gaps), gaps)
+
+    def test_requests_never_overlap(self):
+        """測試前一個請求完成後才開始下一個"""
+        active, overlaps = [0], []
+
+        def slow_lookup(name):
+            active[0] += 1
+            overlaps.append(active[0])
+            time.sleep(0.05)
+            active[0] -= 1
+            return "https://www.openstreetmap.org/node/1", "found"
+
+        scheduler = geocoder.NominatimScheduler(rate=100, lookup=slow_lookup)
+        futures = [scheduler.submit(name) for name in ["甲", "乙", "丙"]]
+        for future in futures:
+            future.result(5)
+
+        self.assertEqual(overlaps, [1, 1, 1])
+
+    def test_rate_limited_backs_off(self):
+        """測試 429 時返回搜尋連結、不寫入長效快取，並在下一個請求前暫停"""
+        responses = [geocoder.NominatimRateLimited(retry_after=0.2),
+                     ("https://www.openstreetmap.org/node/2", "found")]
+
+        def limited_lookup(name):
+            self.calls.append((name, time.monotonic()))
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        scheduler = geocoder.NominatimScheduler(rate=100, lookup=limited_lookup)
+        with patch('builtins.print'):
+            first = scheduler.submit("台北市").result(5)
+            second = scheduler.submit("立法院").result(5)
+
+        self.assertIn("search?query=", first)
+        self.assertEqual(second, "https://www.openstreetmap.org/node/2")
+        self.assertGreaterEqual(self.calls[1][1] - self.calls[0][1], 0.2)
+        self.assertEqual(self.cache.get("台北市")["status"], "fallback")
+        self.assertEqual(scheduler.stats()["rate_limited"], 1)
+
+    def test_backoff_grows_without_retry_after(self):
+        """測試沒有 Retry-After 時連續的 429 以指數退避"""
+        def limited_lookup(name):
+            raise geocoder.NominatimRateLimited()
+
+        scheduler = geocoder.NominatimScheduler(rate=100, lookup=limited_lookup)
+        with patch('builtins.print'):
+            backoffs = [scheduler._resolve(name, name, Future())
+                        for name in ["甲", "乙", "丙"]]
+
+        self.assertEqual(backoffs, [2, 4, 8])
+
+    def test_callback_and_cache(self):
+        """測試 callback 交回結果且結果寫入快取"""
+        self.release.set()
+        scheduler = geocoder.NominatimScheduler(rate=100, lookup=self.lookup)
+        received = []
+        done = threading.Event()
+
+        def callback(name, link):
+            received.append((name, link))
+            done.set()
+
+        scheduler.submit("高雄市", callback=callback)
+        self.assertTrue(done.wait(5))
+        again = scheduler.submit("高雄市").result(1)
+
+        self.assertEqual(received[0][0], "高雄市")
+        self.assertEqual(again, received[0][1])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(scheduler.stats()["cache_hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
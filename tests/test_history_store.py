@@ -0,0 +1,256 @@
+import unittest
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+import zlib
+from unittest.mock import MagicMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from history_store import HistoryStore, content_hash
+
+
+def make_analysis(summary, category="golden_lemon", truthfulness=90, importance=80, impact=70):
+    return {
+        "summary": summary, "target_audience": "一般民眾",
+        "truthfulness": truthfulness, "importance": importance, "impact": impact,
+        "drink_recommendation": {"name": "飲料", "reason": "理由", "category": category},
+        "entities": {"people": [{"name": "王小明", "title": "部長"}]},
+    }
+
+
+class TestHistoryStore(unittest.TestCase):
+    """分析歷史記錄測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "history.sqlite3")
+        self.store = HistoryStore(self.path)
+        self.addCleanup(self.store.close)
+        self.clock = 1_700_000_000.0
+        patcher = patch('history_store.time.time', side_effect=self.tick)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tick(self):
+        self.clock += 3600
+        return self.clock
+
+    def test_record_and_get(self):
+        """測試記錄的欄位與完整分析結果"""
+        analysis = make_analysis("行政院宣布調整基本工資")
+        record_id = self.store.record("新聞內容", analysis, url="https://example.com/1",
+                                      model="claude-test", timings={"analysis_ms": 1200})
+
+        record = self.store.get(record_id)
+        self.assertEqual(record["url"], "https://example.com/1")
+        self.assertEqual(record["domain"], "example.com")
+        self.assertEqual(record["content_hash"], content_hash(" 新聞內容 "))
+        self.assertEqual((record["truthfulness"], record["category"]), (90, "golden_lemon"))
+        self.assertEqual(record["entities"]["people"][0]["name"], "王小明")
+        self.assertEqual(record["timings"], {"analysis_ms": 1200})
+        self.assertEqual(record["analysis"], analysis)
+        self.assertIsNone(self.store.get(record_id + 1))
+
+    def test_latest_id(self):
+        """測試最新記錄 id 隨寫入改變，空資料庫為 0"""
+        self.assertEqual(self.store.latest_id(), 0)
+        record_id = self.store.record("a", make_analysis("摘要"))
+        self.assertEqual(self.store.latest_id(), record_id)
+
+    def test_keyset_pagination(self):
+        """測試分頁由新到舊、不重複不遺漏，最後一頁沒有游標"""
+        ids = [self.store.record(f"內容{i}", make_analysis(f"摘要{i}")) for i in range(7)]
+
+        seen, cursor = [], None
+        while True:
+            records, cursor = self.store.query(after=cursor, limit=3)
+            seen += [record["id"] for record in records]
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids[::-1])
+
+    def test_filters(self):
+        """測試依分類、分數範圍與時間篩選"""
+        self.store.record("a", make_analysis("真實新聞", truthfulness=95))
+        self.store.record("b", make_analysis("假新聞", category="expired_milk", truthfulness=10))
+        since = self.clock + 1
+        self.store.record("c", make_analysis("最新的假新聞", category="expired_milk",
+                                             truthfulness=30))
+
+        def summaries(**filters):
+            return [record["summary"] for record in self.store.query(**filters)[0]]
+
+        self.assertEqual(summaries(category="expired_milk"), ["最新的假新聞", "假新聞"])
+        self.assertEqual(summaries(scores={"truthfulness": (None, 20)}), ["假新聞"])
+        self.assertEqual(summaries(scores={"truthfulness": (20, 100)}), ["最新的假新聞", "真實新聞"])
+        self.assertEqual(summaries(since=since), ["最新的假新聞"])
+        self.assertEqual(summaries(until=since), ["假新聞", "真實新聞"])
+        self.assertEqual(summaries(since=self.clock + 1), [])
+        with self.assertRaises(ValueError):
+            self.store.query(scores={"summary": (0, 1)})
+
+    def test_full_text_search(self):
+        """測試中文全文搜尋：三字以上走 trigram 索引，兩字詞以 LIKE 比對，多個詞皆須出現"""
+        self.store.record("a", make_analysis("行政院宣布明年調整基本工資"))
+        self.store.record("b", make_analysis("颱風來襲，基本工資審議延期"))
+        self.store.record("c", make_analysis("颱風造成停班停課"))
+
+        def summaries(search, **filters):
+            return [record["summary"] for record in self.store.query(search=search, **filters)[0]]
+
+        self.assertEqual(len(summaries("基本工資")), 2)
+        self.assertEqual(summaries("颱風 基本工資"), ["颱風來襲，基本工資審議延期"])
+        self.assertEqual(len(summaries("颱風")), 2)
+        self.assertEqual(summaries("停課 颱風"), ["颱風造成停班停課"])
+        self.assertEqual(summaries("100%"), [])
+        self.assertEqual(summaries('"基本'), [])
+
+    def test_search_paginates(self):
+        """測試全文搜尋結果同樣以游標分頁"""
+        for i in range(5):
+            self.store.record(str(i), make_analysis(f"基本工資第{i}次調整"))
+
+        first, cursor = self.store.query(search="基本工資", limit=3)
+        rest, end = self.store.query(search="基本工資", after=cursor, limit=3)
+        self.assertEqual([r["summary"][-4] for r in first + rest], ["4", "3", "2", "1", "0"])
+        self.assertIsNone(end)
+
+    def test_persisted_across_instances(self):
+        """測試記錄寫入磁碟，重新開啟後仍可搜尋"""
+        self.store.record("a", make_analysis("行政院宣布明年調整基本工資"))
+        self.store.close()
+
+        reopened = HistoryStore(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(len(reopened.query(search="基本工資")[0]), 1)
+
+    def test_migrates_older_database(self):
+        """測試沒有網域欄位與實體索引的舊資料庫開啟時自動補建"""
+        self.store.close()
+        path = os.path.join(self.tmpdir.name, "old.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE analyses (id INTEGER PRIMARY KEY, created_at REAL NOT NULL, "
+                     "url TEXT, content_hash TEXT NOT NULL, model TEXT, truthfulness INTEGER, "
+                     "importance INTEGER, impact INTEGER, category TEXT, "
+                     "summary TEXT NOT NULL DEFAULT '', entities TEXT, timings TEXT, "
+                     "analysis BLOB NOT NULL)")
+        analysis = make_analysis("舊記錄")
+        conn.execute("INSERT INTO analyses (created_at, url, content_hash, summary, entities, "
+                     "analysis) VALUES (1, 'https://www.cna.com.tw/1', 'x', '舊記錄', ?, ?)",
+                     (json.dumps(analysis["entities"]), zlib.compress(b"{}")))
+        conn.commit()
+        conn.close()
+
+        store = HistoryStore(path)
+        self.addCleanup(store.close)
+        scan = store.scan()
+        self.assertEqual(scan["rows"][0][2], "cna.com.tw")
+        self.assertEqual(list(scan["entities"].values()), [("people", "王小明")])
+
+
+class TestHistoryRecording(unittest.TestCase):
+    """分析結果寫入歷史記錄的整合測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.store = HistoryStore(":memory:")
+        self.addCleanup(self.store.close)
+        self.analyzer = Mock(model_name="claude-test", last_heuristic=None, last_cascade=None,
+                             last_analysis_cached=False, last_duplicate=None,
+                             last_fetch_timings={"total": 800.0})
+
+    def test_records_model_and_timings(self):
+        """測試記錄實際使用的模型、網址與抓取及分析耗時"""
+        self.analyzer.last_cascade = {"model": "claude-haiku", "escalated": False}
+        with patch('app.get_history_store', return_value=self.store):
+            app.record_history(self.analyzer, "內容", make_analysis("摘要"),
+                               "https://example.com/1", 1.5)
+
+        record = self.store.query()[0][0]
+        self.assertEqual(record["model"], "claude-haiku")
+        self.assertEqual(record["url"], "https://example.com/1")
+        self.assertEqual(record["timings"], {"analysis_ms": 1500, "fetch": {"total": 800.0}})
+
+    def test_rules_result_labelled(self):
+        """測試規則判定的結果以 rules 標記模型"""
+        self.analyzer.last_heuristic = {"kind": "debunk"}
+        with patch('app.get_history_store', return_value=self.store):
+            app.record_history(self.analyzer, "內容", make_analysis("摘要"), None, 0.01)
+
+        record = self.store.query()[0][0]
+        self.assertEqual(record["model"], "rules")
+        self.assertNotIn("fetch", record["timings"])
+
+    def test_reused_results_not_recorded(self):
+        """測試重用快取或近似重複文章的結果不重複寫入"""
+        for reuse in [{"last_analysis_cached": True},
+                      {"last_duplicate": {"similarity": 0.9, "source": None}}]:
+            with self.subTest(reuse=reuse), \
+                    patch('app.get_history_store', return_value=self.store), \
+                    patch.multiple(self.analyzer, **reuse):
+                app.record_history(self.analyzer, "內容", make_analysis("摘要"), None, 0.01)
+
+        self.assertEqual(len(self.store), 0)
+
+    def test_write_failure_ignored(self):
+        """測試寫入失敗不影響分析結果顯示"""
+        failing = Mock()
+        failing.record.side_effect = RuntimeError("disk full")
+        with patch('app.get_history_store', return_value=failing), patch('builtins.print'):
+            app.record_history(self.analyzer, "內容", make_analysis("摘要"), None, 0.01)
+
+
+class TestHistoryView(unittest.TestCase):
+    """歷史記錄頁面測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.store = HistoryStore(":memory:")
+        self.addCleanup(self.store.close)
+        self.st = MagicMock()
+        self.st.session_state = {}
+        self.st.text_input.return_value = ""
+        self.st.selectbox.side_effect = lambda label, options, **kwargs: options[0]
+        self.st.columns.side_effect = lambda count: [MagicMock() for _ in range(count)]
+        self.st.slider.return_value = (0, 100)
+
+    def display(self):
+        self.st.expander.reset_mock()
+        with patch('app.st', self.st), patch('app.get_history_store', return_value=self.store):
+            app.display_history()
+        return [call.args[0] for call in self.st.expander.call_args_list]
+
+    def test_new_records_shown_after_rerun(self):
+        """測試沒有改變篩選條件時，新寫入的記錄在 rerun 後出現"""
+        self.store.record("a", make_analysis("第一篇"))
+        self.assertEqual(len(self.display()), 1)
+        with patch.object(self.store, 'query', wraps=self.store.query) as query:
+            self.display()
+        query.assert_not_called()
+
+        self.store.record("b", make_analysis("第二篇"))
+        titles = self.display()
+        self.assertEqual(len(titles), 2)
+        self.assertIn("第二篇", titles[0])
+
+    def test_store_failure_shows_notice(self):
+        """測試歷史資料庫無法開啟（例如不支援 FTS5）時顯示提示而非中斷頁面"""
+        with patch('app.st', self.st), patch('builtins.print'), \
+                patch('app.get_history_store', side_effect=sqlite3.OperationalError(
+                    "no such module: fts5")):
+            app.display_history()
+
+        self.st.warning.assert_called_once()
+        self.st.text_input.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,162 @@
+import unittest
+import asyncio
+import sys
+import os
+from unittest.mock import patch, AsyncMock
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from news_analyzer import NewsAnalyzer, ARTICLE_SELECTORS
+from http_fetcher import canonical_url, extract_article
+
+
+SERVER_RENDERED_HTML = """
+<html>
+<head><title>新聞標題</title><script>window.dataLayer = [];</script></head>
+<body>
+  <nav class="menu">首頁 政治 社會</nav>
+  <article>
+    <h1>立法院三讀通過法案</h1>
+    <p>立法院今日三讀通過重要法案，預計將影響全國五百萬勞工權益。</p>
+    <p>勞動部長表示，新法將於明年一月一日正式實施。<br>相關配套同步上路。</p>
+    <script>trackArticleView();</script>
+  </article>
+</body>
+</html>
+"""
+
+CLIENT_RENDERED_HTML = """
+<html>
+<head><title>新聞</title></head>
+<body>
+  <noscript>請啟用 JavaScript 以瀏覽本網站</noscript>
+  <div id="__next"></div>
+  <script src="/static/app.js"></script>
+</body>
+</html>
+"""
+
+
+class TestStaticExtraction(unittest.TestCase):
+    """靜態 HTML 文章擷取測試"""
+
+    def test_extracts_article_text(self):
+        """測試從伺服器端渲染的 HTML 擷取文章內容"""
+        result = extract_article(SERVER_RENDERED_HTML, ARTICLE_SELECTORS, 20)
+
+        self.assertEqual(result["selector"], "article")
+        self.assertIn("立法院今日三讀通過重要法案", result["text"])
+        self.assertIn("相關配套同步上路", result["text"])
+        self.assertNotIn("trackArticleView", result["text"])
+        self.assertNotIn("首頁", result["text"])
+        self.assertFalse(result["client_rendered"])
+
+    def test_block_elements_become_lines(self):
+        """測試區塊元素與換行標籤轉為換行"""
+        result = extract_article(SERVER_RENDERED_HTML, ["article"], 20)
+        lines = result["text"].split("\n")
+
+        self.assertEqual(lines[0], "立法院三讀通過法案")
+        self.assertIn("相關配套同步上路。", lines)
+
+    def test_class_and_id_selectors(self):
+        """測試 class 與 id 選擇器"""
+        html = (
+            '<div class="main article-content">內文段落</div>'
+            '<div id="article">另一段內文</div>'
+        )
+        result = extract_article(html, [".article-content", "#article"], 2)
+
+        self.assertEqual(result["selector"], ".article-content")
+        self.assertEqual(result["text"], "內文段落")
+
+    def test_detects_client_rendered_page(self):
+        """測試偵測前端渲染頁面"""
+        result = extract_article(CLIENT_RENDERED_HTML, ARTICLE_SELECTORS, 200)
+
+        self.assertEqual(result["text"], "")
+        self.assertTrue(result["client_rendered"])
+
+
+class TestCanonicalUrl(unittest.TestCase):
+    """網址正規化測試"""
+
+    def test_tracking_params_and_fragment_removed(self):
+        """測試移除追蹤參數與片段"""
+        self.assertEqual(
+            canonical_url("https://news.example.com/a?utm_source=fb&fbclid=x&id=3#top"),
+            "https://news.example.com/a?id=3",
+        )
+
+    def test_host_scheme_and_port_normalized(self):
+        """測試主機、scheme 與預設連接埠正規化"""
+        self.assertEqual(
+            canonical_url("HTTPS://News.Example.COM:443/a/"),
+            "https://news.example.com/a",
+        )
+
+    def test_query_params_sorted(self):
+        """測試查詢參數排序"""
+        self.assertEqual(
+            canonical_url("https://example.com/a?b=2&a=1"),
+            canonical_url("https://example.com/a?a=1&b=2"),
+        )
+
+
+class TestHttpFirstFetch(unittest.TestCase):
+    """HTTP 優先抓取流程測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", fetch_cache=False)
+        self.url = "https://news.example.com/a.html"
+
+    def fetch(self, static_result, browser_content="瀏覽器抓取的內容。" * 40):
+        pool = AsyncMock()
+        pool.run.return_value = ("article", browser_content, {})
+        with patch('news_analyzer.fetch_static_article', return_value=static_result), \
+                patch('news_analyzer.get_browser_pool', return_value=pool):
+            content = asyncio.run(self.analyzer.fetch_article_content(self.url))
+        return content, pool
+
+    def static_result(self, text, client_rendered=False):
+        return {"status": 200, "text": text, "selector": "article",
+                "client_rendered": client_rendered, "etag": None,
+                "last_modified": None}
+
+    def test_http_tier_serves_long_content(self):
+        """測試靜態內容足夠時不啟動瀏覽器"""
+        content, pool = self.fetch(self.static_result("伺服器端渲染內容。" * 40))
+
+        self.assertIn("伺服器端渲染內容", content)
+        self.assertEqual(self.analyzer.last_fetch_tier, "http")
+        pool.run.assert_not_called()
+
+    def test_short_content_escalates_to_browser(self):
+        """測試靜態內容不足時升級到瀏覽器"""
+        content, pool = self.fetch(self.static_result("太短"))
+
+        self.assertIn("瀏覽器抓取的內容", content)
+        self.assertEqual(self.analyzer.last_fetch_tier, "browser")
+        pool.run.assert_called_once()
+
+    def test_client_rendered_escalates_to_browser(self):
+        """測試前端渲染頁面升級到瀏覽器"""
+        content, pool = self.fetch(
+            self.static_result("預載的摘要內容。" * 40, client_rendered=True)
+        )
+
+        self.assertEqual(self.analyzer.last_fetch_tier, "browser")
+        pool.run.assert_called_once()
+
+    def test_http_stage_timing_recorded(self):
+        """測試記錄 HTTP 階段耗時"""
+        self.fetch(self.static_result("伺服器端渲染內容。" * 40))
+
+        self.assertIn("http", self.analyzer.last_fetch_timings)
+        self.assertIn("total", self.analyzer.last_fetch_timings)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -8,7 +8,7 @@ from unittest.mock import patch, Mock, AsyncMock
 # 添加專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import NewsAnalyzer
+from news_analyzer import NewsAnalyzer
 
 
 class TestIntegration(unittest.TestCase):
@@ -156,8 +156,8 @@ class TestIntegration(unittest.TestCase):
                 elif entity_type == "datasets":
                     self.assertIn("data.gov.tw", entity["search_link"])
 
-    @patch('app.async_playwright')
-    async def test_web_scraping_error_handling(self, mock_playwright):
+    @patch('news_analyzer.get_browser_pool')
+    async def test_web_scraping_error_handling(self, mock_get_pool):
         """測試網頁抓取錯誤處理整合"""
         # 測試各種錯誤情況
         error_scenarios = [
@@ -167,7 +167,7 @@ class TestIntegration(unittest.TestCase):
         ]
         
         for error in error_scenarios:
-            mock_playwright.side_effect = error
+            mock_get_pool.return_value.run = AsyncMock(side_effect=error)
             
             result = await self.analyzer.fetch_article_content("https://error.com")
             
@@ -188,7 +188,7 @@ class TestIntegration(unittest.TestCase):
 
     def test_api_rate_limiting_handling(self):
         """測試 API 速率限制處理"""
-        with patch.object(self.analyzer.client.messages, 'create') as mock_create:
+        with patch.object(self.analyzer.async_client.messages, 'create') as mock_create:
             # 模擬 API 速率限制錯誤
             mock_create.side_effect = Exception("Rate limit exceeded")
             
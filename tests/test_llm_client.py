@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import json
+import threading
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_batch_server import FakeBatchServer
+from llm_client import AsyncClientPool
+from metrics import MetricsRegistry
+from news_analyzer import NewsAnalyzer
+
+
+class TestAsyncClientPool(unittest.TestCase):
+    """共用非同步客戶端測試"""
+
+    def setUp(self):
+        """設定測試環境：使用全新的指標彙整，其他測試的耗時樣本不會啟用對沖而多開連線"""
+        self.pool = AsyncClientPool(max_connections=4, keepalive_connections=8)
+        self.addCleanup(self.pool.close)
+        patcher = patch('metrics._registry', MetricsRegistry(path=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_client_reused_per_key(self):
+        """測試相同 API Key 共用客戶端，不同 Key 分開"""
+        first = self.pool.get("key-a")
+        self.assertIs(self.pool.get("key-a"), first)
+        self.assertIsNot(self.pool.get("key-b"), first)
+        self.assertIsNot(self.pool.get("key-a", base_url="http://127.0.0.1:1"), first)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["clients"], 3)
+        self.assertEqual(stats["reused"], 1)
+
+    def test_connection_limits(self):
+        """測試連線上限設定，閒置連線數不超過最大連線數"""
+        self.assertEqual(self.pool.limits.max_connections, 4)
+        self.assertEqual(self.pool.limits.max_keepalive_connections, 4)
+
+    def test_analyses_share_connection(self):
+        """測試每次建立新的分析器仍重用同一條 keep-alive 連線"""
+        with FakeBatchServer() as server:
+            with patch('news_analyzer.get_async_client',
+                       lambda api_key: self.pool.get(api_key, base_url=server.base_url)), \
+                    patch('builtins.print'):
+                results = [NewsAnalyzer("test_api_key", cache_analysis=False)
+                           .analyze_news(f"第 {i} 則新聞") for i in range(3)]
+
+        self.assertEqual([result["summary"] for result in results],
+                         ["第 0 則新聞", "第 1 則新聞", "第 2 則新聞"])
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(self.pool.stats()["created"], 1)
+
+
+class TestSyncWrapper(unittest.TestCase):
+    """同步包裝測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        patcher = patch('metrics._registry', MetricsRegistry(path=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_progress_delivered_on_calling_thread(self):
+        """測試串流進度在呼叫端執行緒中回報"""
+        text = json.dumps({"summary": "摘要", "target_audience": "勞工", "truthfulness": 80,
+                           "importance": 70, "impact": 60,
+                           "drink_recommendation": {"name": "金桔檸檬", "reason": "可信",
+                                                    "category": "golden_lemon"}},
+                          ensure_ascii=False)
+
+        class Stream:
+            async def _text(self):
+                for i in range(0, len(text), 8):
+                    yield text[i:i + 8]
+
+            async def get_final_message(self):
+                return Mock(usage=None)
+
+        @asynccontextmanager
+        async def stream(**kwargs):
+            result = Stream()
+            result.text_stream = result._text()
+            yield result
+
+        analyzer = NewsAnalyzer("test_api_key", cache_analysis=False)
+        analyzer.async_client = AsyncMock()
+        analyzer.async_client.messages.stream = Mock(side_effect=stream)
+        threads = set()
+
+        with patch('builtins.print'):
+            analysis = analyzer.analyze_news(
+                "新聞內容", on_progress=lambda fields, partial: threads.add(
+                    threading.get_ident()))
+
+        self.assertEqual(analysis["summary"], "摘要")
+        self.assertEqual(threads, {threading.get_ident()})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
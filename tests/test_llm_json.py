@@ -0,0 +1,346 @@
+import unittest
+import sys
+import os
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, Mock, MagicMock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from news_analyzer import NewsAnalyzer
+from llm_json import (
+    IncrementalJSONParser, decode_partial_string, extract_json_object,
+    parse_llm_json, parse_stats, validate_fields
+)
+
+
+ANALYSIS = {
+    "summary": "立法院三讀通過\"勞基法\"修正案，\n明年一月一日起實施。",
+    "target_audience": "勞工、雇主",
+    "truthfulness": 88,
+    "importance": 80,
+    "impact": 75,
+    "drink_recommendation": {"name": "金桔檸檬", "reason": "官方來源 {已證實}",
+                             "category": "golden_lemon"},
+    "entities": {"locations": [{"name": "台北市"}], "dates": []},
+}
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIncrementalJSONParser(unittest.TestCase):
+    """增量 JSON 解析測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.text = "以下是分析結果：\n" + json.dumps(ANALYSIS, ensure_ascii=False, indent=2)
+
+    def test_fields_complete_in_order(self):
+        """測試欄位依序完成且結果與整段解析相同"""
+        parser = IncrementalJSONParser()
+        completed = []
+        for chunk in chunks(self.text, 7):
+            completed += parser.feed(chunk)
+
+        self.assertEqual(completed, list(ANALYSIS))
+        self.assertEqual(parser.fields, ANALYSIS)
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.errors, {})
+
+    def test_field_available_before_document_ends(self):
+        """測試欄位結束後立即可用，不需等整份 JSON"""
+        end = self.text.index('"drink_recommendation"')
+        parser = IncrementalJSONParser()
+        parser.feed(self.text[:end])
+
+        self.assertEqual(parser.fields["impact"], 75)
+        self.assertNotIn("drink_recommendation", parser.fields)
+        self.assertFalse(parser.done)
+
+    def test_partial_string_field(self):
+        """測試取得輸出中的字串欄位內容"""
+        start = self.text.index("三讀")
+        parser = IncrementalJSONParser()
+        parser.feed(self.text[:start + 4])
+
+        key, partial = parser.partial_field
+        self.assertEqual(key, "summary")
+        self.assertEqual(partial, "立法院三讀通過")
+
+    def test_no_partial_inside_nested_values(self):
+        """測試巢狀物件內的字串不視為輸出中的欄位"""
+        start = self.text.index("官方來源")
+        parser = IncrementalJSONParser()
+        parser.feed(self.text[:start + 2])
+
+        self.assertIsNone(parser.partial_field)
+
+    def test_invalid_field_recorded(self):
+        """測試無法解析的欄位記錄錯誤且不影響其他欄位"""
+        parser = IncrementalJSONParser()
+        parser.feed('{"truthfulness": 八十, "importance": 60}')
+
+        self.assertEqual(parser.fields, {"importance": 60})
+        self.assertIn("truthfulness", parser.errors)
+
+    def test_decode_partial_escapes(self):
+        """測試略過結尾不完整的跳脫序列"""
+        self.assertEqual(decode_partial_string('換行\\'), "換行")
+        self.assertEqual(decode_partial_string('字元\\u00'), "字元")
+        self.assertEqual(decode_partial_string('引號\\"'), '引號"')
+        self.assertEqual(decode_partial_string('反斜線\\\\'), "反斜線\\")
+
+
+class TestExtractJSONObject(unittest.TestCase):
+    """括號配對 JSON 擷取與截斷修復測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.text = json.dumps(ANALYSIS, ensure_ascii=False)
+
+    def test_trailing_prose_with_braces(self):
+        """測試物件之後的說明文字含有大括號"""
+        value, repaired = extract_json_object(
+            "分析如下：" + self.text + "\n註：分數範圍為 {0-100}。")
+
+        self.assertEqual(value, ANALYSIS)
+        self.assertFalse(repaired)
+
+    def test_invalid_braces_before_object(self):
+        """測試物件之前不是 JSON 的大括號會被略過"""
+        value, _ = extract_json_object("格式為 {欄位: 值}：\n" + self.text)
+
+        self.assertEqual(value, ANALYSIS)
+
+    def test_truncated_inside_string(self):
+        """測試在字串中截斷時退回最後一個完整的值"""
+        cut = self.text.index("台北市") + 1
+        value, repaired = extract_json_object(self.text[:cut])
+
+        self.assertTrue(repaired)
+        self.assertEqual(value["drink_recommendation"], ANALYSIS["drink_recommendation"])
+        self.assertNotIn("entities", value)
+
+    def test_truncated_after_key(self):
+        """測試在欄位名稱之後截斷時捨棄沒有值的欄位"""
+        cut = self.text.index('"entities"') + len('"entities":')
+        value, repaired = extract_json_object(self.text[:cut])
+
+        self.assertTrue(repaired)
+        self.assertNotIn("entities", value)
+        self.assertEqual(value["impact"], 75)
+
+    def test_truncated_number_dropped(self):
+        """測試截斷在數字中間時不採用可能不完整的數字"""
+        cut = self.text.index('"impact": 75') + len('"impact": 7')
+        value, _ = extract_json_object(self.text[:cut])
+
+        self.assertNotIn("impact", value)
+
+    def test_no_json(self):
+        """測試沒有 JSON 物件"""
+        self.assertEqual(extract_json_object("抱歉，我無法分析這篇新聞。"), (None, False))
+        self.assertEqual(extract_json_object('{"summary"'), (None, False))
+
+    def test_validate_fields(self):
+        """測試 schema 驗證"""
+        schema = {"summary": str, "truthfulness": (int, float),
+                  "drink_recommendation": {"category": str}}
+
+        self.assertEqual(validate_fields(ANALYSIS, schema), [])
+        problems = validate_fields(
+            {"summary": "摘要", "truthfulness": "高", "drink_recommendation": {}}, schema)
+        self.assertEqual(problems, ["truthfulness 型別錯誤",
+                                    "缺少 drink_recommendation.category"])
+
+    def test_parse_failures_recorded(self):
+        """測試解析失敗的統計與細節"""
+        before = parse_stats()
+        with patch('builtins.print'):
+            result = parse_llm_json('{"summary": "摘要"}', {"summary": str, "impact": int})
+            parse_llm_json("沒有 JSON", {"summary": str})
+        after = parse_stats()
+
+        self.assertIsNone(result["value"])
+        self.assertEqual(result["problems"], ["缺少 impact"])
+        self.assertEqual(after.get("invalid", 0), before.get("invalid", 0) + 1)
+        self.assertEqual(after.get("no_json", 0), before.get("no_json", 0) + 1)
+        self.assertEqual(after["recent_failures"][-1]["outcome"], "no_json")
+
+
+class FakeStream:
+    def __init__(self, parts):
+        self.text_stream = self._text(parts)
+
+    @staticmethod
+    async def _text(parts):
+        for part in parts:
+            yield part
+
+    async def get_final_message(self):
+        return Mock(usage=Mock(input_tokens=120, cache_read_input_tokens=1500,
+                               cache_creation_input_tokens=0, output_tokens=600))
+
+
+class TestStreamingAnalysis(unittest.TestCase):
+    """串流分析測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False)
+        self.text = json.dumps(ANALYSIS, ensure_ascii=False)
+
+        @asynccontextmanager
+        async def stream(**kwargs):
+            yield FakeStream(chunks(self.text, 5))
+
+        self.analyzer.async_client = AsyncMock()
+        self.analyzer.async_client.messages.stream = Mock(side_effect=stream)
+
+    def test_progress_reported_while_streaming(self):
+        """測試串流中回報已完成欄位與逐字摘要"""
+        snapshots = []
+        analysis = self.analyzer.analyze_news(
+            "新聞內容", on_progress=lambda fields, partial: snapshots.append(
+                (list(fields), partial)))
+
+        self.assertEqual(analysis, ANALYSIS)
+        self.analyzer.async_client.messages.create.assert_not_called()
+        self.assertEqual(self.analyzer.last_usage["cache_read_input_tokens"], 1500)
+
+        partial_summaries = [partial[1] for _, partial in snapshots
+                             if partial and partial[0] == "summary"]
+        self.assertGreater(len(partial_summaries), 2)
+        self.assertTrue(ANALYSIS["summary"].startswith(partial_summaries[-1]))
+
+        first_drink = next(i for i, (fields, _) in enumerate(snapshots)
+                           if "drink_recommendation" in fields)
+        self.assertNotIn("entities", snapshots[first_drink][0])
+
+    def test_non_streaming_without_callback(self):
+        """測試未提供 callback 時使用一般 API"""
+        self.analyzer.async_client.messages.create.return_value = Mock(content=[Mock(text=self.text)])
+
+        self.assertEqual(self.analyzer.analyze_news("新聞內容"), ANALYSIS)
+        self.analyzer.async_client.messages.stream.assert_not_called()
+
+    def test_truncated_response_repaired(self):
+        """測試截斷的回應修復後仍可使用"""
+        cut = self.text.index('"entities"') + 20
+        self.analyzer.async_client.messages.create.return_value = Mock(
+            content=[Mock(text=self.text[:cut])])
+
+        analysis = self.analyzer.analyze_news("新聞內容")
+
+        self.assertNotIn("error", analysis)
+        self.assertEqual(analysis["drink_recommendation"], ANALYSIS["drink_recommendation"])
+
+    def test_missing_required_field(self):
+        """測試缺少必要欄位時回傳錯誤"""
+        incomplete = dict(ANALYSIS)
+        del incomplete["truthfulness"]
+        self.analyzer.async_client.messages.create.return_value = Mock(
+            content=[Mock(text=json.dumps(incomplete, ensure_ascii=False))])
+
+        with patch('builtins.print'):
+            result = self.analyzer.analyze_news("新聞內容")
+
+        self.assertIn("無法解析分析結果", result["error"])
+        self.assertIn("truthfulness", result["error"])
+
+    def test_retry_restarts_progress(self):
+        """測試串流中斷後重試時先通知重新開始，後續欄位只來自新的回應"""
+        retried = dict(ANALYSIS, summary="重試後的摘要。")
+        error = Exception("overloaded")
+        error.status_code = 529
+        error.response = Mock(headers={"retry-after-ms": "10"})
+        texts = [self.text[:self.text.index('"impact"')], json.dumps(retried, ensure_ascii=False)]
+
+        @asynccontextmanager
+        async def stream(**kwargs):
+            text = texts.pop(0)
+
+            async def broken(parts):
+                for part in parts:
+                    yield part
+                if texts:
+                    raise error
+
+            fake = FakeStream([])
+            fake.text_stream = broken(chunks(text, 5))
+            yield fake
+
+        self.analyzer.async_client.messages.stream.side_effect = stream
+        snapshots = []
+        analysis = self.analyzer.analyze_news(
+            "新聞內容", on_progress=lambda fields, partial: snapshots.append((fields, partial)))
+
+        self.assertEqual(analysis, retried)
+        self.assertEqual(self.analyzer.last_call["retries"], 1)
+        restarts = [i for i, (fields, partial) in enumerate(snapshots)
+                    if not fields and partial is None]
+        self.assertEqual(len(restarts), 2)
+        self.assertIn("summary", snapshots[restarts[1] - 1][0])
+        after = [fields for fields, _ in snapshots[restarts[1]:]]
+        self.assertTrue(all(fields.get("summary", retried["summary"]) == retried["summary"]
+                            for fields in after))
+
+    def test_stream_error(self):
+        """測試串流失敗時回傳錯誤"""
+        self.analyzer.async_client.messages.stream.side_effect = Exception("連線中斷")
+
+        result = self.analyzer.analyze_news("新聞內容", on_progress=lambda *args: None)
+
+        self.assertIn("連線中斷", result["error"])
+
+
+class TestProgressiveRendering(unittest.TestCase):
+    """分析結果漸進顯示測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.slots = {key: MagicMock() for key in
+                      ("drink", "summary", "target_audience", "scores")}
+
+    def test_partial_summary_then_final(self):
+        """測試摘要先逐字顯示，完成後換成完整內容"""
+        rendered = app.render_analysis_fields(self.slots, {}, ("summary", "立法院"))
+        self.slots["summary"].markdown.assert_called_with("立法院▌")
+
+        app.render_analysis_fields(self.slots, {"summary": "立法院三讀"}, None, rendered)
+        self.slots["summary"].write.assert_called_once_with("立法院三讀")
+
+    def test_reset_allows_fields_from_new_attempt(self):
+        """測試重試重新開始後清除已顯示的欄位，新回應的欄位會再次顯示"""
+        rendered = app.render_analysis_fields(self.slots, {"summary": "第一次的摘要"})
+
+        app.reset_analysis_fields(self.slots, rendered)
+        app.render_analysis_fields(self.slots, {"summary": "重試後的摘要"}, None, rendered)
+
+        self.slots["summary"].empty.assert_called_once()
+        self.assertEqual(self.slots["summary"].write.call_args_list[-1].args[0], "重試後的摘要")
+        self.assertEqual(rendered, {"summary"})
+
+    def test_scores_wait_for_all_fields(self):
+        """測試三項分數都到齊才顯示評分"""
+        with patch('app.display_scores') as mock_scores, \
+                patch('app.display_drink_result') as mock_drink:
+            rendered = app.render_analysis_fields(
+                self.slots, {"truthfulness": 88, "importance": 80})
+            mock_scores.assert_not_called()
+
+            fields = {"truthfulness": 88, "importance": 80, "impact": 75,
+                      "drink_recommendation": ANALYSIS["drink_recommendation"]}
+            app.render_analysis_fields(self.slots, fields, None, rendered)
+            app.render_analysis_fields(self.slots, fields, None, rendered)
+
+        mock_scores.assert_called_once()
+        mock_drink.assert_called_once_with(ANALYSIS["drink_recommendation"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,240 @@
+import unittest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from fake_batch_server import default_responder
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_retry import (
+    DeadlineExceeded, backoff_delay, call_with_deadline, hedge_threshold, hedged,
+    is_retryable, retry_after,
+)
+from metrics import MetricsRegistry
+from news_analyzer import NewsAnalyzer
+
+
+class FakeStatusError(Exception):
+    """帶狀態碼與回應標頭的 API 錯誤替身"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """重試策略測試"""
+
+    def setUp(self):
+        """設定測試環境：使用全新的指標彙整，其他測試留下的耗時樣本不影響對沖門檻"""
+        self.metrics = MetricsRegistry(path=None)
+        patcher = patch('metrics._registry', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sleeps = []
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+    def test_retryable_errors(self):
+        """測試 429、5xx 與 overloaded 可重試，其他 4xx 不重試"""
+        for status in (429, 500, 503, 529):
+            self.assertTrue(is_retryable(FakeStatusError(status)))
+        for status in (400, 401, 404):
+            self.assertFalse(is_retryable(FakeStatusError(status)))
+        self.assertFalse(is_retryable(ValueError("bad")))
+
+    def test_retry_after_header(self):
+        """測試依 retry-after-ms 或 retry-after 標頭等待"""
+        self.assertEqual(retry_after(FakeStatusError(429, {"retry-after-ms": "1500"})), 1.5)
+        self.assertEqual(retry_after(FakeStatusError(429, {"retry-after": "2"})), 2.0)
+        self.assertIsNone(retry_after(FakeStatusError(429)))
+        self.assertEqual(backoff_delay(3, FakeStatusError(429, {"retry-after": "2"})), 2.0)
+
+    def test_backoff_jitter_is_capped(self):
+        """測試沒有 retry-after 時為有上限的隨機退避"""
+        self.assertEqual(backoff_delay(0, rand=lambda: 1.0), 0.5)
+        self.assertEqual(backoff_delay(2, rand=lambda: 0.5), 1.0)
+        self.assertEqual(backoff_delay(10, rand=lambda: 1.0), 8.0)
+
+    def test_retries_until_success(self):
+        """測試暫時錯誤依 retry-after 等待後重試成功"""
+        attempt = AsyncMock(side_effect=[FakeStatusError(529, {"retry-after": "1"}), "ok"])
+        with patch('builtins.print'):
+            result, info = run(call_with_deadline(attempt, deadline=10, sleep=self.sleep))
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(info["retries"], 1)
+        self.assertEqual(info["winner"], "primary")
+        self.assertEqual(self.sleeps, [1.0])
+
+    def test_non_retryable_raises_immediately(self):
+        """測試不可重試的錯誤直接拋出"""
+        attempt = AsyncMock(side_effect=FakeStatusError(400))
+        with self.assertRaises(FakeStatusError):
+            run(call_with_deadline(attempt, deadline=10, sleep=self.sleep))
+        self.assertEqual(attempt.await_count, 1)
+
+    def test_wait_beyond_deadline_gives_up(self):
+        """測試 retry-after 超過剩餘期限時不等待直接放棄"""
+        attempt = AsyncMock(side_effect=FakeStatusError(429, {"retry-after": "30"}))
+        with self.assertRaises(FakeStatusError):
+            run(call_with_deadline(attempt, deadline=5, sleep=self.sleep))
+        self.assertEqual(self.sleeps, [])
+
+    def test_attempts_bounded(self):
+        """測試嘗試次數用盡後拋出最後的錯誤"""
+        attempt = AsyncMock(side_effect=FakeStatusError(500))
+        with patch('builtins.print'), self.assertRaises(FakeStatusError):
+            run(call_with_deadline(attempt, deadline=10, max_attempts=3, sleep=self.sleep,
+                                   rand=lambda: 0))
+        self.assertEqual(attempt.await_count, 3)
+
+    def test_deadline_cancels_slow_attempt(self):
+        """測試單次嘗試超過期限時取消並拋出 DeadlineExceeded"""
+        cancelled = []
+
+        async def attempt(timeout):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with self.assertRaises(DeadlineExceeded):
+            run(call_with_deadline(attempt, deadline=0.05))
+        self.assertEqual(cancelled, [True])
+
+    def test_attempt_receives_remaining_time(self):
+        """測試每次嘗試收到的逾時不超過剩餘期限"""
+        timeouts = []
+
+        async def attempt(timeout):
+            timeouts.append(timeout)
+            return "ok"
+
+        run(call_with_deadline(attempt, deadline=3))
+        self.assertLessEqual(timeouts[0], 3)
+
+
+class TestHedgedRequests(unittest.TestCase):
+    """對沖請求測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.metrics = MetricsRegistry(path=None)
+        patcher = patch('metrics._registry', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hedge_wins_and_primary_cancelled(self):
+        """測試主要請求過慢時對沖請求勝出，主要請求被取消"""
+        calls = []
+        cancelled = []
+
+        async def attempt(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append("primary")
+                    raise
+            return f"attempt {len(calls)}"
+
+        result, winner, hedge_sent = run(hedged(attempt, timeout=2, hedge_after=0.02))
+
+        self.assertEqual(result, "attempt 2")
+        self.assertEqual(winner, "hedge")
+        self.assertTrue(hedge_sent)
+        self.assertEqual(cancelled, ["primary"])
+
+    def test_no_hedge_when_primary_fast(self):
+        """測試主要請求在門檻內完成時不送出對沖請求"""
+        attempt = AsyncMock(return_value="ok")
+        result, winner, hedge_sent = run(hedged(attempt, timeout=2, hedge_after=0.5))
+
+        self.assertEqual((result, winner, hedge_sent), ("ok", "primary", False))
+        self.assertEqual(attempt.await_count, 1)
+
+    def test_hedge_threshold_setting(self):
+        """測試對沖門檻：固定秒數、停用，以及樣本足夠後採用 p95"""
+        self.assertEqual(hedge_threshold("model", "1.5"), 1.5)
+        self.assertIsNone(hedge_threshold("model", "off"))
+        self.assertIsNone(hedge_threshold("model", "p95"))
+        for i in range(100):
+            self.metrics.observe("claude_attempt", (i + 1) / 100, model="model")
+        self.assertAlmostEqual(hedge_threshold("model", "p95"), 0.95, places=1)
+        self.assertIsNone(hedge_threshold("other", "p95"))
+
+    def test_call_info_records_hedge(self):
+        """測試呼叫資訊記錄對沖與勝出者，只有完成的嘗試計入耗時"""
+        calls = []
+
+        async def attempt(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                await asyncio.sleep(5)
+            return "ok"
+
+        result, info = run(call_with_deadline(attempt, deadline=2, hedge_after=0.02,
+                                              labels={"model": "model"}))
+
+        self.assertEqual(info, {"retries": 0, "hedged": True, "winner": "hedge"})
+        attempts = [entry for entry in self.metrics.snapshot()["stages"]
+                    if entry["stage"] == "claude_attempt"]
+        self.assertEqual([entry["count"] for entry in attempts], [1])
+
+
+class TestAnalyzerDeadline(unittest.TestCase):
+    """NewsAnalyzer 的期限與重試整合測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        patcher = patch('metrics._registry', MetricsRegistry(path=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False, deadline=5,
+                                     hedge_after="off")
+        self.analyzer.async_client = AsyncMock()
+        self.response = Mock()
+        text = default_responder({"messages": [{"role": "user", "content": "測試摘要"}]})
+        self.response.content = [Mock(text=text)]
+        self.response.usage = None
+
+    def test_overloaded_then_success(self):
+        """測試 overloaded 錯誤後重試成功，重試次數記錄於 last_call"""
+        self.analyzer.async_client.messages.create.side_effect = [
+            FakeStatusError(529, {"retry-after": "0"}), self.response]
+        with patch('builtins.print'):
+            result = self.analyzer.analyze_news("測試新聞內容")
+
+        self.assertEqual(result["summary"], "測試摘要")
+        self.assertEqual(self.analyzer.last_call["retries"], 1)
+        _, kwargs = self.analyzer.async_client.messages.create.call_args
+        self.assertLessEqual(kwargs["timeout"], 5)
+
+    def test_deadline_exceeded_reported(self):
+        """測試超過分析期限時回傳錯誤而非無限等待"""
+        self.analyzer.deadline = 0.05
+
+        async def slow(**kwargs):
+            await asyncio.sleep(5)
+
+        self.analyzer.async_client.messages.create.side_effect = slow
+        result = self.analyzer.analyze_news("測試新聞內容")
+
+        self.assertIn("超過 0.05 秒分析期限", result["error"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,214 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geocoder
+from news_analyzer import NewsAnalyzer, record_fetch_metrics
+from cache_store import SQLiteCache
+from gazetteer import Gazetteer
+from metrics import MetricsRegistry, estimate_cost, percentile
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """指標彙整測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.metrics = MetricsRegistry(path="")
+
+    def test_percentiles(self):
+        """測試分位數計算"""
+        for ms in range(1, 101):
+            self.metrics.observe("analyze", ms / 1000)
+
+        entry = self.metrics.snapshot()["stages"][0]
+        self.assertEqual(entry["count"], 100)
+        self.assertAlmostEqual(entry["p50"], 0.050)
+        self.assertAlmostEqual(entry["p95"], 0.095)
+        self.assertAlmostEqual(entry["p99"], 0.099)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_labels_are_separate_series(self):
+        """測試不同標籤分開統計"""
+        self.metrics.observe("fetch", 0.1, tier="http")
+        self.metrics.observe("fetch", 2.0, tier="browser")
+
+        stages = self.metrics.snapshot()["stages"]
+        self.assertEqual([entry["labels"]["tier"] for entry in stages], ["browser", "http"])
+
+    def test_span_records_errors(self):
+        """測試計時區塊在例外時記為錯誤並重新拋出"""
+        with self.assertRaises(RuntimeError):
+            with self.metrics.span("nominatim"):
+                raise RuntimeError("逾時")
+        with self.metrics.span("nominatim"):
+            pass
+
+        entry = self.metrics.snapshot()["stages"][0]
+        self.assertEqual(entry["count"], 2)
+        self.assertEqual(entry["errors"], 1)
+
+    def test_usage_and_cost(self):
+        """測試 token 用量與費用累計"""
+        usage = {"input_tokens": 1000, "output_tokens": 500,
+                 "cache_creation_input_tokens": 0, "cache_read_input_tokens": 2000}
+        self.metrics.record_usage("claude-sonnet-4-20250514", usage)
+        self.metrics.record_usage("claude-sonnet-4-20250514", usage)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["tokens"]["claude-sonnet-4-20250514"]["input_tokens"], 2000)
+        self.assertAlmostEqual(snapshot["cost_usd"]["claude-sonnet-4-20250514"],
+                               2 * (1000 * 3 + 500 * 15 + 2000 * 0.3) / 1_000_000)
+        self.assertAlmostEqual(estimate_cost("claude-sonnet-4-20250514", usage, batch=True),
+                               (1000 * 3 + 500 * 15 + 2000 * 0.3) / 1_000_000 / 2)
+        self.assertIsNone(estimate_cost("unknown-model", usage))
+
+    def test_prometheus_format(self):
+        """測試 Prometheus 文字格式"""
+        self.metrics.observe("fetch", 0.25, tier="http")
+        self.metrics.record_usage("claude-sonnet-4-20250514", {"output_tokens": 10})
+
+        text = self.metrics.render_prometheus()
+
+        self.assertIn("# TYPE news_analyzer_stage_seconds summary", text)
+        self.assertIn('news_analyzer_stage_seconds{quantile="0.95",stage="fetch",tier="http"} '
+                      '0.250000', text)
+        self.assertIn('news_analyzer_stage_seconds_count{stage="fetch",tier="http"} 1', text)
+        self.assertIn('news_analyzer_tokens_total{model="claude-sonnet-4-20250514",'
+                      'type="output_tokens"} 10', text)
+        self.assertTrue(text.endswith("\n"))
+
+    def test_label_values_escaped(self):
+        """測試標籤值跳脫"""
+        self.metrics.observe("fetch", 0.1, tier='a"b')
+
+        self.assertIn('tier="a\\"b"', self.metrics.render_prometheus())
+
+    def test_metrics_file_write_is_throttled(self):
+        """測試指標檔依間隔寫入"""
+        now = [0.0]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.prom")
+            metrics = MetricsRegistry(path=path, write_interval=10, clock=lambda: now[0])
+
+            metrics.observe("analyze", 1.0)
+            metrics.observe("analyze", 2.0)
+            with open(path, encoding="utf-8") as f:
+                first = f.read()
+            now[0] = 11
+            metrics.observe("analyze", 3.0)
+            with open(path, encoding="utf-8") as f:
+                second = f.read()
+
+        self.assertIn('news_analyzer_stage_seconds_count{stage="analyze"} 1', first)
+        self.assertIn('news_analyzer_stage_seconds_count{stage="analyze"} 3', second)
+
+
+    def test_concurrent_writers_use_separate_temp_files(self):
+        """測試多個寫入端同時寫同一個指標檔時各自使用暫存檔，不留下殘檔"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics.prom")
+            writers = [MetricsRegistry(path=None) for _ in range(4)]
+            for index, metrics in enumerate(writers):
+                metrics.observe("analyze", float(index))
+            temp_paths = []
+            real_open = open
+            # 讓所有寫入端同時開啟暫存檔
+            barrier = threading.Barrier(len(writers), timeout=5)
+
+            def tracking_open(file, *args, **kwargs):
+                temp_paths.append(file)
+                barrier.wait()
+                return real_open(file, *args, **kwargs)
+
+            with patch('builtins.open', side_effect=tracking_open):
+                threads = [threading.Thread(target=metrics.write, args=(path,))
+                           for metrics in writers]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            self.assertEqual(len(set(temp_paths)), len(writers))
+            self.assertEqual(os.listdir(tmpdir), ["metrics.prom"])
+            with open(path, encoding="utf-8") as f:
+                self.assertIn('news_analyzer_stage_seconds_count{stage="analyze"} 1', f.read())
+
+
+class TestStageInstrumentation(unittest.TestCase):
+    """各階段埋點測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.metrics = MetricsRegistry(path="")
+        for target in ('news_analyzer.get_metrics', 'geocoder.get_metrics'):
+            patcher = patch(target, return_value=self.metrics)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stages(self):
+        return {(entry["stage"], tuple(sorted(entry["labels"].items()))): entry
+                for entry in self.metrics.snapshot()["stages"]}
+
+    def test_analyze_span_and_usage(self):
+        """測試分析呼叫的耗時與 token 用量"""
+        analyzer = NewsAnalyzer("test_api_key", cache_analysis=False)
+        analyzer.async_client = AsyncMock()
+        analyzer.async_client.messages.create.return_value = Mock(
+            content=[Mock(text="{}")],
+            usage=Mock(input_tokens=100, output_tokens=50,
+                       cache_creation_input_tokens=0, cache_read_input_tokens=1500))
+
+        with patch('builtins.print'):
+            analyzer.analyze_news("新聞內容")
+
+        stages = self.stages()
+        key = ("analyze", (("mode", "create"), ("model", analyzer.model_name)))
+        self.assertEqual(stages[key]["count"], 1)
+        tokens = self.metrics.snapshot()["tokens"][analyzer.model_name]
+        self.assertEqual(tokens["cache_read_input_tokens"], 1500)
+
+    def test_fetch_stage_breakdown(self):
+        """測試抓取總耗時與各階段耗時"""
+        record_fetch_metrics({"cache": 2.0, "http": 180.0, "total": 190.0,
+                              "blocked_requests": 3}, "http")
+
+        stages = self.stages()
+        self.assertAlmostEqual(stages[("fetch", (("tier", "http"),))]["p50"], 0.19)
+        self.assertIn(("fetch.http", (("tier", "http"),)), stages)
+        self.assertNotIn("blocked_requests", str(stages))
+
+    def test_geocode_source_recorded(self):
+        """測試地點查詢依來源記錄耗時"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = SQLiteCache(os.path.join(tmpdir, "geocode.sqlite3"))
+            scheduler = geocoder.NominatimScheduler(
+                rate=100, lookup=lambda name: ("https://www.openstreetmap.org/way/1", "found"))
+            with patch('geocoder.get_geocode_cache', return_value=cache), \
+                    patch('geocoder.get_gazetteer',
+                          return_value=Gazetteer([("台北市", "relation", 301)])):
+                scheduler.submit("台北市").result(5)
+                scheduler.submit("立法院").result(5)
+                scheduler.submit("立法院").result(5)
+            cache.close()
+
+        # 完成回呼在工作執行緒中執行，可能稍晚於 result() 返回
+        deadline = time.monotonic() + 2
+        while len(self.stages()) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stages = self.stages()
+        self.assertEqual(stages[("geocode", (("source", "gazetteer"),))]["count"], 1)
+        self.assertEqual(stages[("geocode", (("source", "nominatim"),))]["count"], 1)
+        self.assertEqual(stages[("geocode", (("source", "cache"),))]["count"], 1)
+        self.assertEqual(stages[("nominatim", ())]["count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,169 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import AsyncMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from near_duplicates import (
+    NUM_PERM, NearDuplicateIndex, band_keys, minhash_signature, normalize_text, similarity,
+)
+from news_analyzer import NewsAnalyzer
+
+
+WIRE_STORY = (
+    "中央社記者王小明台北1日電，行政院今天召開記者會宣布，明年起將調整基本工資，"
+    "月薪調升至新台幣二萬八千元，時薪調升至一百八十三元，預計將有超過二百萬名勞工受惠。"
+    "勞動部表示，此次調整考量物價指數與經濟成長率，並參考勞資雙方意見，"
+    "希望兼顧勞工生活與企業經營。勞動部長指出，基本工資審議委員會已連續三年調升基本工資，"
+    "未來也將持續檢討相關制度，並研議基本工資法的立法進度。"
+)
+# 轉載時的小幅改寫：換字、刪減與加上編輯署名
+REPRINT = (WIRE_STORY.replace("今天", "今日").replace("預計將有", "估計")
+           + "（編輯：李大華）")
+OTHER_STORY = (
+    "台北市政府今日宣布，明年起公車票價將從十五元調整為二十元，市府表示此舉是為了反映燃料成本上漲，"
+    "同時將擴大敬老卡補助範圍，讓長者搭乘更便利，議員則質疑調漲幅度過大，要求市府提出完整的財務評估報告，"
+    "並在議會專案報告後再決定是否實施。"
+)
+
+
+class TestMinHash(unittest.TestCase):
+    """MinHash 簽章測試"""
+
+    def test_signature_is_deterministic(self):
+        """測試相同文字的簽章相同，可跨行程比較"""
+        signature = minhash_signature(WIRE_STORY)
+        self.assertEqual(len(signature), NUM_PERM)
+        self.assertTrue((signature == minhash_signature(WIRE_STORY)).all())
+
+    def test_normalization_ignores_punctuation_and_width(self):
+        """測試標點、空白與全半形差異不影響簽章"""
+        self.assertEqual(normalize_text("ＡＢＣ， 台北！"), "abc台北")
+        variant = WIRE_STORY.replace("，", ",").replace("。", " . ")
+        self.assertEqual(similarity(minhash_signature(WIRE_STORY), minhash_signature(variant)), 1.0)
+
+    def test_similarity_separates_reprints(self):
+        """測試轉載的相似度高，不同新聞的相似度低"""
+        original = minhash_signature(WIRE_STORY)
+        self.assertGreater(similarity(original, minhash_signature(REPRINT)), 0.75)
+        self.assertLess(similarity(original, minhash_signature(OTHER_STORY)), 0.2)
+
+    def test_short_text_not_indexed(self):
+        """測試過短的文字沒有簽章"""
+        self.assertIsNone(minhash_signature("網傳消息"))
+
+    def test_reprint_shares_bucket(self):
+        """測試轉載與原文至少落在一個相同的 LSH 桶"""
+        original = set(band_keys(minhash_signature(WIRE_STORY)))
+        self.assertTrue(original & set(band_keys(minhash_signature(REPRINT))))
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    """近似重複索引測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "dedupe.sqlite3")
+        self.index = NearDuplicateIndex(self.path, threshold=0.75)
+        self.addCleanup(self.index.close)
+
+    def test_reprint_found_with_source(self):
+        """測試轉載找到原文的分析結果與來源"""
+        self.index.add(WIRE_STORY, {"summary": "基本工資調整"}, source="https://cna.example/1")
+
+        match = self.index.find(REPRINT)
+
+        self.assertEqual(match["analysis"], {"summary": "基本工資調整"})
+        self.assertEqual(match["source"], "https://cna.example/1")
+        self.assertGreater(match["similarity"], 0.75)
+        self.assertIsNone(self.index.find(OTHER_STORY))
+
+    def test_variants_isolated(self):
+        """測試不同模型或提示詞版本的結果不互相重用"""
+        self.index.add(WIRE_STORY, {"summary": "舊版"}, variant="model|v1")
+        self.assertIsNone(self.index.find(REPRINT, variant="model|v2"))
+        self.assertIsNotNone(self.index.find(REPRINT, variant="model|v1"))
+
+    def test_best_match_returned(self):
+        """測試多個候選時返回最相似的文章"""
+        self.index.add(REPRINT, {"summary": "轉載"})
+        self.index.add(WIRE_STORY, {"summary": "原文"})
+
+        self.assertEqual(self.index.find(WIRE_STORY)["analysis"], {"summary": "原文"})
+
+    def test_persisted_across_instances(self):
+        """測試索引寫入磁碟，重新開啟後仍可查詢"""
+        self.index.add(WIRE_STORY, {"summary": "基本工資調整"})
+        self.index.close()
+
+        reopened = NearDuplicateIndex(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), 1)
+        self.assertIsNotNone(reopened.find(REPRINT))
+
+    def test_stats(self):
+        """測試統計命中率"""
+        self.index.add(WIRE_STORY, {"summary": "x"})
+        self.index.find(REPRINT)
+        self.index.find(OTHER_STORY)
+
+        stats = self.index.stats()
+        self.assertEqual((stats["documents"], stats["hits"], stats["misses"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+
+class TestAnalyzerDeduplication(unittest.TestCase):
+    """NewsAnalyzer 近似重複整合測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.index = NearDuplicateIndex(":memory:")
+        self.addCleanup(self.index.close)
+        patcher = patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_analyzer(self):
+        analyzer = NewsAnalyzer("test_api_key", cache_analysis=False, dedupe=True,
+                                hedge_after="off")
+        analyzer.duplicate_index = self.index
+        analyzer.async_client = AsyncMock()
+        analyzer.async_client.messages.create.return_value = Mock(content=[Mock(text=json.dumps({
+            "summary": "基本工資調整", "target_audience": "勞工",
+            "truthfulness": 90, "importance": 85, "impact": 80,
+            "drink_recommendation": {"name": "金桔檸檬", "reason": "官方消息",
+                                     "category": "golden_lemon"},
+        }, ensure_ascii=False))], usage=None)
+        return analyzer
+
+    def test_reprint_reuses_analysis(self):
+        """測試轉載文章不再呼叫 Claude，結果標記原文來源"""
+        first = self.make_analyzer()
+        original = first.analyze_news(WIRE_STORY, source="https://cna.example/1")
+        second = self.make_analyzer()
+        reused = second.analyze_news(REPRINT, source="https://other.example/2")
+
+        second.async_client.messages.create.assert_not_called()
+        self.assertEqual(reused["summary"], original["summary"])
+        self.assertEqual(reused["duplicate_of"]["source"], "https://cna.example/1")
+        self.assertEqual(second.last_duplicate, reused["duplicate_of"])
+
+    def test_bypass_cache_reanalyzes(self):
+        """測試略過快取時重新分析"""
+        self.make_analyzer().analyze_news(WIRE_STORY)
+        analyzer = self.make_analyzer()
+        result = analyzer.analyze_news(REPRINT, bypass_cache=True)
+
+        analyzer.async_client.messages.create.assert_called_once()
+        self.assertNotIn("duplicate_of", result)
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,193 @@
+import unittest
+import sys
+import os
+from unittest.mock import AsyncMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from news_analyzer import NewsAnalyzer
+from preprocess import estimate_tokens, fit_to_budget, preprocess_article
+
+
+FETCHED_ARTICLE = """
+首頁 政治 社會 國際 財經
+立法院三讀通過勞基法修正案
+
+立法院今日三讀通過勞動基準法修正案，預計將影響全國五百萬勞工權益。
+勞動部長表示：「新法將於明年一月一日正式實施。」
+分享
+立法院今日三讀通過勞動基準法修正案，預計將影響全國五百萬勞工權益。
+延伸閱讀
+勞團抗議加班費計算
+雇主團體回應新制
+© 2025 新聞網 版權所有 不得轉載
+"""
+
+
+class TestPreprocessArticle(unittest.TestCase):
+    """文章前處理測試"""
+
+    def test_boilerplate_and_duplicates_removed(self):
+        """測試移除選單、分享按鈕、延伸閱讀、版權宣告與重複段落"""
+        result = preprocess_article(FETCHED_ARTICLE, token_budget=0)
+
+        self.assertEqual(result["text"].split("\n"), [
+            "立法院三讀通過勞基法修正案",
+            "立法院今日三讀通過勞動基準法修正案，預計將影響全國五百萬勞工權益。",
+            "勞動部長表示：「新法將於明年一月一日正式實施。」",
+        ])
+        self.assertEqual(result["removed_lines"], 6)
+        self.assertEqual(result["duplicate_paragraphs"], 1)
+        self.assertFalse(result["truncated"])
+        self.assertLess(result["tokens_after"], result["tokens_before"])
+
+    def test_prose_about_copyright_kept(self):
+        """測試報導著作權議題的內文不被誤刪"""
+        text = ("智慧財產局今日說明，未經授權重製他人著作可能觸法，"
+                "並提醒民眾注意網路轉載的著作權風險，相關修法草案將於下月送交立法院審議。")
+
+        self.assertEqual(preprocess_article(text)["text"], text)
+
+    def test_related_section_ends_at_prose(self):
+        """測試延伸閱讀清單在下一段內文處結束"""
+        text = ("導言段落。\n相關新聞：\n標題一\n標題二\n"
+                "記者會上，官員補充說明了新制度的細節與後續的配套措施，並回答媒體提問。")
+
+        lines = preprocess_article(text)["text"].split("\n")
+
+        self.assertEqual(lines[0], "導言段落。")
+        self.assertIn("記者會上", lines[1])
+        self.assertEqual(len(lines), 2)
+
+    def test_datelines_and_bylines_kept(self):
+        """測試日期與記者署名不被當成導覽選單，真正的選單仍移除"""
+        text = ("2024/05/01 12:30\n記者 王小明 / 台北報導\n首頁 政治 社會 國際\n"
+                "行政院今天宣布調整基本工資。")
+
+        lines = preprocess_article(text)["text"].split("\n")
+
+        self.assertEqual(lines, ["2024/05/01 12:30", "記者 王小明 / 台北報導",
+                                 "行政院今天宣布調整基本工資。"])
+
+    def test_estimate_tokens(self):
+        """測試 token 估算"""
+        self.assertEqual(estimate_tokens("立法院"), 3)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens(""), 0)
+
+
+class TestTokenBudget(unittest.TestCase):
+    """token 預算裁切測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.paragraphs = [
+            "導言第一段說明事件經過。",
+            "導言第二段補充背景。",
+            "一般段落甲，內容為背景資料與統計數字。",
+            "部長表示：「政策將如期上路。」",
+            "一般段落乙，內容為其他單位的回應。",
+        ]
+
+    def test_lede_and_quotes_kept_first(self):
+        """測試預算不足時優先保留導言與引述，並維持原順序"""
+        budget = sum(estimate_tokens(p) + 1 for p in
+                     (self.paragraphs[0], self.paragraphs[1], self.paragraphs[3]))
+
+        kept, truncated = fit_to_budget(self.paragraphs, budget)
+
+        self.assertTrue(truncated)
+        self.assertEqual(kept, [self.paragraphs[0], self.paragraphs[1], self.paragraphs[3]])
+
+    def test_within_budget_unchanged(self):
+        """測試未超過預算時不裁切"""
+        kept, truncated = fit_to_budget(self.paragraphs, 10000)
+
+        self.assertEqual(kept, self.paragraphs)
+        self.assertFalse(truncated)
+
+    def test_oversized_lede_cut_at_sentence(self):
+        """測試導言段落本身超過預算時截斷保留，而不是被其他段落取代"""
+        paragraphs = ["第一句話。第二句話。第三句話。第四句話。", "簡短段落。"]
+
+        kept, truncated = fit_to_budget(paragraphs, 12)
+
+        self.assertTrue(truncated)
+        self.assertEqual(kept, ["第一句話。第二句話。"])
+
+    def test_long_single_paragraph_cut_at_sentence(self):
+        """測試單一段落超過預算時以句子為單位截斷"""
+        result = preprocess_article("第一句話。第二句話。第三句話。", token_budget=12)
+
+        self.assertEqual(result["text"], "第一句話。第二句話。")
+        self.assertTrue(result["truncated"])
+        self.assertLessEqual(result["tokens_after"], 12)
+
+    def test_english_paragraph_cut_at_period(self):
+        """測試英文段落以句點為句子邊界截斷"""
+        text = "The cabinet approved the bill. " * 40
+
+        result = preprocess_article(text, token_budget=20)
+
+        self.assertTrue(result["text"].endswith("bill."))
+        self.assertLessEqual(result["tokens_after"], 20)
+
+    def test_oversized_unpunctuated_paragraph_cut_by_characters(self):
+        """測試沒有任何句子邊界的超長段落以字元截斷，結果不為空且不超過預算"""
+        for text in ["lorem ipsum dolor sit amet consectetur " * 1000, "沒有標點的長句" * 2000]:
+            with self.subTest(text=text[:10]):
+                result = preprocess_article(text, token_budget=100)
+
+                self.assertTrue(result["text"])
+                self.assertTrue(result["truncated"])
+                self.assertLessEqual(estimate_tokens(result["text"]), 100)
+                self.assertGreater(result["tokens_after"], 90)
+
+
+class TestAnalyzerPreprocessing(unittest.TestCase):
+    """分析前處理整合測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False)
+        self.analyzer.async_client = AsyncMock()
+        self.analyzer.async_client.messages.create.return_value = Mock(content=[Mock(text="{}")])
+
+    def sent_article(self):
+        return self.analyzer.async_client.messages.create.call_args.kwargs["messages"][0]["content"]
+
+    def test_cleaned_article_sent(self):
+        """測試送出的是前處理後的文章並記錄前後 token 數"""
+        with patch('builtins.print'):
+            self.analyzer.analyze_news(FETCHED_ARTICLE)
+
+        self.assertNotIn("版權所有", self.sent_article())
+        self.assertNotIn("延伸閱讀", self.sent_article())
+        report = self.analyzer.last_preprocess
+        self.assertLess(report["tokens_after"], report["tokens_before"])
+
+    def test_oversized_article_never_sent_whole(self):
+        """測試超過預算的英文文章送出裁切後的內容，而不是原文"""
+        article = ("Officials said the measure would take effect next year "
+                   "according to the ministry " * 800)
+        self.analyzer.token_budget = 500
+        with patch('builtins.print'):
+            self.analyzer.analyze_news(article)
+
+        self.assertLess(len(self.sent_article()), len(article) // 10)
+        self.assertGreater(self.analyzer.last_preprocess["tokens_after"], 0)
+        self.assertLessEqual(self.analyzer.last_preprocess["tokens_after"], 500)
+
+    def test_preprocess_disabled(self):
+        """測試關閉前處理時原文送出"""
+        self.analyzer.preprocess = False
+        with patch('builtins.print'):
+            self.analyzer.analyze_news(FETCHED_ARTICLE)
+
+        self.assertIn("版權所有", self.sent_article())
+        self.assertIsNone(self.analyzer.last_preprocess)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,161 @@
+import unittest
+import sys
+import os
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rumor_rules
+from llm_json import validate_fields
+from news_analyzer import ANALYSIS_SCHEMA, NewsAnalyzer
+from rumor_rules import KeywordMatcher, RumorClassifier
+
+
+DEBUNK_ARTICLE = "網傳喝熱水可以殺死病毒，衛福部今日澄清此為假訊息，呼籲民眾勿轉傳。"
+RUMOR_ARTICLE = "網傳某知名藝人即將復出，據說已與新公司簽約，但消息未經證實。"
+POLICY_ARTICLE = "立法院今日三讀通過勞動基準法修正案，勞動部表示將於下月公告施行細則。"
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """Aho–Corasick 多模式比對測試"""
+
+    def test_overlapping_patterns(self):
+        """測試重疊與互為後綴的關鍵字都會找到"""
+        matcher = KeywordMatcher(["he", "she", "his", "hers"])
+        self.assertEqual(sorted(matcher.finditer("ushers")),
+                         [(1, "she"), (2, "he"), (2, "hers")])
+
+    def test_chinese_patterns(self):
+        """測試中文關鍵字與失敗連結"""
+        matcher = KeywordMatcher(["闢謠", "已闢謠", "謠言"])
+        found = sorted(matcher.finditer("官方已闢謠這則謠言"))
+        self.assertEqual(found, [(2, "已闢謠"), (3, "闢謠"), (7, "謠言")])
+
+    def test_no_match(self):
+        """測試沒有命中時不返回任何結果"""
+        self.assertEqual(list(KeywordMatcher(["網傳"]).finditer("今日天氣晴朗")), [])
+
+
+class TestRumorClassifier(unittest.TestCase):
+    """規則預分類測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.classifier = RumorClassifier(min_confidence=0.8)
+        patcher = patch('rumor_rules._rule_counts', rumor_rules.Counter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_debunk_wins_over_rumor(self):
+        """測試「網傳……是假訊息」判定為闢謠"""
+        kind, confidence, matched = self.classifier.classify(DEBUNK_ARTICLE)
+
+        self.assertEqual(kind, "debunk")
+        self.assertGreater(confidence, 0.8)
+        self.assertIn("網傳", matched)
+
+    def test_rumor_detected(self):
+        """測試多個傳言線索判定為傳言"""
+        kind, confidence, _ = self.classifier.classify(RUMOR_ARTICLE)
+
+        self.assertEqual(kind, "rumor")
+        self.assertGreater(confidence, 0.8)
+
+    def test_official_sources_reduce_rumor_confidence(self):
+        """測試正式來源的線索降低傳言判定的信心"""
+        _, plain, _ = self.classifier.classify("網傳將調漲油價，據說下週實施")
+        _, official, _ = self.classifier.classify("網傳將調漲油價，據說下週實施，中油記者會將說明統計數據")
+        self.assertLess(official, plain)
+
+    def test_contained_keyword_not_double_counted(self):
+        """測試「已闢謠」不另計其中的「闢謠」"""
+        scores, matched = self.classifier.score("此消息已闢謠")
+        self.assertEqual(matched, ["已闢謠"])
+        self.assertEqual(scores["debunk"], 2.0)
+
+    def test_width_and_case_normalized(self):
+        """測試全形與大小寫不影響比對"""
+        _, matched = self.classifier.score("ＭｙＧｏＰｅｎ 查核")
+        self.assertIn("mygopen", matched)
+
+    def test_ordinary_news_not_classified(self):
+        """測試一般新聞不產生暫定結果"""
+        self.assertIsNone(self.classifier.provisional_analysis(POLICY_ARTICLE))
+        self.assertEqual(rumor_rules.rule_stats()["match_rate"], 0.0)
+
+    def test_quoted_debunk_not_classified(self):
+        """測試一般新聞引述機關「已闢謠」只有單一線索，不直接判定"""
+        article = "疾管署今日公布新一季疫苗接種計畫，並表示先前網路流傳的說法已闢謠。"
+        kind, confidence, _ = self.classifier.classify(article)
+
+        self.assertEqual(kind, "debunk")
+        self.assertGreater(confidence, 0.8)
+        self.assertIsNone(self.classifier.provisional_analysis(article))
+
+    def test_provisional_analysis_matches_schema(self):
+        """測試暫定結果與 Claude 分析結果格式相同並標記為規則判定"""
+        result = self.classifier.provisional_analysis(DEBUNK_ARTICLE)
+
+        self.assertEqual(validate_fields(result, ANALYSIS_SCHEMA), [])
+        self.assertEqual(result["drink_recommendation"]["category"], "expired_milk")
+        self.assertEqual(result["heuristic"]["kind"], "debunk")
+        self.assertIn("暫定", result["drink_recommendation"]["reason"])
+
+
+class TestPreClassification(unittest.TestCase):
+    """NewsAnalyzer 規則預分類整合測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        for patcher in (patch('rumor_rules._rule_counts', rumor_rules.Counter()),
+                        patch('builtins.print')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.analyzer = NewsAnalyzer("test_api_key", cache_analysis=False, pre_classify=True,
+                                     hedge_after="off")
+        self.analyzer.async_client = AsyncMock()
+        self.create = self.analyzer.async_client.messages.create
+
+    def claude_reply(self, category):
+        return Mock(content=[Mock(text=json.dumps({
+            "summary": "摘要", "target_audience": "讀者",
+            "truthfulness": 15, "importance": 80, "impact": 70,
+            "drink_recommendation": {"name": "飲料", "reason": "理由", "category": category},
+        }, ensure_ascii=False))], usage=None)
+
+    def test_clear_case_skips_api(self):
+        """測試明確的闢謠文章不呼叫 Claude"""
+        result = self.analyzer.analyze_news(DEBUNK_ARTICLE)
+
+        self.assertEqual(result["heuristic"]["kind"], "debunk")
+        self.assertEqual(self.analyzer.last_heuristic, result["heuristic"])
+        self.create.assert_not_called()
+        self.assertIsNone(self.analyzer.pending_confirmation)
+
+    def test_unclear_case_uses_claude(self):
+        """測試沒有明確線索時照常呼叫 Claude"""
+        self.create.return_value = self.claude_reply("golden_lemon")
+        result = self.analyzer.analyze_news(POLICY_ARTICLE)
+
+        self.assertNotIn("heuristic", result)
+        self.assertIsNone(self.analyzer.last_heuristic)
+        self.create.assert_called_once()
+
+    def test_background_confirmation(self):
+        """測試背景以 Claude 確認並記錄分類是否一致"""
+        self.analyzer.confirm_heuristic = True
+        self.create.return_value = self.claude_reply("expired_milk")
+
+        result = self.analyzer.analyze_news(DEBUNK_ARTICLE)
+        confirmed = self.analyzer.pending_confirmation.result(timeout=5)
+
+        self.assertIn("heuristic", result)
+        self.assertEqual(confirmed["drink_recommendation"]["category"], "expired_milk")
+        stats = rumor_rules.rule_stats()
+        self.assertEqual((stats["confirmed"], stats["agreement_rate"]), (1, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
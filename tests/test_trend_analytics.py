@@ -0,0 +1,204 @@
+import unittest
+import sys
+import os
+import time
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# 添加專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from history_store import HistoryStore
+from trend_analytics import (
+    CATEGORIES, MANUAL_DOMAIN, TrendData, co_occurrence, daily_trends, domain_summary,
+    entity_summary, group_aggregate, load_trend_data, rolling_sum,
+)
+
+DAY = 86400
+
+
+def make_analysis(category, truthfulness, people=(), organizations=()):
+    return {
+        "summary": "摘要", "target_audience": "讀者",
+        "truthfulness": truthfulness, "importance": 50, "impact": 40,
+        "drink_recommendation": {"name": "飲料", "reason": "理由", "category": category},
+        "entities": {"people": [{"name": name} for name in people],
+                     "organizations": [{"name": name} for name in organizations]},
+    }
+
+
+class TestTrendAggregation(unittest.TestCase):
+    """向量化彙總測試"""
+
+    def setUp(self):
+        """設定測試環境：三天的記錄，第二天沒有資料"""
+        self.data = TrendData(
+            created_at=[0, 3600, 2 * DAY, 2 * DAY + 60],
+            category=[0, 3, 3, -1],
+            scores=[[90, 80, 70], [10, 60, np.nan], [20, 40, 30], [40, 20, 10]],
+            domain=[0, 1, 1, 0], domains=["cna.com.tw", MANUAL_DOMAIN],
+            mention_rows=[0, 0, 1, 2, 3], mention_entities=[0, 1, 0, 0, 2],
+            entity_kinds=["people", "organizations", "people"],
+            entity_names=["王小明", "勞動部", "李大華"],
+            utc_offset=0,
+        )
+
+    def test_group_aggregate_ignores_missing_scores(self):
+        """測試分組平均略過缺值，飲料分類分佈不計未知分類"""
+        groups = group_aggregate(np.array([0, 0, 1, 1]), self.data.scores, self.data.category, 2)
+
+        self.assertEqual(groups["count"].tolist(), [2, 2])
+        self.assertEqual(groups["mean"][0].tolist(), [50, 70, 70])
+        self.assertEqual(groups["mix"].tolist(), [[1, 0, 0, 1], [0, 0, 0, 1]])
+
+    def test_rolling_sum(self):
+        """測試滑動總和，開頭不足視窗長度時取現有部分"""
+        self.assertEqual(rolling_sum([1, 2, 3, 4], 2).tolist(), [1, 3, 5, 7])
+        self.assertEqual(rolling_sum([[1, 1], [2, 0]], 5).tolist(), [[1, 1], [3, 1]])
+
+    def test_daily_trends_fill_gaps(self):
+        """測試每日序列包含沒有記錄的日子，滑動平均依篇數加權"""
+        daily = daily_trends(self.data, window=3)
+
+        self.assertEqual(daily["dates"], [date(1970, 1, 1), date(1970, 1, 2), date(1970, 1, 3)])
+        self.assertEqual(daily["count"].tolist(), [2, 0, 2])
+        self.assertTrue(np.isnan(daily["mean"][1]).all())
+        self.assertEqual(daily["rolling_mean"][2, 0], (90 + 10 + 20 + 40) / 4)
+        self.assertEqual(daily["mix"][2].tolist(), [0, 0, 0, 1])
+
+    def test_empty_data(self):
+        """測試沒有記錄時返回空序列"""
+        empty = TrendData.from_scan({"rows": [], "mentions": [], "entities": {}})
+        self.assertEqual(daily_trends(empty)["dates"], [])
+        self.assertEqual(domain_summary(empty), [])
+        self.assertEqual(co_occurrence(empty)[0], [])
+
+    def test_domain_summary(self):
+        """測試依網域彙總並依篇數排序"""
+        rows = domain_summary(self.data)
+
+        self.assertEqual([row["name"] for row in rows], ["cna.com.tw", MANUAL_DOMAIN])
+        self.assertEqual(rows[0]["truthfulness"], 65)
+        self.assertEqual(rows[1]["impact"], 30)
+        self.assertEqual(rows[1]["mix"]["expired_milk"], 2)
+
+    def test_entity_summary_by_kind(self):
+        """測試依實體彙總，可只看人物或機構"""
+        people = entity_summary(self.data, kind="people")
+
+        self.assertEqual([(row["name"], row["count"]) for row in people],
+                         [("王小明", 3), ("李大華", 1)])
+        self.assertEqual(people[0]["truthfulness"], 40)
+        self.assertEqual([row["name"] for row in entity_summary(self.data, "organizations")],
+                         ["勞動部"])
+
+    def test_co_occurrence(self):
+        """測試共同出現矩陣，對角線為被提及的篇數"""
+        names, matrix = co_occurrence(self.data, top=2)
+
+        self.assertEqual(names, ["王小明", "勞動部"])
+        self.assertEqual(matrix.tolist(), [[3, 1], [1, 1]])
+
+    def test_year_of_data_under_a_second(self):
+        """測試一年份（每天 500 篇、每篇 5 個實體）的轉換與彙總在一秒內完成"""
+        rng = np.random.default_rng(0)
+        count = 365 * 500
+        scores = rng.integers(0, 101, size=(count, 3)).tolist()
+        rows = [(i + 1, i * DAY / 500, f"site{i % 40}.com" if i % 10 else None,
+                 CATEGORIES[i % 4], *scores[i]) for i in range(count)]
+        entity_ids = rng.integers(0, 2000, size=(count, 5)).tolist()
+        mentions = [(i + 1, entity_id) for i in range(count)
+                    for entity_id in set(entity_ids[i])]
+        scan = {"rows": rows, "mentions": mentions,
+                "entities": {i: ("people" if i % 2 else "organizations", f"實體{i}")
+                             for i in range(2000)}}
+
+        started = time.perf_counter()
+        data = TrendData.from_scan(scan, utc_offset=0)
+        daily_trends(data, window=30)
+        domain_summary(data)
+        entity_summary(data, kind="people")
+        co_occurrence(data)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(data), count)
+
+
+class TestTrendLoading(unittest.TestCase):
+    """從歷史記錄讀取趨勢資料的測試"""
+
+    def setUp(self):
+        """設定測試環境"""
+        self.store = HistoryStore(":memory:")
+        self.addCleanup(self.store.close)
+        self.clock = 1_700_000_000.0
+        patcher = patch('history_store.time.time', side_effect=self.tick)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tick(self):
+        self.clock += DAY
+        return self.clock
+
+    def test_loads_columns_and_mentions(self):
+        """測試分數、分類、網域與實體提及轉成列式陣列"""
+        self.store.record("a", make_analysis("golden_lemon", 90, ["王小明"], ["勞動部"]),
+                          url="https://www.cna.com.tw/news/1")
+        self.store.record("b", make_analysis("expired_milk", 10, ["王小明", "王小明"]))
+        self.store.record("c", make_analysis("unknown", None), url="https://udn.com/2")
+
+        data = load_trend_data(store=self.store)
+
+        self.assertEqual(data.category.tolist(), [0, 3, -1])
+        self.assertTrue(np.isnan(data.scores[2, 0]))
+        self.assertEqual(data.domains[data.domain].tolist(),
+                         ["cna.com.tw", MANUAL_DOMAIN, "udn.com"])
+        self.assertEqual([row["name"] for row in entity_summary(data)], ["王小明", "勞動部"])
+        self.assertEqual(entity_summary(data)[0]["count"], 2)
+
+    def test_time_range(self):
+        """測試只讀取時間範圍內的記錄與其實體"""
+        self.store.record("a", make_analysis("golden_lemon", 90, ["舊人物"]))
+        since = self.clock + 1
+        self.store.record("b", make_analysis("plain_water", 50, ["新人物"]))
+
+        data = load_trend_data(since=since, store=self.store)
+
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data.entity_names.tolist(), ["新人物"])
+
+    def test_rule_results_excluded(self):
+        """測試規則判定的記錄與其實體提及預設不列入趨勢"""
+        self.store.record("a", make_analysis("golden_lemon", 90, ["王小明"]), model="claude")
+        self.store.record("b", make_analysis("expired_milk", 15, ["李大華"]), model="rules")
+
+        data = load_trend_data(store=self.store)
+        self.assertEqual(data.category.tolist(), [0])
+        self.assertEqual(data.entity_names.tolist(), ["王小明"])
+        self.assertEqual(len(self.store.scan(include_rules=True)["rows"]), 2)
+
+    def test_view_reloads_only_on_new_records(self):
+        """測試趨勢頁籤在 rerun 時沿用已讀出的資料，有新記錄才重新讀取"""
+        st = MagicMock()
+        st.session_state = {}
+        st.selectbox.side_effect = lambda label, options, **kwargs: options[1]
+        st.columns.side_effect = lambda count: [MagicMock() for _ in range(count)]
+        st.slider.return_value = 7
+        self.store.record("a", make_analysis("golden_lemon", 90, ["王小明"]))
+
+        with patch('app.st', st), patch('app.get_history_store', return_value=self.store), \
+                patch('app.load_trend_data', wraps=load_trend_data) as load:
+            app.display_trends()
+            app.display_trends()
+            self.assertEqual(load.call_count, 1)
+            self.store.record("b", make_analysis("plain_water", 50))
+            app.display_trends()
+            self.assertEqual(load.call_count, 2)
+
+        self.assertEqual(len(st.session_state["trends"]["data"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
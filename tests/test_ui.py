@@ -1,12 +1,16 @@
 import unittest
 import sys
 import os
+import threading
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
 import streamlit as st
 
 # 添加專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import app
+
 
 class TestStreamlitUI(unittest.TestCase):
     """Streamlit UI 組件測試"""
@@ -211,6 +215,77 @@ class TestUIIntegration(unittest.TestCase):
             self.assertTrue(len(feature) > 0)
 
 
+class TestEntityDisplay(unittest.TestCase):
+    """實體區塊漸進顯示測試"""
+
+    ENTITIES = {
+        "locations": [{"name": "台北市"}, {"name": "立法院"}],
+        "organizations": [{"name": "勞動部", "official_link": "https://www.mol.gov.tw"}],
+        "dates": [{"date": "2025-01-01", "event": "新法實施"}],
+    }
+
+    def setUp(self):
+        """設定測試環境"""
+        self.events = []
+        self.futures = {"台北市": Future(), "立法院": Future()}
+
+        def make_placeholder():
+            placeholder = MagicMock()
+            placeholder.markdown.side_effect = (
+                lambda html, **kwargs: self.events.append(("placeholder", html)))
+            return placeholder
+
+        self.st = MagicMock()
+        self.st.empty.side_effect = make_placeholder
+        self.st.subheader.side_effect = lambda title: self.events.append(("subheader", title))
+        self.st.markdown.side_effect = (
+            lambda html, **kwargs: self.events.append(("markdown", html)))
+
+    def resolve(self, location_name):
+        future = self.futures[location_name]
+        if location_name == "立法院":
+            # 模擬排程器稍後才在背景執行緒完成查詢
+            threading.Timer(0.05, future.set_result,
+                            ["https://www.openstreetmap.org/way/202"]).start()
+        else:
+            future.set_result("https://www.openstreetmap.org/relation/301")
+        return future
+
+    def display(self):
+        with patch('app.st', self.st), \
+                patch('app.resolve_location_async', side_effect=self.resolve):
+            app.display_entities(self.ENTITIES)
+
+    def test_all_sections_render_before_links_resolve(self):
+        """測試所有區塊先顯示，地點連結之後才填入"""
+        self.display()
+
+        titles = [title for kind, title in self.events if kind == "subheader"]
+        self.assertEqual(titles, ["📍 相關地點", "🏢 相關機構", "📅 重要時間"])
+
+        placeholder_html = [html for kind, html in self.events if kind == "placeholder"]
+        self.assertIn("openstreetmap.org/search?query=", placeholder_html[0])
+        self.assertIn("openstreetmap.org/search?query=", placeholder_html[1])
+
+        last_section = max(i for i, (kind, _) in enumerate(self.events) if kind != "placeholder")
+        filled = [html for kind, html in self.events[last_section + 1:]]
+        self.assertEqual(len(filled), 2)
+        self.assertTrue(any("relation/301" in html for html in filled))
+        self.assertTrue(any("way/202" in html for html in filled))
+
+    def test_timeout_keeps_search_link(self):
+        """測試查詢逾時時保留搜尋連結"""
+        done, stuck = Future(), Future()
+        done.set_result("https://www.openstreetmap.org/relation/301")
+        placeholders = [MagicMock(), MagicMock()]
+
+        app.fill_location_links({done: [(placeholders[0], "台北市")],
+                                 stuck: [(placeholders[1], "立法院")]}, timeout=0.05)
+
+        self.assertIn("relation/301", placeholders[0].markdown.call_args[0][0])
+        placeholders[1].markdown.assert_not_called()
+
+
 if __name__ == '__main__':
     # 執行 UI 測試
     unittest.main(verbosity=2)
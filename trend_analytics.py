@@ -0,0 +1,225 @@
+"""
+趨勢分析
+
+從歷史記錄讀出分數、飲料分類、網站與實體提及，轉成 NumPy 列式陣列後以向量運算彙總：
+依日期、網站網域或實體（人物、機構）分組的篇數、平均分數與飲料分類分佈，
+每日序列的滑動平均，以及常見實體的共同出現次數。
+分組彙總全部以 np.bincount 完成（組別 × 欄位攤平成一維索引），不逐筆迴圈，
+一年份的記錄也只需數十毫秒。
+"""
+
+import itertools
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from history_store import SCORE_FIELDS, get_history_store
+
+CATEGORIES = ("golden_lemon", "honey_green", "plain_water", "expired_milk")
+
+# 沒有網址（手動貼上內容）的記錄歸在此網域
+MANUAL_DOMAIN = "手動輸入"
+
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01 的序數，日期編號加上此值即為 date.fromordinal 的參數
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def factorize(values, missing=None):
+    """
+    把值依首次出現的順序編成連續整數代碼
+
+    返回 (各值的代碼, 代碼對應的值)，值為 None 時以 missing 代替。
+    """
+    index = {value: code for code, value in enumerate(dict.fromkeys(values))}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values))
+    labels = np.array([missing if value is None else value for value in index], dtype=object)
+    return codes, labels
+
+
+class TrendData:
+    """
+    列式的分析記錄
+
+    每篇記錄一列：created_at、day（本地時區的日期編號）、category（CATEGORIES 的索引，未知為 -1）、
+    scores（n × 3，缺值為 NaN）、domain（網域代碼，對應 domains）。
+    實體提及為兩個等長陣列：mention_rows（記錄列號）與 mention_entities（實體代碼，對應
+    entity_kinds 與 entity_names）。
+    """
+
+    def __init__(self, created_at, category, scores, domain, domains,
+                 mention_rows=None, mention_entities=None, entity_kinds=(), entity_names=(),
+                 utc_offset=None):
+        self.created_at = np.asarray(created_at, dtype=np.float64)
+        self.category = np.asarray(category, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64).reshape(-1, len(SCORE_FIELDS))
+        self.domain = np.asarray(domain, dtype=np.int64)
+        self.domains = np.asarray(domains, dtype=object)
+        self.mention_rows = np.asarray(
+            [] if mention_rows is None else mention_rows, dtype=np.int64)
+        self.mention_entities = np.asarray(
+            [] if mention_entities is None else mention_entities, dtype=np.int64)
+        self.entity_kinds = np.asarray(entity_kinds, dtype=object)
+        self.entity_names = np.asarray(entity_names, dtype=object)
+        offset = time.localtime().tm_gmtoff if utc_offset is None else utc_offset
+        self.day = np.floor_divide(self.created_at + offset, SECONDS_PER_DAY).astype(np.int64)
+
+    def __len__(self):
+        return len(self.created_at)
+
+    @classmethod
+    def from_scan(cls, scan, utc_offset=None):
+        """由 HistoryStore.scan 的結果建立（記錄依 id 排序）"""
+        rows = scan["rows"]
+        if not rows:
+            return cls([], [], np.empty((0, len(SCORE_FIELDS))), [], [], utc_offset=utc_offset)
+        ids, created_at, domains, categories, *scores = zip(*rows)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        categories = np.array(categories, dtype=object)
+        category = np.full(len(ids), -1, dtype=np.int64)
+        for code, name in enumerate(CATEGORIES):
+            category[categories == name] = code
+        # None 轉成 NaN
+        score_matrix = np.array(scores, dtype=np.float64).T
+
+        domain, domain_labels = factorize(domains, MANUAL_DOMAIN)
+
+        mention_rows = mention_entities = None
+        entity_kinds = entity_names = ()
+        if scan["mentions"]:
+            pairs = np.fromiter(itertools.chain.from_iterable(scan["mentions"]), dtype=np.int64,
+                                count=2 * len(scan["mentions"])).reshape(-1, 2)
+            mention_rows = np.searchsorted(ids, pairs[:, 0])
+            unique_ids, mention_entities = np.unique(pairs[:, 1], return_inverse=True)
+            entity_kinds, entity_names = zip(*(scan["entities"][int(entity_id)]
+                                               for entity_id in unique_ids))
+        return cls(created_at, category, score_matrix, domain, domain_labels,
+                   mention_rows, mention_entities, entity_kinds, entity_names,
+                   utc_offset=utc_offset)
+
+
+def load_trend_data(since=None, until=None, store=None):
+    """從歷史記錄讀出時間範圍內的分析結果"""
+    store = get_history_store() if store is None else store
+    return TrendData.from_scan(store.scan(since=since, until=until))
+
+
+def group_aggregate(codes, scores, category, num_groups):
+    """
+    依整數代碼分組彙總
+
+    返回 dict：count（各組篇數）、mean（各組各分數的平均，沒有分數時為 NaN）、
+    mix（各組各飲料分類的篇數，num_groups × len(CATEGORIES)）。
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    fields = scores.shape[1]
+    valid = ~np.isnan(scores)
+    # 組別 × 欄位攤平成一維索引，一次 bincount 算完所有欄位
+    flat = (codes[:, None] * fields + np.arange(fields)).ravel()
+    sums = np.bincount(flat, weights=np.where(valid, scores, 0).ravel(),
+                       minlength=num_groups * fields).reshape(num_groups, fields)
+    scored = np.bincount(flat, weights=valid.ravel(),
+                         minlength=num_groups * fields).reshape(num_groups, fields)
+    known = category >= 0
+    mix = np.bincount(codes[known] * len(CATEGORIES) + category[known],
+                      minlength=num_groups * len(CATEGORIES)).reshape(num_groups, len(CATEGORIES))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / scored
+    return {"count": np.bincount(codes, minlength=num_groups), "sum": sums, "scored": scored,
+            "mean": mean, "mix": mix}
+
+
+def rolling_sum(values, window):
+    """沿第一軸計算長度為 window 的滑動總和（開頭不足 window 時取現有部分）"""
+    values = np.asarray(values, dtype=np.float64)
+    padded = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    return padded[1:] - padded[start]
+
+
+def daily_trends(data, window=7):
+    """
+    每日趨勢：涵蓋第一天到最後一天的連續日期（沒有記錄的日子篇數為 0）
+
+    返回 dict：dates（date 列表）、count、mean（各分數的每日平均）、
+    rolling_mean（最近 window 天所有記錄的平均，依篇數加權）、mix（每日飲料分類篇數）。
+    """
+    if not len(data):
+        empty = np.empty((0, len(SCORE_FIELDS)))
+        return {"dates": [], "count": np.empty(0, dtype=np.int64), "mean": empty,
+                "rolling_mean": empty, "mix": np.empty((0, len(CATEGORIES)), dtype=np.int64)}
+    first = data.day.min()
+    days = int(data.day.max() - first) + 1
+    groups = group_aggregate(data.day - first, data.scores, data.category, days)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling = rolling_sum(groups["sum"], window) / rolling_sum(groups["scored"], window)
+    return {
+        "dates": [date.fromordinal(_EPOCH_ORDINAL + int(first)) + timedelta(days=offset)
+                  for offset in range(days)],
+        "count": groups["count"],
+        "mean": groups["mean"],
+        "rolling_mean": rolling,
+        "mix": groups["mix"],
+    }
+
+
+def _summary_rows(labels, groups, top, kinds=None):
+    """依篇數排序取前 top 組，轉成表格列"""
+    order = np.argsort(-groups["count"], kind="stable")[:top]
+    rows = []
+    for index in order:
+        if not groups["count"][index]:
+            continue
+        row = {"name": labels[index], "count": int(groups["count"][index])}
+        if kinds is not None:
+            row["kind"] = kinds[index]
+        for field, value in zip(SCORE_FIELDS, groups["mean"][index]):
+            row[field] = None if np.isnan(value) else float(value)
+        row["mix"] = dict(zip(CATEGORIES, groups["mix"][index].tolist()))
+        rows.append(row)
+    return rows
+
+
+def domain_summary(data, top=20):
+    """依網站網域彙總，返回篇數最多的 top 個網域"""
+    groups = group_aggregate(data.domain, data.scores, data.category, len(data.domains))
+    return _summary_rows(data.domains, groups, top)
+
+
+def _entity_mask(data, kind):
+    if kind is None:
+        return np.ones(len(data.mention_entities), dtype=bool)
+    return data.entity_kinds[data.mention_entities] == kind
+
+
+def entity_summary(data, kind=None, top=20):
+    """依實體彙總提及該實體的記錄，kind 為 people 或 organizations（None 表示全部）"""
+    mask = _entity_mask(data, kind)
+    rows = data.mention_rows[mask]
+    groups = group_aggregate(data.mention_entities[mask], data.scores[rows],
+                             data.category[rows], len(data.entity_names))
+    return _summary_rows(data.entity_names, groups, top, kinds=data.entity_kinds)
+
+
+def co_occurrence(data, kind=None, top=15):
+    """
+    最常被提及的 top 個實體兩兩出現在同一篇記錄的次數
+
+    返回 (實體名稱列表, top × top 整數矩陣)，對角線為各實體被提及的篇數。
+    """
+    mask = _entity_mask(data, kind)
+    entities = data.mention_entities[mask]
+    counts = np.bincount(entities, minlength=len(data.entity_names))
+    selected = np.argsort(-counts, kind="stable")[:top]
+    selected = selected[counts[selected] > 0]
+    rank = np.full(len(data.entity_names), -1)
+    rank[selected] = np.arange(len(selected))
+    # 記錄 × 實體的出現矩陣，相乘即為共同出現次數
+    keep = rank[entities] >= 0
+    incidence = np.zeros((len(data), len(selected)), dtype=np.float32)
+    incidence[data.mention_rows[mask][keep], rank[entities[keep]]] = 1
+    matrix = (incidence.T @ incidence).astype(np.int64)
+    return data.entity_names[selected].tolist(), matrix